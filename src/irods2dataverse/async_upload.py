@@ -0,0 +1,609 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from irods2dataverse import deposit, from_irods, direct_upload, metrics, mime, progress
+from irods2dataverse.redirect import redirector
+from irods2dataverse.session_pool import SessionPool
+
+# size of the blocks read from iRODS per transfer: smaller than `streams.BLOCK_SIZE` because
+# thousands of transfers can be in flight at the same time
+BLOCK_SIZE = 1024 * 1024
+
+
+def create_client(concurrency=100, timeout=60.0):
+    """Create an async HTTP client for the upload engine.
+
+    Parameters
+    ----------
+    concurrency: int
+      maximum number of open connections
+    timeout: float
+      seconds to wait for a connection, or between two chunks of a request or response
+
+    Returns
+    -------
+    client: httpx.AsyncClient
+    """
+    import httpx
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=concurrency, max_keepalive_connections=concurrency
+        ),
+        timeout=timeout,
+    )
+
+
+@metrics.timed("upload_url")
+async def request_upload(client, BASE_URL, dv_ds_DOI, df_size, header_key):
+    """GET request for direct upload, for single or multipart uploads, see `direct_upload.request_upload()`
+
+    Parameters
+    ----------
+    client: httpx.AsyncClient
+    BASE_URL: str
+      class attribute baseURL
+    dv_ds_DOI: str
+      Dataset Persistent Identifier
+    df_size: int
+      size of iRODS object
+    header_key: dict
+      the token used in direct upload
+
+    Returns
+    -------
+    data: dict
+      'storageIdentifier' and either the 'url' of a single upload, or the 'urls' of the parts
+      and the paths to complete a multipart upload
+    """
+
+    response = await client.get(
+        f"{BASE_URL}/api/datasets/:persistentId/uploadurls",
+        params={"persistentId": dv_ds_DOI, "size": df_size},
+        headers=header_key,
+    )
+    if response.status_code != 200:
+        raise ConnectionError("Something went wrong", response)
+
+    return response.json()["data"]
+
+
+async def get_du_url(client, BASE_URL, dv_ds_DOI, df_size, header_key):
+    """GET request for a single direct upload, see `direct_upload.get_du_url()`
+
+    Parameters
+    ----------
+    client: httpx.AsyncClient
+    BASE_URL: str
+      class attribute baseURL
+    dv_ds_DOI: str
+      Dataset Persistent Identifier
+    df_size: int
+      size of iRODS object
+    header_key: dict
+      the token used in direct upload
+
+    Returns
+    -------
+    fileURL: str
+      Dataverse URL for the iRODS object meant for publication
+    strorageID: str
+      Dataverse storage identified
+    """
+
+    data = await request_upload(client, BASE_URL, dv_ds_DOI, df_size, header_key)
+
+    return data["url"], data["storageIdentifier"]
+
+
+async def read_blocks(
+    obj, executor=None, block_size=None, installation=None, head=None, progress=None
+):
+    """Read an iRODS data object in blocks, without blocking the event loop.
+
+    Parameters
+    ----------
+    obj: iRODSDataObject
+      the object meant for publication
+    executor: concurrent.futures.Executor
+      executor running the blocking iRODS reads, by default the one of the event loop
+    block_size: int
+      size of the blocks, by default `BLOCK_SIZE`
+    installation: str
+      URL of the Dataverse installation, whose budget of throughput the reads count against
+    head: callable
+      called with the first bytes of the object (up to `mime.SNIFF_SIZE`)
+    progress: callable
+      called with the size of each block, e.g. `progress.Transfer.add`
+
+    Yields
+    ------
+    block: bytes
+    """
+    loop = asyncio.get_running_loop()
+    block_size = block_size or BLOCK_SIZE
+    # on the resource server if possible
+    opened = redirector.open(obj, installation=installation)
+    f = await loop.run_in_executor(executor, opened.__enter__)
+    try:
+        while True:
+            block = await loop.run_in_executor(executor, f.read, block_size)
+            if head is not None:
+                head(block[: mime.SNIFF_SIZE])
+                head = None
+            if not block:
+                break
+            if progress is not None:
+                progress(len(block))
+            yield block
+    finally:
+        await loop.run_in_executor(executor, opened.__exit__, None, None, None)
+
+
+@metrics.timed("transfer")
+async def put_in_s3(
+    client,
+    obj,
+    fileURL,
+    headers_ct,
+    executor=None,
+    block_size=None,
+    installation=None,
+    head=None,
+    progress=None,
+):
+    """PUT request for direct upload, see `direct_upload.put_in_s3()`
+
+    Parameters
+    ----------
+    client: httpx.AsyncClient
+    obj: iRODSDataObject
+      the object meant for publication
+    fileURL: str
+      Dataverse URL for the iRODS object meant for publication
+    headers_ct: dict
+      the content type for data transmission used in direct upload step-2
+    executor: concurrent.futures.Executor
+      executor running the blocking iRODS reads
+    block_size: int
+      size of the blocks read from iRODS, by default `BLOCK_SIZE`
+    installation: str
+      URL of the Dataverse installation, whose budget of throughput the reads count against
+    head: callable
+      called with the first bytes of the object, see `direct_upload.put_in_s3()`
+    progress: callable
+      called with the size of each block read from iRODS, see `read_blocks()`
+
+    Returns
+    -------
+    response: httpx.Response
+      response of PUT request for direct upload
+    """
+
+    # S3 does not accept chunked uploads: announce the size
+    headers = dict(headers_ct, **{"Content-Length": str(obj.size)})
+    response = await client.put(
+        fileURL,
+        headers=headers,
+        content=read_blocks(obj, executor, block_size, installation, head, progress),
+    )
+    if response.status_code == 200:
+        metrics.count("bytes_uploaded", obj.size)
+
+    return response
+
+
+@metrics.timed("registration")
+async def post_to_ds(client, obj_md_dict, BASE_URL, dv_ds_DOI, header_key):
+    """POST request for direct upload, see `direct_upload.post_to_ds()`
+
+    Parameters
+    ----------
+    client: httpx.AsyncClient
+    obj_md_dict: dict
+      the metadata dictionary for the file meant for publication
+    BASE_URL: str
+      class attribute baseURL
+    dv_ds_DOI: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload
+
+    Returns
+    -------
+    response: httpx.Response
+      response of POST request for direct upload
+    """
+
+    return await client.post(
+        f"{BASE_URL}/api/datasets/:persistentId/add",
+        params={"persistentId": dv_ds_DOI},
+        headers=header_key,
+        files={"jsonData": (None, f"{obj_md_dict}")},
+    )
+
+
+@metrics.timed("dataset_create")
+async def create_dataset(client, BASE_URL, ds, header_key):
+    """Create a Dataverse dataset with user specified metadata, see `to_dataverse.deposit_ds()`
+
+    Parameters
+    ----------
+    client: httpx.AsyncClient
+    BASE_URL: str
+      class attribute baseURL
+    ds: Dataset
+      The Dataset for the selected Dataverse installation
+    header_key: dict
+      the token used in direct upload
+
+    Returns
+    -------
+    dsStatus : str
+        Upload status
+    dsPID : str
+        Dataset Persistent Identifier
+    dsID : str
+        Dataverse Identifier
+    """
+
+    response = await client.post(
+        f"{BASE_URL}/api/dataverses/{ds.alias}/datasets",
+        headers=dict(header_key, **{"Content-Type": "application/json"}),
+        content=ds.json(),
+    )
+    if response.status_code != 201:
+        raise ConnectionError("The dataset could not be created", response)
+    resp = response.json()
+
+    return resp["status"], resp["data"]["persistentId"], resp["data"]["id"]
+
+
+async def transfer_direct(
+    client,
+    item,
+    BASE_URL,
+    dsPID,
+    header_key,
+    header_ct,
+    executor=None,
+    directoryLabel="data/subdir1",
+    ingest=True,
+    source=None,
+    session=None,
+):
+    """Send the content of a data object to the storage of a dataset, see `deposit.transfer_direct()`
+
+    Single uploads are streamed from the event loop. Multipart uploads and server-side copies
+    are sent by `deposit.transfer_direct()` in a thread of the executor.
+
+    Parameters
+    ----------
+    client: httpx.AsyncClient
+    item: iRODSDataObject
+      the object meant for publication
+    BASE_URL: str
+      class attribute baseURL
+    dsPID: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload step-1 and step-3
+    header_ct: dict
+      the content type for data transmission used in direct upload step-2
+    executor: concurrent.futures.Executor
+      executor running the blocking iRODS operations
+    directoryLabel: str
+      the folder of the file in the dataset
+    ingest: bool
+      whether Dataverse may ingest the file if it is tabular, see `deposit.wants_ingest()`
+    source: dict
+      replica of the object in S3, to copy server-side, from `s3_copy.find_sources()`
+    session: SessionPool
+      to read the object with a session of the pool, see `from_irods.bound()`
+
+    Returns
+    -------
+    storageID: str
+      Dataverse storage identifier
+    md_dict: dict
+      the metadata dictionary to register the file, output of `direct_upload.create_du_md()`
+    """
+
+    loop = asyncio.get_running_loop()
+    # the size announced by `from_irods.get_object_info()`
+    data = await request_upload(client, BASE_URL, dsPID, item.size + 1, header_key)
+    if "urls" in data or source is not None:
+        return await loop.run_in_executor(
+            executor,
+            functools.partial(
+                deposit.transfer_direct,
+                item,
+                BASE_URL,
+                dsPID,
+                header_key,
+                header_ct,
+                directoryLabel,
+                ingest,
+                source,
+                session,
+                data=data,
+            ),
+        )
+    storageID = data["storageIdentifier"]
+    bound = from_irods.bound(item, session)
+    obj = await loop.run_in_executor(executor, bound.__enter__)
+    try:
+        # the first bytes of the object, seen by the transfer: the MIME type is detected from them
+        head = []
+        with progress.tracker.track(obj.path, obj.size) as transfer:
+            response = await put_in_s3(
+                client,
+                obj,
+                data["url"],
+                header_ct,
+                executor,
+                installation=BASE_URL,
+                head=head.append,
+                progress=transfer.add,
+            )
+            if response.status_code != 200:
+                raise ConnectionError("The file could not be transferred", response)
+        objChecksum, objMimetype, _ = await loop.run_in_executor(
+            executor, from_irods.get_object_info, obj, head[0] if head else None
+        )
+        tabIngest = await loop.run_in_executor(
+            executor, deposit.wants_ingest, obj, ingest
+        )
+    finally:
+        await loop.run_in_executor(executor, bound.__exit__, None, None, None)
+    md_dict = direct_upload.create_du_md(
+        storageID, obj.name, objMimetype, objChecksum, directoryLabel, tabIngest
+    )
+
+    return storageID, md_dict
+
+
+async def upload_direct(
+    client,
+    item,
+    BASE_URL,
+    dsPID,
+    header_key,
+    header_ct,
+    registration,
+    executor=None,
+    directoryLabel="data/subdir1",
+    ingest=True,
+    source=None,
+    session=None,
+):
+    """Send a data object to a Dataverse dataset via direct upload, see `deposit.upload_direct()`
+
+    Parameters
+    ----------
+    client: httpx.AsyncClient
+    item: iRODSDataObject
+      the object meant for publication
+    BASE_URL: str
+      class attribute baseURL
+    dsPID: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload step-1 and step-3
+    header_ct: dict
+      the content type for data transmission used in direct upload step-2
+    registration: asyncio.Semaphore
+      limits the number of files registered in the dataset at the same time; it must be
+      shared by all the uploads to the dataset, see `upload_many()`
+    executor: concurrent.futures.Executor
+      executor running the blocking iRODS operations and the registration, which waits while
+      the dataset is locked (see `deposit.register_direct()`)
+    directoryLabel: str
+      the folder of the file in the dataset
+    ingest: bool
+      whether Dataverse may ingest the file if it is tabular, see `deposit.wants_ingest()`
+    source: dict
+      replica of the object in S3, to copy server-side, from `s3_copy.find_sources()`
+    session: SessionPool
+      to read the object with a session of the pool, see `from_irods.bound()`
+
+    Returns
+    -------
+    storageID: str
+      Dataverse storage identifier
+    response: requests.Response
+      response of the POST request registering the file
+    """
+
+    loop = asyncio.get_running_loop()
+    storageID, md_dict = await transfer_direct(
+        client,
+        item,
+        BASE_URL,
+        dsPID,
+        header_key,
+        header_ct,
+        executor,
+        directoryLabel,
+        ingest,
+        source,
+        session,
+    )
+    async with registration:
+        response = await loop.run_in_executor(
+            executor, deposit.register_direct, md_dict, BASE_URL, dsPID, header_key
+        )
+    if response.status_code != 200:
+        raise ConnectionError("The file could not be registered", response)
+
+    return storageID, response
+
+
+async def upload_many(
+    items,
+    BASE_URL,
+    dsPID,
+    header_key,
+    header_ct,
+    concurrency=100,
+    io_workers=16,
+    registrations=1,
+    directoryLabel="data/subdir1",
+    batch_size=None,
+    ingest=True,
+    defer=True,
+    sources=None,
+    session=None,
+    stop=None,
+):
+    """Send many data objects to a Dataverse dataset concurrently, from a single thread.
+
+    The HTTP requests of all the transfers share one event loop; only the blocking iRODS
+    operations (checksum, MIME type, reads and metadata updates), the multipart uploads and
+    the registrations run in a bounded pool of threads. The objects are started as they are
+    given, e.g. as `staging.stage()` brings them online. The registrations wait while the
+    dataset is locked, and with `defer` the files that Dataverse ingests as tabular data are
+    registered after all the others, as in `deposit.upload_direct_batch()`.
+
+    Parameters
+    ----------
+    items: iterable
+      iRODSDataObjects meant for publication
+    BASE_URL: str
+      class attribute baseURL
+    dsPID: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload step-1 and step-3
+    header_ct: dict
+      the content type for data transmission used in direct upload step-2
+    concurrency: int
+      maximum number of files in flight; with a SessionPool, at most its size
+    io_workers: int
+      number of threads for the iRODS operations
+    registrations: int
+      maximum number of registrations in the dataset at the same time. Concurrent
+      registrations in the same dataset can fail on its lock.
+    directoryLabel: str
+      the folder of the files in the dataset
+    batch_size: int
+      number of files registered together (`addFiles`, see `deposit.register_batch()`);
+      by default they are registered one by one (`add`)
+    ingest: bool
+      whether Dataverse may ingest tabular files, see `deposit.wants_ingest()`
+    defer: bool
+      register the files that trigger an ingest last
+    sources: dict
+      replicas in S3 by iRODS path, to copy server-side, from `s3_copy.find_sources()`
+    session: SessionPool
+      to read and update each object with a session of the pool, see `from_irods.bound()`
+    stop: threading.Event
+      once it is set, the objects that are not started yet are left out
+
+    Returns
+    -------
+    results: dict
+      For each iRODS path of a started object, the storage identifier or the exception raised
+      for the object
+    """
+
+    if isinstance(session, SessionPool):
+        # each transfer holds a session: waiting for one must not take all the threads
+        concurrency = min(concurrency, session.size, io_workers)
+    limit = asyncio.Semaphore(concurrency)
+    registration = asyncio.Semaphore(registrations)
+    loop = asyncio.get_running_loop()
+    results = {}
+    pending, deferred = [], []
+
+    with ThreadPoolExecutor(max_workers=io_workers) as executor:
+
+        def register_one(batch):
+            [(item, storageID, md_dict)] = batch
+            response = deposit.register_direct(md_dict, BASE_URL, dsPID, header_key)
+            if response.status_code != 200:
+                print(f"{item.path} could not be registered: {response.text}")
+                return {}
+            return {item.path: storageID}
+
+        def register_many(batch):
+            return deposit.register_batch(batch, BASE_URL, dsPID, header_key)
+
+        async def register(batch):
+            try:
+                async with registration:
+                    registered = await loop.run_in_executor(
+                        executor, register_many if batch_size else register_one, batch
+                    )
+                for item, storageID, _ in batch:
+                    if item.path not in registered:
+                        results[item.path] = ConnectionError(
+                            "The file could not be registered"
+                        )
+                        continue
+                    await loop.run_in_executor(
+                        executor, deposit.mark_deposited, item, storageID, session
+                    )
+                    results[item.path] = storageID
+            except Exception as e:
+                for item, _, _ in batch:
+                    results.setdefault(item.path, e)
+
+        async with create_client(concurrency) as client:
+
+            async def upload(item):
+                try:
+                    async with limit:
+                        if stop is not None and stop.is_set():
+                            return
+                        entry = (
+                            item,
+                            *await transfer_direct(
+                                client,
+                                item,
+                                BASE_URL,
+                                dsPID,
+                                header_key,
+                                header_ct,
+                                executor,
+                                directoryLabel,
+                                ingest,
+                                (sources or {}).get(item.path),
+                                session,
+                            ),
+                        )
+                except Exception as e:
+                    results[item.path] = e
+                    return
+                if defer and direct_upload.triggers_ingest(entry[2]):
+                    deferred.append(entry)
+                    return
+                pending.append(entry)
+                if len(pending) >= (batch_size or 1):
+                    batch = pending[:]
+                    pending.clear()
+                    await register(batch)
+
+            tasks = []
+            iterator = iter(items)
+            while True:
+                # e.g. waiting for a recall from tape, without blocking the event loop
+                item = await loop.run_in_executor(executor, next, iterator, None)
+                if item is None:
+                    break
+                tasks.append(asyncio.ensure_future(upload(item)))
+            await asyncio.gather(*tasks)
+            if pending:
+                await register(pending)
+            step = batch_size or 1
+            for i in range(0, len(deferred), step):
+                await register(deferred[i : i + step])
+
+    return results
+
+
+def run_uploads(items, BASE_URL, dsPID, header_key, header_ct, **options):
+    """Blocking entry point of `upload_many()`, for scripts without an event loop."""
+    return asyncio.run(
+        upload_many(items, BASE_URL, dsPID, header_key, header_ct, **options)
+    )
@@ -0,0 +1,251 @@
+import os
+import json
+import argparse
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from irods2dataverse import from_irods, to_dataverse
+from irods2dataverse.installations import registry
+from irods2dataverse.session_pool import SessionPool
+
+atr_publish = "dv.publication"
+atr_doi = "dv.ds.DOI"
+atr_dv = "dv.installation"
+atr_storage = "dv.df.storageIdentifier"
+
+
+def compute_missing(dchksum, session, max_workers=4):
+    """Compute the checksums that are missing in the catalog, a few at a time.
+
+    Parameters
+    ----------
+    dchksum: dict
+        Checksum by iRODS path, output of `from_irods.query_checksums()`.
+        It is updated with the computed checksums.
+    session: iRODS session or SessionPool
+        With a pool, each checksum is computed with a session of the pool.
+    max_workers: int
+        Maximum number of checksums computed at the same time
+
+    Returns
+    -------
+    computed: dict
+        the checksum of each data object whose checksum was missing, by iRODS path, or the
+        exception raised when computing it
+    """
+    missing = [k for k, v in dchksum.items() if not v]
+
+    def chksum(path):
+        try:
+            if isinstance(session, SessionPool):
+                return session.run(lambda s: s.data_objects.chksum(path))
+            return session.data_objects.chksum(path)
+        except Exception as e:
+            print(f"The checksum of {path} could not be computed: {e}")
+            return e
+
+    computed = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for path, checksum in zip(missing, executor.map(chksum, missing)):
+            computed[path] = checksum
+            if not isinstance(checksum, Exception):
+                dchksum[path] = checksum
+    return computed
+
+
+def match_file(path, storage_ids, ds_files):
+    """Find the Dataverse file corresponding to a data object.
+
+    Parameters
+    ----------
+    path: str
+        iRODS path of the data object
+    storage_ids: list
+        Values of the storage identifier metadata of the data object
+    ds_files: dict
+        Files of the dataset, output of `to_dataverse.list_ds_files()`
+
+    Returns
+    -------
+    ds_file: dict
+        The matching file, by storage identifier or else by unique file name; `None` if not found.
+    """
+    by_storage = [x for x in ds_files.values() if x["storageIdentifier"] in storage_ids]
+    if len(by_storage) > 0:
+        return by_storage[0]
+    by_name = [x for x in ds_files.values() if x["label"] == posixpath.basename(path)]
+    return by_name[0] if len(by_name) == 1 else None
+
+
+def compare(irods_checksum, ds_file):
+    """Compare the checksum of a data object with its file in Dataverse.
+
+    Parameters
+    ----------
+    irods_checksum: str
+        Checksum of the data object in iRODS
+    ds_file: dict
+        The matching file of the dataset, output of `match_file()`
+
+    Returns
+    -------
+    status: str
+        One of 'ok', 'mismatch', 'incomparable' (different algorithms) or 'missing'.
+    """
+    if ds_file is None:
+        return "missing"
+    if from_irods.same_checksum(irods_checksum, ds_file["checksum"]):
+        return "ok"
+    dv_type = ds_file["checksum"].get("type", "").upper()
+    irods_type = "SHA-256" if (irods_checksum or "").startswith("sha2:") else "MD5"
+    return "mismatch" if dv_type == irods_type else "incomparable"
+
+
+def audit(session, apis, max_workers=8, max_checksums=4):
+    """Compare the checksums of the deposited and published data objects with those in Dataverse.
+
+    Parameters
+    ----------
+    session: iRODS session or SessionPool
+    apis: dict
+        pyDataverse NativeApi by installation name
+    max_workers: int
+        Maximum number of datasets listed concurrently
+    max_checksums: int
+        Maximum number of missing checksums computed concurrently
+
+    Returns
+    -------
+    report: dict
+        Number of objects by status under 'summary', and the objects with another status than 'ok'
+        under 'problems', with their path, installation, DOI and checksums. The status is 'error'
+        when the missing checksum of the object could not be computed, and 'unlisted' when the
+        files of its dataset could not be listed.
+    """
+    vals = ["deposited", "published"]
+    dmd = from_irods.query_md(
+        atr_publish, vals, [atr_doi, atr_dv, atr_storage], session
+    )
+    dchksum = from_irods.query_checksums(atr_publish, vals, session)
+    computed = compute_missing(dchksum, session, max_checksums)
+
+    datasets = {
+        (avus[atr_dv][0], doi)
+        for avus in dmd.values()
+        if len(avus.get(atr_dv, [])) == 1 and avus[atr_dv][0] in apis
+        for doi in avus.get(atr_doi, [])
+    }
+
+    def listing(dataset):
+        installation, doi = dataset
+        try:
+            return to_dataverse.list_ds_files(apis[installation], doi)
+        except Exception as e:
+            print(f"The files of {doi} in {installation} could not be listed: {e}")
+            return e
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        listings = dict(zip(datasets, executor.map(listing, datasets)))
+
+    summary = {}
+    problems = []
+    for path, avus in sorted(dmd.items()):
+        installation = avus.get(atr_dv, [None])[0]
+        for doi in avus.get(atr_doi, []):
+            if (installation, doi) not in listings:
+                continue
+            ds_files = listings[(installation, doi)]
+            unlisted = isinstance(ds_files, Exception)
+            ds_file = (
+                None
+                if unlisted
+                else match_file(path, avus.get(atr_storage, []), ds_files)
+            )
+            error = computed.get(path)
+            if unlisted:
+                status = "unlisted"
+            elif isinstance(error, Exception):
+                status = "error"
+            else:
+                status = compare(dchksum.get(path), ds_file)
+            summary[status] = summary.get(status, 0) + 1
+            if status != "ok":
+                problems.append(
+                    {
+                        "path": path,
+                        "installation": installation,
+                        "doi": doi,
+                        "status": status,
+                        "irods_checksum": dchksum.get(path),
+                        "dataverse_checksum": (
+                            None if ds_file is None else ds_file["checksum"]
+                        ),
+                        "checksum_computed": path in computed,
+                        "checksum_error": (
+                            str(error) if isinstance(error, Exception) else None
+                        ),
+                        "listing_error": str(ds_files) if unlisted else None,
+                    }
+                )
+
+    return {"summary": summary, "problems": problems}
+
+
+if __name__ == "__main__":
+    """Fixity check of the data sent to Dataverse: this can be run e.g. as a cron job."""
+    parser = argparse.ArgumentParser(
+        description="Detect deposited data altered in Dataverse or in iRODS by comparing checksums."
+    )
+    parser.add_argument(
+        "output_path",
+        help="Path to store the JSON report. Use '-' for the standard output.",
+    )
+    parser.add_argument(
+        "-e",
+        "--environment",
+        default=os.path.expanduser("~/.irods/irods_environment.json"),
+        help="Path to the iRODS environment file.",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=8,
+        help="Maximum number of datasets listed concurrently.",
+    )
+    parser.add_argument(
+        "-c",
+        "--checksums",
+        type=int,
+        default=4,
+        help="Maximum number of missing iRODS checksums computed concurrently.",
+    )
+    args = parser.parse_args()
+
+    # one session per checksum computed concurrently
+    pool = from_irods.authenticate_pool(args.environment, args.checksums)
+    if not pool:
+        raise SystemExit(1)
+    apis = {}
+    for installation in registry.names():
+        # draft datasets can only be listed with a token, e.g. DATAVERSE_TOKEN_RDR_PILOT
+        token = os.getenv(f"DATAVERSE_TOKEN_{installation.upper().replace('-', '_')}")
+        try:
+            status, api = registry.authenticate(installation, token)
+        except Exception as e:
+            print(f"{installation} could not be reached: {e}")
+            continue
+        if status != 200:
+            print(
+                f"{installation} could not be authenticated (status {status}): skipped"
+            )
+            continue
+        apis[installation] = api
+    report = audit(pool, apis, args.workers, args.checksums)
+    pool.close()
+    if args.output_path == "-":
+        print(json.dumps(report, indent=4))
+    else:
+        with open(args.output_path, "w") as f:
+            json.dump(report, f, indent=4)
+    # a non-zero exit code signals altered data
+    raise SystemExit(1 if report["summary"].get("mismatch") else 0)
@@ -1,8 +1,10 @@
 import os
 import json
 import argparse
+from irods2dataverse import metrics
 
 
+@metrics.timed("avu_extraction")
 def parse_mango_metadata(schema_path, data_object, schema_prefix="mgs"):
     """Parse AVUs from ManGO metadata schema.
 
@@ -42,6 +44,7 @@ def read_schema(schema_path, schema_prefix="mgs"):
     return Schema(schema_path, prefix=schema_prefix)
 
 
+@metrics.timed("avu_extraction")
 def parse_json_metadata(schema_path, dictionary):
     """Parse metadata from a dictionary
 
@@ -76,6 +79,7 @@ def extract_template(path):
     return template
 
 
+@metrics.timed("template_fill")
 def fill_in_template(template, avus):
     """Fill in Dataverse template with metadata
 
@@ -0,0 +1,278 @@
+import os
+import re
+import json
+import time
+from irods2dataverse import metrics
+
+# capabilities are probed again after a day
+TTL = 24 * 60 * 60
+CACHE_PATH = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "irods2dataverse",
+    "capabilities.json",
+)
+# larger than a single S3 PUT can be: storages that support it answer with a multipart upload
+MULTIPART_PROBE_SIZE = 5 * 1024**3 + 1
+# first version of Dataverse with the `addFiles` endpoint
+ADD_FILES_VERSION = (5, 5)
+
+
+def parse_version(version):
+    """Parse a Dataverse version such as '6.2' or 'v. 5.14 build 1234' into a tuple of numbers."""
+    match = re.search(r"\d+(\.\d+)*", version or "")
+    return tuple(int(x) for x in match.group().split(".")) if match else ()
+
+
+def get_number(response):
+    """Get the number in the message of a Dataverse response, e.g. a quota in bytes, or `None`."""
+    if response.status_code != 200:
+        return None
+    data = response.json().get("data")
+    text = data.get("message", "") if isinstance(data, dict) else str(data)
+    match = re.search(r"\d+", text)
+    return int(match.group()) if match else None
+
+
+def probe_direct_upload(BASE_URL, dsPID, header_key, max_file_size=None):
+    """Check whether a dataset accepts direct uploads, and in parts of which size.
+
+    Parameters
+    ----------
+    BASE_URL: str
+      class attribute baseURL
+    dsPID: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload
+    max_file_size: int
+      maximum size of a file, if known
+
+    Returns
+    -------
+    direct_upload: bool
+      `None` if it is unknown, e.g. after a server error: only an explicit refusal means False
+    part_size: int
+      size of the parts of multipart uploads, or `None` if the storage does not use them
+    """
+    import requests
+
+    url = f"{BASE_URL}/api/datasets/:persistentId/uploadurls"
+    try:
+        response = requests.get(
+            url, params={"persistentId": dsPID, "size": 1}, headers=header_key
+        )
+    except requests.RequestException as e:
+        print(f"Direct upload support could not be probed: {e}")
+        return None, None
+    if response.status_code != 200:
+        if "not supported" in response.text.lower():
+            return False, None
+        print(f"Direct upload support could not be probed: {response.text}")
+        return None, None
+    size = MULTIPART_PROBE_SIZE
+    if max_file_size is not None:
+        size = min(size, max_file_size)
+    response = requests.get(
+        url, params={"persistentId": dsPID, "size": size}, headers=header_key
+    )
+    if response.status_code != 200:
+        return True, None
+    data = response.json()["data"]
+    if "partSize" not in data:
+        return True, None
+    # the probe started a multipart upload: cancel it
+    requests.delete(f"{BASE_URL}{data['abort']}", headers=header_key)
+    return True, int(data["partSize"])
+
+
+def get_storage(BASE_URL, alias, header_key=None):
+    """Get the storage quota of a Dataverse collection and how much of it is used.
+
+    Unlike the other capabilities, the use changes with every deposit: it is not worth caching.
+
+    Parameters
+    ----------
+    BASE_URL: str
+      class attribute baseURL
+    alias: str
+      alias of the Dataverse collection
+    header_key: dict
+      the token used in direct upload
+
+    Returns
+    -------
+    quota: int
+      quota in bytes, or `None` if there is none or it is unknown
+    storage_use: int
+      bytes used, or `None` if unknown
+    """
+    import requests
+
+    header_key = header_key or {}
+    BASE_URL = BASE_URL.rstrip("/")
+    quota = get_number(
+        requests.get(
+            f"{BASE_URL}/api/dataverses/{alias}/storage/quota", headers=header_key
+        )
+    )
+    storage_use = get_number(
+        requests.get(
+            f"{BASE_URL}/api/dataverses/{alias}/storage/use", headers=header_key
+        )
+    )
+    return quota, storage_use
+
+
+@metrics.timed("capabilities")
+def probe(BASE_URL, alias, header_key=None, dsPID=None):
+    """Detect what a Dataverse installation and collection support.
+
+    Parameters
+    ----------
+    BASE_URL: str
+      class attribute baseURL
+    alias: str
+      alias of the Dataverse collection
+    header_key: dict
+      the token used in direct upload
+    dsPID: str
+      a dataset of the collection, needed to detect direct upload support
+
+    Returns
+    -------
+    capabilities: dict
+      'version', 'add_files' (bool), 'direct_upload' (bool, or `None` without dataset),
+      'part_size', 'max_file_size', 'quota' and 'storage_use' (in bytes, `None` if unknown),
+      'max_files' (files per dataset, `None` if unknown)
+      and 'probed_at' (epoch seconds)
+    """
+    import requests
+
+    header_key = header_key or {}
+    response = requests.get(f"{BASE_URL}/api/info/version")
+    if response.status_code != 200:
+        raise ConnectionError("The Dataverse installation cannot be reached", response)
+    version = response.json()["data"]["version"]
+    max_file_size = get_number(
+        requests.get(f"{BASE_URL}/api/info/settings/:MaxFileUploadSizeInBytes")
+    )
+    max_files = get_number(
+        requests.get(f"{BASE_URL}/api/info/settings/:DatasetFileCountLimit")
+    )
+    quota, storage_use = get_storage(BASE_URL, alias, header_key)
+    direct_upload, part_size = None, None
+    if dsPID is not None:
+        direct_upload, part_size = probe_direct_upload(
+            BASE_URL, dsPID, header_key, max_file_size
+        )
+
+    return {
+        "version": version,
+        "add_files": parse_version(version) >= ADD_FILES_VERSION,
+        "direct_upload": direct_upload,
+        "part_size": part_size,
+        "max_file_size": max_file_size,
+        "max_files": max_files,
+        "quota": quota,
+        "storage_use": storage_use,
+        "probed_at": time.time(),
+    }
+
+
+def read_cache(cache_path=None):
+    """Read the cached capabilities, by installation URL and collection alias."""
+    cache_path = cache_path or CACHE_PATH
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except ValueError:
+        # e.g. a file truncated by a crash: probe again
+        return {}
+
+
+def write_cache(cache, cache_path=None):
+    """Store the cached capabilities, replacing the file atomically."""
+    cache_path = cache_path or CACHE_PATH
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=4)
+    os.replace(tmp_path, cache_path)
+
+
+def get_capabilities(
+    BASE_URL,
+    alias,
+    header_key=None,
+    dsPID=None,
+    ttl=TTL,
+    cache_path=None,
+    refresh=False,
+):
+    """Get the capabilities of a Dataverse installation and collection, from the cache if possible.
+
+    Parameters
+    ----------
+    BASE_URL: str
+      class attribute baseURL
+    alias: str
+      alias of the Dataverse collection
+    header_key: dict
+      the token used in direct upload
+    dsPID: str
+      a dataset of the collection, needed to detect direct upload support
+    ttl: float
+      seconds during which cached capabilities are used
+    cache_path: str
+      JSON file of the cache, by default `CACHE_PATH`
+    refresh: bool
+      probe even if the cached capabilities are recent
+
+    Returns
+    -------
+    capabilities: dict
+      output of `probe()`; it is not cached when direct upload support could not be probed
+    """
+
+    key = f"{BASE_URL.rstrip('/')}|{alias}"
+    cache = read_cache(cache_path)
+    cached = cache.get(key)
+    if (
+        not refresh
+        and cached is not None
+        and time.time() - cached["probed_at"] < ttl
+        # direct upload support can only be probed with a dataset
+        and (cached["direct_upload"] is not None or dsPID is None)
+    ):
+        return cached
+    capabilities = probe(BASE_URL.rstrip("/"), alias, header_key, dsPID)
+    if dsPID is not None and capabilities["direct_upload"] is None:
+        # the probe failed, e.g. on a transient error: try again next time
+        return capabilities
+    cache[key] = capabilities
+    write_cache(cache, cache_path)
+    return capabilities
+
+
+def choose_strategy(capabilities):
+    """Choose the fastest transfer strategy available.
+
+    Parameters
+    ----------
+    capabilities: dict
+      output of `get_capabilities()`
+
+    Returns
+    -------
+    strategy: str
+      'direct-batch' (direct upload, files registered together via `addFiles`),
+      'direct' (direct upload, files registered one by one) or 'native' (upload via
+      a local copy, always available)
+    """
+    if not capabilities.get("direct_upload"):
+        return "native"
+    if capabilities.get("add_files"):
+        return "direct-batch"
+    return "direct"
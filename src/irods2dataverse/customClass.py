@@ -16,48 +16,42 @@ class CustomDataset(Dataset):
 
 
 class DemoDataset(CustomDataset):
-    def __init__(self, data=None):
-        super().__init__(data=None)
-        self.alias = "demo"
-        self.name = "DemoDataset"
-        self.baseURL = "https://demo.dataverse.org"
-        self._metadataTemplate = "template_Demo.json"
-        self._mangoSchema = "mango2dv-demo-1.0.0-published.json"
+    # class attributes: the same for every dataset of the installation
+    alias = "demo"
+    name = "DemoDataset"
+    baseURL = "https://demo.dataverse.org"
+    _metadataTemplate = "template_Demo.json"
+    _mangoSchema = "mango2dv-demo-1.0.0-published.json"
 
 
 class RDRDataset(CustomDataset):
-
-    def __init__(self, data=None):
-        #  super extends the original constructor otherwise replacing
-        super().__init__(data=None)
-        # self. ==> instance attribute instead of class attribute
-        self._Dataset__attr_import_dv_up_citation_fields_values.append(
-            "technicalFormat"
-        )
-        self._Dataset__attr_import_dv_up_citation_fields_values.append("access")
-        self._Dataset__attr_dict_dv_up_required = (
-            self._Dataset__attr_dict_dv_up_required
-            + ["access", "keyword", "technicalFormat"]
-        )
-        self._Dataset__attr_dict_dv_up_required.remove("subject")
-        self._Dataset__attr_dict_dv_up_type_class_primitive.append("technicalFormat")
-        self._Dataset__attr_dict_dv_up_type_class_compound.append("access")
-        self._Dataset__attr_dict_dv_up_type_class_controlled_vocabulary = (
-            self._Dataset__attr_dict_dv_up_type_class_controlled_vocabulary
-            + ["accessRights", "legitimateOptout"]
-        )
-        self.alias = "rdr"
-        self.name = "RDRDataset"
-        self.baseURL = "https://rdr.kuleuven.be/"
-        self._metadataTemplate = "template_RDR.json"
-        self._mangoSchema = "mango2dv-rdr-1.0.0-published.json"
+    # pyDataverse keeps its lists of fields in name-mangled class attributes of Dataset:
+    # extended copies on this class leave the lists of Dataset (and the other installations) intact
+    _Dataset__attr_import_dv_up_citation_fields_values = (
+        Dataset._Dataset__attr_import_dv_up_citation_fields_values
+        + ["technicalFormat", "access"]
+    )
+    _Dataset__attr_dict_dv_up_required = [
+        x for x in Dataset._Dataset__attr_dict_dv_up_required if x != "subject"
+    ] + ["access", "keyword", "technicalFormat"]
+    _Dataset__attr_dict_dv_up_type_class_primitive = (
+        Dataset._Dataset__attr_dict_dv_up_type_class_primitive + ["technicalFormat"]
+    )
+    _Dataset__attr_dict_dv_up_type_class_compound = (
+        Dataset._Dataset__attr_dict_dv_up_type_class_compound + ["access"]
+    )
+    _Dataset__attr_dict_dv_up_type_class_controlled_vocabulary = (
+        Dataset._Dataset__attr_dict_dv_up_type_class_controlled_vocabulary
+        + ["accessRights", "legitimateOptout"]
+    )
+    alias = "rdr"
+    name = "RDRDataset"
+    baseURL = "https://rdr.kuleuven.be/"
+    _metadataTemplate = "template_RDR.json"
+    _mangoSchema = "mango2dv-rdr-1.0.0-published.json"
 
 
 class RDRPilotDataset(RDRDataset):
-    def __init__(self, data=None):
-        super().__init__(data=None)
-        self.alias = "rdr"
-        self.name = "RDRPilotDataset"
-        self.baseURL = "https://www.rdm.libis.kuleuven.be/"
-        self.metadataTemplate = "template_RDR-pilot.json"
-        self._mangoSchema = "mango2dv-rdr-1.0.0-published.json"
+    name = "RDRPilotDataset"
+    baseURL = "https://www.rdm.libis.kuleuven.be/"
+    _metadataTemplate = "template_RDR-pilot.json"
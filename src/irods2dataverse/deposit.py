@@ -0,0 +1,993 @@
+import time
+import datetime
+import posixpath
+import threading
+import contextlib
+from irods2dataverse import (
+    from_irods,
+    direct_upload,
+    to_dataverse,
+    s3_copy,
+    progress,
+    schedule,
+)
+
+atr_publish = "dv.publication"
+# set to 'false' on a data object to keep Dataverse from ingesting it as tabular data
+atr_ingest = "dv.df.tabIngest"
+
+
+def wants_ingest(item, ingest=True):
+    """Whether Dataverse may ingest a data object, from the global option and the object's metadata.
+
+    Parameters
+    ----------
+    item: iRODSDataObject
+      the object meant for publication
+    ingest: bool
+      global option: False disables ingest for all objects
+
+    Returns
+    -------
+    bool
+    """
+    if not ingest:
+        return False
+    return all(x.value.lower() != "false" for x in item.metadata.get_all(atr_ingest))
+
+
+def register_direct(
+    md_dict,
+    BASE_URL,
+    dsPID,
+    header_key,
+    file_id=None,
+    timeout=direct_upload.LOCK_TIMEOUT,
+):
+    """Register a directly uploaded file in a dataset, waiting while the dataset is locked.
+
+    Parameters
+    ----------
+    md_dict: dict
+      the metadata dictionary of the file, output of `direct_upload.create_du_md()`
+    BASE_URL: str
+      class attribute baseURL
+    dsPID: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload step-1 and step-3
+    file_id: int
+      Dataverse identifier of the file this one replaces, if any
+    timeout: float
+      seconds to wait for the dataset to be unlocked
+
+    Returns
+    -------
+    response: json
+      json response of the last POST request
+    """
+
+    deadline = time.monotonic() + timeout
+    while True:
+        if file_id is None:
+            response = direct_upload.post_to_ds(md_dict, BASE_URL, dsPID, header_key)
+        else:
+            response = direct_upload.replace_in_ds(
+                md_dict, BASE_URL, file_id, header_key
+            )
+        if not direct_upload.is_locked(response):
+            return response
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not direct_upload.wait_for_unlock(
+            BASE_URL, dsPID, header_key, remaining
+        ):
+            return response
+
+
+def register_many(
+    md_list, BASE_URL, dsPID, header_key, timeout=direct_upload.LOCK_TIMEOUT
+):
+    """Register directly uploaded files together (`addFiles`), waiting while the dataset is locked.
+
+    Parameters
+    ----------
+    md_list: list
+      the metadata dictionaries of the files
+    BASE_URL: str
+      class attribute baseURL
+    dsPID: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload step-1 and step-3
+    timeout: float
+      seconds to wait for the dataset to be unlocked
+
+    Returns
+    -------
+    response: json
+      json response of the last POST request
+    """
+
+    deadline = time.monotonic() + timeout
+    while True:
+        response = direct_upload.post_many_to_ds(md_list, BASE_URL, dsPID, header_key)
+        if not direct_upload.is_locked(response):
+            return response
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not direct_upload.wait_for_unlock(
+            BASE_URL, dsPID, header_key, remaining
+        ):
+            return response
+
+
+def upload_direct(
+    item,
+    BASE_URL,
+    dsPID,
+    header_key,
+    header_ct,
+    directoryLabel="data/subdir1",
+    file_id=None,
+    ingest=True,
+    source=None,
+    session=None,
+):
+    """Send a data object to a Dataverse dataset via direct upload.
+
+    If the dataset is locked, e.g. by the ingest of a previous tabular file, the registration
+    waits until it is unlocked.
+
+    Parameters
+    ----------
+    item: iRODSDataObject
+      the object meant for publication
+    BASE_URL: str
+      class attribute baseURL
+    dsPID: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload step-1 and step-3
+    header_ct: dict
+      the content type for data transmission used in direct upload step-2
+    directoryLabel: str
+      the folder of the file in the dataset
+    file_id: int
+      Dataverse identifier of the file this object replaces, if any
+    ingest: bool
+      whether Dataverse may ingest the file if it is tabular, see `wants_ingest()`
+    source: dict
+      replica of the object in S3, to copy server-side, from `s3_copy.find_sources()`
+    session: SessionPool
+      to read the object with a session of the pool, see `from_irods.bound()`
+
+    Returns
+    -------
+    storageID: str
+      Dataverse storage identifier
+    response: json
+      json response of the POST request registering the file
+    """
+
+    storageID, md_dict = transfer_direct(
+        item,
+        BASE_URL,
+        dsPID,
+        header_key,
+        header_ct,
+        directoryLabel,
+        ingest,
+        source,
+        session,
+    )
+    response = register_direct(md_dict, BASE_URL, dsPID, header_key, file_id)
+    if response.status_code != 200:
+        raise ConnectionError("The file could not be registered", response)
+
+    return storageID, response
+
+
+def transfer_direct(
+    item,
+    BASE_URL,
+    dsPID,
+    header_key,
+    header_ct,
+    directoryLabel="data/subdir1",
+    ingest=True,
+    source=None,
+    session=None,
+    data=None,
+):
+    """Send the content of a data object to the storage of a dataset, without registering it.
+
+    Large objects are sent in parts if the storage asks for a multipart upload. If the object
+    has a replica in S3, it is first copied server-side (see `s3_copy.copy_to_s3()`), and only
+    streamed through the client if that is not possible.
+
+    Parameters
+    ----------
+    item: iRODSDataObject
+      the object meant for publication
+    BASE_URL: str
+      class attribute baseURL
+    dsPID: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload step-1 and step-3
+    header_ct: dict
+      the content type for data transmission used in direct upload step-2
+    directoryLabel: str
+      the folder of the file in the dataset
+    ingest: bool
+      whether Dataverse may ingest the file if it is tabular, see `wants_ingest()`
+    source: dict
+      replica of the object in S3, from `s3_copy.find_sources()`
+    session: SessionPool
+      to read the object with a session of the pool, see `from_irods.bound()`
+    data: dict
+      output of `direct_upload.request_upload()`, if the upload is already requested
+
+    Returns
+    -------
+    storageID: str
+      Dataverse storage identifier
+    md_dict: dict
+      the metadata dictionary to register the file, output of `direct_upload.create_du_md()`
+    """
+
+    with from_irods.bound(item, session) as item:
+        if data is None:
+            # the size announced by `from_irods.get_object_info()`
+            data = direct_upload.request_upload(
+                BASE_URL, dsPID, item.size + 1, header_key
+            )
+        storageID = data["storageIdentifier"]
+        copied = source is not None and s3_copy.copy_to_s3(
+            item, source, data, BASE_URL, header_key
+        )
+        # the first bytes of the object, seen by the transfer: the MIME type is detected from them
+        head = []
+        with progress.tracker.track(item.path, item.size) as transfer:
+            if copied:
+                transfer.add(item.size)
+            elif "urls" in data:
+                response = direct_upload.put_parts_in_s3(
+                    item,
+                    data,
+                    BASE_URL,
+                    header_ct,
+                    header_key,
+                    head=head.append,
+                    progress=transfer.add,
+                )
+            else:
+                response = direct_upload.put_in_s3(
+                    item,
+                    data["url"],
+                    header_ct,
+                    installation=BASE_URL,
+                    head=head.append,
+                    progress=transfer.add,
+                )
+            if not copied and response.status_code != 200:
+                raise ConnectionError("The file could not be transferred", response)
+        objChecksum, objMimetype, _ = from_irods.get_object_info(
+            item, head[0] if head else None
+        )
+        md_dict = direct_upload.create_du_md(
+            storageID,
+            item.name,
+            objMimetype,
+            objChecksum,
+            directoryLabel,
+            wants_ingest(item, ingest),
+        )
+
+    return storageID, md_dict
+
+
+def register_batch(batch, BASE_URL, dsPID, header_key, registration=None):
+    """Register transferred files in a dataset with one request, see `register_many()`.
+
+    Parameters
+    ----------
+    batch: list
+      `(item, storageID, md_dict)` tuples, output of `transfer_direct()` for each object
+    BASE_URL: str
+      class attribute baseURL
+    dsPID: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload step-1 and step-3
+    registration: threading.Lock
+      held while registering, when several threads upload to the same dataset
+
+    Returns
+    -------
+    storageIDs: dict
+      Dataverse storage identifier of each registered data object, by iRODS path. The objects
+      that could not be registered are printed and left out.
+    """
+    import requests
+
+    try:
+        with registration or contextlib.nullcontext():
+            response = register_many([x[2] for x in batch], BASE_URL, dsPID, header_key)
+    except (ConnectionError, requests.RequestException) as e:
+        response = e
+    if getattr(response, "status_code", None) != 200:
+        error = getattr(response, "text", response)
+        for item, _, _ in batch:
+            print(f"{item.path} could not be registered: {error}")
+        return {}
+    # files can be rejected one by one, e.g. duplicates
+    rejected = {
+        x.get("storageIdentifier"): x["errorMessage"]
+        for x in response.json()["data"].get("Files", [])
+        if "errorMessage" in x
+    }
+    storageIDs = {}
+    for item, storageID, _ in batch:
+        if storageID in rejected:
+            print(f"{item.path} could not be registered: {rejected[storageID]}")
+        else:
+            storageIDs[item.path] = storageID
+
+    return storageIDs
+
+
+def upload_direct_batch(
+    items,
+    BASE_URL,
+    dsPID,
+    header_key,
+    header_ct,
+    directoryLabel="data/subdir1",
+    batch_size=100,
+    ingest=True,
+    defer=True,
+    sources=None,
+    registration=None,
+    session=None,
+    deferred=None,
+):
+    """Send data objects to a Dataverse dataset via direct upload, registering them in batches.
+
+    Registering many files with one `addFiles` request avoids updating the dataset
+    (and waiting for its lock) once per file. With `defer`, files that Dataverse ingests as
+    tabular data are registered after all the others: each ingest locks the dataset, which
+    would otherwise hold up the registration of the next batch.
+
+    Parameters
+    ----------
+    items: iterable
+      iRODSDataObjects meant for publication, e.g. from `staging.stage()`
+    BASE_URL: str
+      class attribute baseURL
+    dsPID: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload step-1 and step-3
+    header_ct: dict
+      the content type for data transmission used in direct upload step-2
+    directoryLabel: str
+      the folder of the files in the dataset
+    batch_size: int
+      maximum number of files registered per request
+    ingest: bool
+      whether Dataverse may ingest tabular files, see `wants_ingest()`
+    defer: bool
+      register the files that trigger an ingest last
+    sources: dict
+      replicas in S3 by iRODS path, to copy server-side, from `s3_copy.find_sources()`
+    registration: threading.Lock
+      held while registering, when several threads upload to the same dataset
+    session: SessionPool
+      to read each object with a session of the pool, see `from_irods.bound()`
+    deferred: list
+      with `defer`, the files that trigger an ingest are added to this list as
+      `(item, storageID, md_dict)` tuples instead of being registered, e.g. to register them
+      after those of other calls (see `register_batch()`)
+
+    Returns
+    -------
+    storageIDs: dict
+      Dataverse storage identifier of each registered data object, by iRODS path.
+      Objects that could not be transferred or registered are left out: a batch that fails
+      does not stop the next ones.
+    """
+    import requests
+
+    storageIDs = {}
+
+    def register(batch):
+        storageIDs.update(
+            register_batch(batch, BASE_URL, dsPID, header_key, registration)
+        )
+
+    batch = []
+    later = [] if deferred is None else deferred
+    for item in items:
+        try:
+            storageID, md_dict = transfer_direct(
+                item,
+                BASE_URL,
+                dsPID,
+                header_key,
+                header_ct,
+                directoryLabel,
+                ingest,
+                (sources or {}).get(item.path),
+                session,
+            )
+        except (ConnectionError, requests.RequestException) as e:
+            print(f"{item.path} could not be transferred: {e}")
+            continue
+        if defer and direct_upload.triggers_ingest(md_dict):
+            later.append((item, storageID, md_dict))
+            continue
+        batch.append((item, storageID, md_dict))
+        if len(batch) == batch_size:
+            register(batch)
+            batch = []
+    if batch:
+        register(batch)
+    if deferred is None:
+        for i in range(0, len(later), batch_size):
+            register(later[i : i + batch_size])
+
+    return storageIDs
+
+
+def upload_direct_scheduled(
+    items,
+    BASE_URL,
+    dsPID,
+    header_key,
+    header_ct,
+    directoryLabel="data/subdir1",
+    policy="lpt",
+    workers=4,
+    batch_size=100,
+    ingest=True,
+    sources=None,
+    session=None,
+    stop=None,
+):
+    """Send data objects to a Dataverse dataset via direct upload, with several threads.
+
+    The objects are ordered by a scheduling policy as they arrive (see `schedule.waves()`)
+    and taken by `workers` threads; each job is sent with `upload_direct_batch()`.
+    The registrations in the dataset are done one at a time. The files that Dataverse ingests
+    as tabular data are registered once all the jobs are done, so that no job waits for an ingest.
+
+    Parameters
+    ----------
+    items: iterable
+      iRODSDataObjects meant for publication
+    BASE_URL: str
+      class attribute baseURL
+    dsPID: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload step-1 and step-3
+    header_ct: dict
+      the content type for data transmission used in direct upload step-2
+    directoryLabel: str
+      the folder of the files in the dataset
+    policy: str
+      'fifo', 'largest-first' or 'lpt', see `schedule.make_jobs()`
+    workers: int
+      number of threads
+    batch_size: int
+      maximum number of files registered per request
+    ingest: bool
+      whether Dataverse may ingest tabular files, see `wants_ingest()`
+    sources: dict
+      replicas in S3 by iRODS path, to copy server-side, from `s3_copy.find_sources()`
+    session: SessionPool
+      to read each object with a session of the pool, see `from_irods.bound()`
+    stop: threading.Event
+      once it is set, the jobs that are not started yet are left out
+
+    Returns
+    -------
+    storageIDs: dict
+      Dataverse storage identifier of each registered data object, by iRODS path.
+      Objects that could not be transferred or registered are left out.
+    """
+
+    registration = threading.Lock()
+    # shared by the jobs: appending to a list is thread-safe
+    deferred = []
+
+    def process(job):
+        if stop is not None and stop.is_set():
+            return {}
+        return upload_direct_batch(
+            job,
+            BASE_URL,
+            dsPID,
+            header_key,
+            header_ct,
+            directoryLabel,
+            batch_size=batch_size,
+            ingest=ingest,
+            sources=sources,
+            registration=registration,
+            session=session,
+            deferred=deferred,
+        )
+
+    # e.g. the online objects are sent while the others are staged
+    jobs = schedule.waves(items, policy)
+    results = schedule.run_jobs(jobs, process, workers)
+    for i in range(0, len(deferred), batch_size):
+        results.update(
+            register_batch(deferred[i : i + batch_size], BASE_URL, dsPID, header_key)
+        )
+    for path, result in results.items():
+        if isinstance(result, Exception):
+            print(f"{path} could not be uploaded: {result}")
+
+    return {k: v for k, v in results.items() if isinstance(v, str)}
+
+
+def upload_direct_deferred(
+    items,
+    BASE_URL,
+    dsPID,
+    header_key,
+    header_ct,
+    directoryLabel="data/subdir1",
+    ingest=True,
+    sources=None,
+    session=None,
+):
+    """Send data objects to a Dataverse dataset via direct upload, registering them one by one.
+
+    Files that Dataverse ingests as tabular data are transferred in order but registered after
+    all the others, so that their ingest (which locks the dataset) does not hold up the others.
+
+    Parameters
+    ----------
+    items: iterable
+      iRODSDataObjects meant for publication, e.g. from `staging.stage()`
+    BASE_URL: str
+      class attribute baseURL
+    dsPID: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload step-1 and step-3
+    header_ct: dict
+      the content type for data transmission used in direct upload step-2
+    directoryLabel: str
+      the folder of the files in the dataset
+    ingest: bool
+      whether Dataverse may ingest tabular files, see `wants_ingest()`
+    sources: dict
+      replicas in S3 by iRODS path, to copy server-side, from `s3_copy.find_sources()`
+    session: SessionPool
+      to read each object with a session of the pool, see `from_irods.bound()`
+
+    Returns
+    -------
+    storageIDs: dict
+      Dataverse storage identifier of each registered data object, by iRODS path.
+      Objects that could not be transferred or registered are left out.
+    """
+    import requests
+
+    storageIDs = {}
+
+    def register(item, storageID, md_dict):
+        try:
+            response = register_direct(md_dict, BASE_URL, dsPID, header_key)
+        except (ConnectionError, requests.RequestException) as e:
+            print(f"{item.path} could not be registered: {e}")
+            return
+        if response.status_code != 200:
+            print(f"{item.path} could not be registered: {response.text}")
+        else:
+            storageIDs[item.path] = storageID
+
+    deferred = []
+    for item in items:
+        try:
+            storageID, md_dict = transfer_direct(
+                item,
+                BASE_URL,
+                dsPID,
+                header_key,
+                header_ct,
+                directoryLabel,
+                ingest,
+                (sources or {}).get(item.path),
+                session,
+            )
+        except (ConnectionError, requests.RequestException) as e:
+            print(f"{item.path} could not be transferred: {e}")
+            continue
+        if direct_upload.triggers_ingest(md_dict):
+            deferred.append((item, storageID, md_dict))
+        else:
+            register(item, storageID, md_dict)
+    for item, storageID, md_dict in deferred:
+        register(item, storageID, md_dict)
+
+    return storageIDs
+
+
+def upload_native(
+    item, api, dsPID, trg_path, session, directoryLabel=None, file_id=None
+):
+    """Send a data object to a Dataverse dataset via a local copy.
+
+    Parameters
+    ----------
+    item: iRODSDataObject
+      the object meant for publication
+    api: list
+      Status and pyDataverse object
+    dsPID: str
+      Dataset Persistent Identifier
+    trg_path: str
+      Local directory to save data
+    session: iRODS session
+    directoryLabel: str
+      the folder of the file in the dataset, if any
+    file_id: int
+      Dataverse identifier of the file this object replaces, if any
+
+    Returns
+    -------
+    dfResp: dict
+      API response from the upload
+    """
+
+    # the local copy is not streamed: the object counts as transferred once uploaded
+    with progress.tracker.track(item.path, item.size) as transfer:
+        from_irods.save_df(item, trg_path, session, api.base_url)
+        if file_id is None:
+            dfResp = to_dataverse.deposit_df(
+                api, dsPID, item.name, trg_path, directoryLabel
+            )
+        else:
+            dfResp = to_dataverse.replace_df(api, file_id, item.name, trg_path)
+        transfer.add(item.size)
+
+    return dfResp
+
+
+def upload_objects(
+    items,
+    strategy,
+    api,
+    dsPID,
+    header_key,
+    header_ct,
+    session=None,
+    trg_path=None,
+    ingest=True,
+    sources=None,
+    policy=None,
+    workers=4,
+    engine=None,
+    stop=None,
+):
+    """Send data objects to a Dataverse dataset with a transfer strategy, and mark them as deposited.
+
+    Parameters
+    ----------
+    items: iterable
+      iRODSDataObjects meant for publication, e.g. from `staging.stage()`
+    strategy: str
+      output of `capabilities.choose_strategy()`: 'native', 'direct-batch' or 'direct'
+    api: list
+      pyDataverse object, with the base URL of the installation
+    dsPID: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload step-1 and step-3
+    header_ct: dict
+      the content type for data transmission used in direct upload step-2
+    session: iRODS session or SessionPool
+      needed with the 'native' strategy; with a pool, each object is read and updated with a
+      session of the pool (see `from_irods.bound()`)
+    trg_path: str
+      local directory to save data, with the 'native' strategy
+    ingest: bool
+      whether Dataverse may ingest tabular files, see `wants_ingest()`
+    sources: dict
+      replicas in S3 by iRODS path, to copy server-side, from `s3_copy.find_sources()`
+    policy: str
+      with 'direct-batch', send the objects with `workers` threads in the order of this
+      scheduling policy (see `upload_direct_scheduled()`) rather than one after the other.
+      The objects are ordered in waves, as they arrive: a staged object is not weighed
+      against the objects sent before it came online.
+    workers: int
+      number of threads with a scheduling policy
+    engine: str
+      'async' to send the direct uploads concurrently from an event loop rather than from
+      threads (see `async_upload.upload_many()`); the files are registered in batches with
+      'direct-batch', one by one otherwise
+    stop: threading.Event
+      once it is set, e.g. when the lease on the objects is lost, the objects that are not
+      sent yet are left out
+
+    Returns
+    -------
+    deposited: list
+      the data objects deposited in the dataset
+    """
+
+    BASE_URL = api.base_url
+    stop = stop or threading.Event()
+    # the objects as they are sent, e.g. in the order in which they come online
+    seen = []
+
+    def feed():
+        for item in items:
+            if stop.is_set():
+                return
+            seen.append(item)
+            yield item
+
+    if engine == "async" and strategy != "native":
+        from irods2dataverse import async_upload
+
+        results = async_upload.run_uploads(
+            feed(),
+            BASE_URL,
+            dsPID,
+            header_key,
+            header_ct,
+            batch_size=100 if strategy == "direct-batch" else None,
+            ingest=ingest,
+            sources=sources,
+            session=session,
+            stop=stop,
+        )
+        deposited = []
+        for item in seen:
+            if item.path not in results:
+                continue
+            if isinstance(results[item.path], Exception):
+                print(f"{item.path} could not be uploaded: {results[item.path]}")
+            else:
+                # already marked by `upload_many()`
+                deposited.append(item)
+        return deposited
+    if strategy == "native":
+        deposited = []
+        for item in feed():
+            # Save data locally and upload file(s)
+            upload_native(item, api, dsPID, trg_path, session)
+            mark_deposited(item, session=session)
+            deposited.append(item)
+        return deposited
+    options = dict(ingest=ingest, sources=sources, session=session)
+    if strategy == "direct-batch" and policy:
+        storageIDs = upload_direct_scheduled(
+            feed(),
+            BASE_URL,
+            dsPID,
+            header_key,
+            header_ct,
+            policy=policy,
+            workers=workers,
+            stop=stop,
+            **options,
+        )
+    elif strategy == "direct-batch":
+        storageIDs = upload_direct_batch(
+            feed(), BASE_URL, dsPID, header_key, header_ct, **options
+        )
+    else:
+        # registered one by one, tabular files last
+        storageIDs = upload_direct_deferred(
+            feed(), BASE_URL, dsPID, header_key, header_ct, **options
+        )
+    deposited = [x for x in seen if x.path in storageIDs]
+    for item in deposited:
+        mark_deposited(item, storageIDs[item.path], session)
+
+    return deposited
+
+
+def mark_deposited(item, storageID=None, session=None):
+    """Update the metadata of a data object once it is in Dataverse.
+
+    Parameters
+    ----------
+    item: iRODSDataObject
+      the object sent to Dataverse
+    storageID: str
+      Dataverse storage identifier, for direct uploads
+    session: SessionPool
+      to update the object with a session of the pool, see `from_irods.bound()`
+    """
+
+    with from_irods.bound(item, session) as item:
+        # Update status of publication in iRODS from 'processed' to 'deposited'
+        from_irods.save_md(item, atr_publish, "deposited", op="set")
+        # Update timestamp
+        from_irods.save_md(
+            item, "dv.publication.timestamp", datetime.datetime.now(), op="set"
+        )
+        if storageID is not None:
+            # TO DO: for the metadata that are added and not set, make a repeatable composite field to group them together
+            from_irods.save_md(item, "dv.df.storageIdentifier", storageID, op="add")
+
+
+def add_doi(item, dsPID):
+    """Record the dataset of a data object ('dv.ds.DOI'), unless it is recorded already.
+
+    Parameters
+    ----------
+    item: iRODSDataObject
+      the object sent to Dataverse
+    dsPID: str
+      Dataset Persistent Identifier
+    """
+
+    if dsPID not in {x.value for x in item.metadata.get_all("dv.ds.DOI")}:
+        from_irods.save_md(item, "dv.ds.DOI", dsPID, op="add")
+
+
+def compare_files(data_objects, ds_files, root=None):
+    """Compare data objects with the files of a Dataverse dataset.
+
+    Objects are matched to files by their path relative to `root`. Files deposited
+    under a different folder (e.g. the default folder of a first deposit) are still matched
+    if their file name is unique: they keep their folder in the dataset.
+    Matched objects are compared by checksum; when the algorithms differ the object
+    is considered modified.
+
+    Parameters
+    ----------
+    data_objects: list
+      iRODSDataObjects meant for publication
+    ds_files: dict
+      files of the dataset, output of `to_dataverse.list_ds_files()`
+    root: str
+      iRODS collection corresponding to the root of the dataset.
+      By default, the deepest collection common to all the objects.
+
+    Returns
+    -------
+    changes: dict
+      Lists of `(item, path, ds_file)` tuples, with the path of the object in the dataset,
+      under 'new', 'modified', 'unchanged' and 'moved' (unchanged, in another folder),
+      and the files that have no data object under 'removed'.
+    """
+
+    if root is None:
+        root = common_root(data_objects)
+    unmatched = dict(ds_files)
+    changes = {"new": [], "modified": [], "unchanged": [], "moved": [], "removed": []}
+    for item in data_objects:
+        path = from_irods.get_relative_path(item, root)
+        if path not in unmatched:
+            same_name = [k for k, v in unmatched.items() if v["label"] == item.name]
+            path_in_ds = same_name[0] if len(same_name) == 1 else None
+        else:
+            path_in_ds = path
+        if path_in_ds is None:
+            changes["new"].append((item, path, None))
+            continue
+        ds_file = unmatched.pop(path_in_ds)
+        if not from_irods.same_checksum(
+            from_irods.get_checksum(item), ds_file["checksum"]
+        ):
+            changes["modified"].append((item, path_in_ds, ds_file))
+        elif path_in_ds != path:
+            changes["moved"].append((item, path_in_ds, ds_file))
+        else:
+            changes["unchanged"].append((item, path, ds_file))
+    changes["removed"] = list(unmatched.values())
+
+    return changes
+
+
+def common_root(data_objects):
+    """Get the deepest collection that contains all the data objects.
+
+    Parameters
+    ----------
+    data_objects: list
+      iRODSDataObjects meant for publication
+
+    Returns
+    -------
+    root: str
+      iRODS path of the collection
+    """
+    return posixpath.commonpath([posixpath.dirname(x.path) for x in data_objects])
+
+
+def sync_ds(
+    data_objects,
+    api,
+    dsPID,
+    BASE_URL,
+    header_key,
+    header_ct,
+    root=None,
+    delete=False,
+    trg_path=None,
+    session=None,
+    changes=None,
+):
+    """Bring an existing Dataverse dataset up-to-date with the data objects.
+
+    The files of the dataset are listed once. Only new and modified objects are
+    transferred, modified ones replacing their previous version in its folder. All the
+    objects that are in the dataset afterwards are marked as deposited in it (see
+    `mark_deposited()`), with its DOI.
+
+    Parameters
+    ----------
+    data_objects: list
+      iRODSDataObjects meant for publication
+    api: list
+      Status and pyDataverse object
+    dsPID: str
+      Dataset Persistent Identifier
+    BASE_URL: str
+      class attribute baseURL
+    header_key: dict
+      the token used in direct upload step-1 and step-3
+    header_ct: dict
+      the content type for data transmission used in direct upload step-2
+    root: str
+      iRODS collection corresponding to the root of the dataset
+    delete: bool
+      Whether files of the dataset without data object should be deleted
+    trg_path: str
+      Local directory to save data. If provided, the files are uploaded via a
+      local copy instead of direct upload.
+    session: iRODS session
+      Only needed with `trg_path`
+    changes: dict
+      Output of `compare_files()` for these objects and the dataset, e.g. with only the new and
+      modified objects that fit in its limits (see `plan.make_plan()`). By default, the files of
+      the dataset are listed and compared with all the objects.
+
+    Returns
+    -------
+    changes: dict
+      Output of `compare_files()`
+    """
+
+    if changes is None:
+        ds_files = to_dataverse.list_ds_files(api, dsPID)
+        changes = compare_files(data_objects, ds_files, root)
+    for item, path, ds_file in changes["new"] + changes["modified"]:
+        directoryLabel = posixpath.dirname(path)
+        file_id = None if ds_file is None else ds_file["id"]
+        if trg_path is None:
+            storageID, _ = upload_direct(
+                item,
+                BASE_URL,
+                dsPID,
+                header_key,
+                header_ct,
+                directoryLabel,
+                file_id,
+            )
+        else:
+            upload_native(item, api, dsPID, trg_path, session, directoryLabel, file_id)
+            storageID = None
+        add_doi(item, dsPID)
+        mark_deposited(item, storageID)
+    for item, _, _ in changes["unchanged"] + changes["moved"]:
+        add_doi(item, dsPID)
+        mark_deposited(item)
+    if delete:
+        for ds_file in changes["removed"]:
+            response = direct_upload.delete_from_ds(BASE_URL, ds_file["id"], header_key)
+            if response.status_code != 200:
+                print(f"{ds_file['label']} could not be deleted: {response.text}")
+
+    return changes
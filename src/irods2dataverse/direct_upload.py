@@ -1,4 +1,27 @@
-import requests
+import json
+import time
+from irods2dataverse import metrics, mime, streams
+from irods2dataverse.redirect import redirector
+
+# formats that Dataverse ingests as tabular data, locking the dataset meanwhile
+TABULAR_MIMETYPES = frozenset(
+    {
+        "text/csv",
+        "text/comma-separated-values",
+        "text/tab-separated-values",
+        "text/tsv",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "application/x-spss-sav",
+        "application/x-spss-por",
+        "application/x-stata",
+        "application/x-stata-13",
+        "application/x-stata-14",
+        "application/x-stata-15",
+        "application/x-rlang-transport",
+    }
+)
+# seconds to wait for the lock of a dataset (e.g. during ingest) before giving up
+LOCK_TIMEOUT = 600
 
 
 def create_headers(token):
@@ -45,14 +68,43 @@ def get_du_url(BASE_URL, dv_ds_DOI, df_size, header_key):
 
     Returns
     -------
-    response1: json
-      json response of GET request for direct upload
     fileURL: str
       Dataverse URL for the iRODS object meant for publication
     strorageID: str
       Dataverse storage identified
     """
 
+    data = request_upload(BASE_URL, dv_ds_DOI, df_size, header_key)
+    # save the url
+    fileURL = data["url"]
+    strorageID = data["storageIdentifier"]
+
+    return fileURL, strorageID
+
+
+@metrics.timed("upload_url")
+def request_upload(BASE_URL, dv_ds_DOI, df_size, header_key):
+    """GET request for direct upload, for single or multipart uploads
+
+    Parameters
+    ----------
+    BASE_URL: str
+      class attribute baseURL
+    dv_ds_DOI: str
+      Dataset Persistent Identifier
+    df_size: int
+      size of iRODS object
+    header_key: dict
+      the token used in direct upload
+
+    Returns
+    -------
+    data: dict
+      'storageIdentifier' and either the 'url' of a single upload, or the 'urls' of the parts
+      (by part number), 'partSize' and the 'complete' and 'abort' paths of a multipart upload
+    """
+    import requests
+
     # request file direct upload
     response = requests.get(
         f"{BASE_URL}/api/datasets/:persistentId/uploadurls?persistentId={dv_ds_DOI}&size={df_size}",
@@ -62,15 +114,20 @@ def get_du_url(BASE_URL, dv_ds_DOI, df_size, header_key):
     # print(str(response1))  # <Response [200]> ==> for user script
     if response.status_code != 200:
         raise ConnectionError("Something went wrong", response)
-    # save the url
-    data = response.json()["data"]
-    fileURL = data["url"]
-    strorageID = data["storageIdentifier"]
 
-    return fileURL, strorageID
+    return response.json()["data"]
 
 
-def put_in_s3(obj, fileURL, headers_ct):
+@metrics.timed("transfer")
+def put_in_s3(
+    obj,
+    fileURL,
+    headers_ct,
+    block_size=None,
+    installation=None,
+    head=None,
+    progress=None,
+):
     """PUT request for direct upload
 
     Parameters
@@ -81,28 +138,122 @@ def put_in_s3(obj, fileURL, headers_ct):
       Dataverse URL for the iRODS object meant for publication
     headers_ct: dict
       the content type for data transmission used in direct upload step-2
+    block_size: int
+      size of the blocks read from iRODS, by default `streams.BLOCK_SIZE`
+    installation: str
+      URL of the Dataverse installation, whose budget of throughput the transfer counts against
+    head: callable
+      called with the first bytes of the object (up to `mime.SNIFF_SIZE`), e.g. to detect its
+      MIME type without reading them again
+    progress: callable
+      called with the number of bytes of each read from iRODS, e.g. `progress.Transfer.add`
 
     Returns
     -------
     response2: json
       json response of PUT request for direct upload
     """
+    import requests
 
-    # open the iRODS object
-    with obj.open("r") as data:
+    # open the iRODS object (on its resource server if possible), read ahead in large blocks
+    with redirector.open(obj, installation=installation) as f, streams.ReadAheadReader(
+        f, obj.size, block_size, progress
+    ) as data:
+        if head is not None:
+            head(data.peek(mime.SNIFF_SIZE))
         # PUT the file in S3
         response = requests.put(
             fileURL,
             headers=headers_ct,
             data=data,
         )
+    if response.status_code == 200:
+        metrics.count("bytes_uploaded", obj.size)
     # # verify status
     # print(str(response2))  # <Response [200]>  ==> for user script
 
     return response
 
 
-def create_du_md(storageID, objName, objMimetype, objChecksum):
+@metrics.timed("transfer")
+def put_parts_in_s3(
+    obj,
+    data,
+    BASE_URL,
+    headers_ct,
+    header_key,
+    block_size=None,
+    head=None,
+    progress=None,
+):
+    """PUT requests for a multipart direct upload
+
+    The parts are sent one after the other, each read ahead from its offset in the
+    iRODS object. The upload is completed when all parts are stored, or aborted.
+
+    Parameters
+    ----------
+    obj: iRODSDataObject
+      the object meant for publication
+    data: dict
+      output of `request_upload()` for a multipart upload
+    BASE_URL: str
+      class attribute baseURL
+    headers_ct: dict
+      the content type for data transmission used in direct upload step-2
+    header_key: dict
+      the token used to complete or abort the upload
+    block_size: int
+      size of the blocks read from iRODS, by default `streams.BLOCK_SIZE`
+    head: callable
+      called with the first bytes of the object, see `put_in_s3()`
+    progress: callable
+      called with the number of bytes of each read from iRODS, see `put_in_s3()`
+
+    Returns
+    -------
+    response: json
+      json response of the request completing the upload, or of the failed PUT request
+    """
+    import requests
+
+    part_size = int(data["partSize"])
+    etags = {}
+    for number, url in sorted(data["urls"].items(), key=lambda x: int(x[0])):
+        offset = (int(number) - 1) * part_size
+        if offset >= obj.size and etags:
+            # the size requested for the upload can be larger than the object
+            break
+        length = min(part_size, obj.size - offset)
+        with redirector.open(obj, length, BASE_URL) as f:
+            f.seek(offset)
+            with streams.ReadAheadReader(f, length, block_size, progress) as part:
+                if head is not None and offset == 0:
+                    head(part.peek(mime.SNIFF_SIZE))
+                response = requests.put(url, headers=headers_ct, data=part)
+        if response.status_code != 200:
+            requests.delete(f"{BASE_URL}{data['abort']}", headers=header_key)
+            return response
+        etags[number] = response.headers["ETag"]
+    response = requests.put(
+        f"{BASE_URL}{data['complete']}",
+        headers=header_key,
+        data=json.dumps(etags),
+    )
+    if response.status_code == 200:
+        metrics.count("bytes_uploaded", obj.size)
+
+    return response
+
+
+def create_du_md(
+    storageID,
+    objName,
+    objMimetype,
+    objChecksum,
+    directoryLabel="data/subdir1",
+    tabIngest=True,
+):
     """Create direct upload metadata dictionary
 
     Parameters
@@ -113,8 +264,12 @@ def create_du_md(storageID, objName, objMimetype, objChecksum):
       the name of the object to be stored
     objMimetype: str
       mimetype of iRODS object
-    objSize: str
-      size of iRODS object
+    objChecksum: str
+      SHA-256 checksum value of iRODS object
+    directoryLabel: str
+      the folder of the file in the dataset
+    tabIngest: bool
+      whether Dataverse may ingest the file if it is tabular
 
     Returns
     -------
@@ -124,7 +279,7 @@ def create_du_md(storageID, objName, objMimetype, objChecksum):
 
     obj_md_dict = {
         "description": "This is the description of the directly uploaded file.",  # TO DO: get from iRODS metadata
-        "directoryLabel": "data/subdir1",  # TO DO: get from iRODS, based on the path of the file in a dataset
+        "directoryLabel": directoryLabel,
         "categories": ["Data"],
         "restrict": "false",
         "storageIdentifier": storageID,
@@ -132,10 +287,106 @@ def create_du_md(storageID, objName, objMimetype, objChecksum):
         "mimeType": objMimetype,
         "checksum": {"@type": "SHA-256", "@value": objChecksum},
     }
+    if not directoryLabel:
+        # files at the root of the dataset have no folder
+        del obj_md_dict["directoryLabel"]
+    if not tabIngest:
+        obj_md_dict["tabIngest"] = "false"
 
     return obj_md_dict
 
 
+def triggers_ingest(obj_md_dict):
+    """Whether registering a file starts a tabular ingest, which locks the dataset.
+
+    Parameters
+    ----------
+    obj_md_dict: dict
+      output of `create_du_md()`
+
+    Returns
+    -------
+    bool
+    """
+    return (
+        obj_md_dict.get("mimeType") in TABULAR_MIMETYPES
+        and obj_md_dict.get("tabIngest") != "false"
+    )
+
+
+def is_locked(response):
+    """Whether a request failed because the dataset is locked, e.g. by an ingest."""
+    return response.status_code == 409 or (
+        response.status_code in (400, 403) and "lock" in response.text.lower()
+    )
+
+
+def get_locks(BASE_URL, dv_ds_DOI, header_key):
+    """GET request for the locks of a dataset
+
+    Parameters
+    ----------
+    BASE_URL: str
+      class attribute baseURL
+    dv_ds_DOI: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload
+
+    Returns
+    -------
+    locks: list
+      the locks of the dataset, e.g. `{"lockType": "Ingest", ...}`
+    """
+    import requests
+
+    response = requests.get(
+        f"{BASE_URL}/api/datasets/:persistentId/locks?persistentId={dv_ds_DOI}",
+        headers=header_key,
+    )
+    if response.status_code != 200:
+        raise ConnectionError("The locks of the dataset could not be read", response)
+
+    return response.json()["data"]
+
+
+@metrics.timed("lock_wait")
+def wait_for_unlock(
+    BASE_URL, dv_ds_DOI, header_key, timeout=LOCK_TIMEOUT, interval=0.5
+):
+    """Wait until a dataset has no locks, polling less and less often (up to every 10 seconds).
+
+    Parameters
+    ----------
+    BASE_URL: str
+      class attribute baseURL
+    dv_ds_DOI: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload
+    timeout: float
+      seconds after which to give up
+    interval: float
+      seconds before the first check
+
+    Returns
+    -------
+    unlocked: bool
+      False if the dataset is still locked after `timeout`
+    """
+
+    deadline = time.monotonic() + timeout
+    while get_locks(BASE_URL, dv_ds_DOI, header_key):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, 10)
+
+    return True
+
+
+@metrics.timed("registration")
 def post_to_ds(obj_md_dict, BASE_URL, dv_ds_DOI, header_key):
     """POST request for direct upload
 
@@ -155,6 +406,7 @@ def post_to_ds(obj_md_dict, BASE_URL, dv_ds_DOI, header_key):
     response3:  json
       json response of POST request for direct upload
     """
+    import requests
 
     # create a dictionary for jsonData
     files = {
@@ -170,3 +422,101 @@ def post_to_ds(obj_md_dict, BASE_URL, dv_ds_DOI, header_key):
     # print(str(response3))  # <Response [200]> ==> for user script
 
     return response
+
+
+@metrics.timed("registration")
+def post_many_to_ds(obj_md_list, BASE_URL, dv_ds_DOI, header_key):
+    """POST request to register several directly uploaded files at once (`addFiles`)
+
+    Parameters
+    ----------
+    obj_md_list: list
+      the metadata dictionaries of the files meant for publication
+    BASE_URL: str
+      class attribute baseURL
+    dv_ds_DOI: str
+      Dataset Persistent Identifier
+    header_key: dict
+      the token used in direct upload
+
+    Returns
+    -------
+    response:  json
+      json response of POST request, with the outcome of each file
+    """
+    import requests
+
+    files = {
+        "jsonData": (None, json.dumps(obj_md_list)),
+    }
+    response = requests.post(
+        f"{BASE_URL}/api/datasets/:persistentId/addFiles?persistentId={dv_ds_DOI}",
+        headers=header_key,
+        files=files,
+    )
+
+    return response
+
+
+@metrics.timed("registration")
+def replace_in_ds(obj_md_dict, BASE_URL, file_id, header_key):
+    """POST request to replace a file of a dataset with a directly uploaded one
+
+    Parameters
+    ----------
+    obj_md_dict: dict
+      the metadata dictionary for the new version of the file
+    BASE_URL: str
+      class attribute baseURL
+    file_id: int
+      Dataverse identifier of the file to replace
+    header_key: dict
+      the token used in direct upload
+
+    Returns
+    -------
+    response:  json
+      json response of POST request for the replacement
+    """
+    import requests
+
+    # the file name or content type may change with the new version
+    obj_md_dict = dict(obj_md_dict, forceReplace="true")
+    files = {
+        "jsonData": (None, json.dumps(obj_md_dict)),
+    }
+    response = requests.post(
+        f"{BASE_URL}/api/files/{file_id}/replace",
+        headers=header_key,
+        files=files,
+    )
+
+    return response
+
+
+@metrics.timed("deletion")
+def delete_from_ds(BASE_URL, file_id, header_key):
+    """DELETE request to remove a file from the draft version of a dataset
+
+    Parameters
+    ----------
+    BASE_URL: str
+      class attribute baseURL
+    file_id: int
+      Dataverse identifier of the file to delete
+    header_key: dict
+      the token used in direct upload
+
+    Returns
+    -------
+    response:  json
+      json response of DELETE request
+    """
+    import requests
+
+    response = requests.delete(
+        f"{BASE_URL}/api/files/{file_id}",
+        headers=header_key,
+    )
+
+    return response
@@ -0,0 +1,208 @@
+import os
+import json
+import argparse
+import datetime
+import time
+from irods2dataverse import from_irods, metrics
+from irods2dataverse.session_pool import checkout
+
+atr_publish = "dv.publication"
+# seconds between two full scans (see `discover`)
+FULL_SCAN_EVERY = 3600
+
+
+class Watermark:
+    """Position of incremental discovery: the latest modify time seen and the objects seen at that time.
+
+    Objects tagged within the same second as the watermark are told apart by their id, so that
+    nothing is missed or yielded twice when polling while objects are being tagged. The time of
+    the latest full scan (see `discover`) is kept with it.
+
+    Args:
+        path (str): JSON file where the watermark is stored. It is created when first saved.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.modify_time = 0
+        self.ids = set()
+        self.scanned_at = 0
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.modify_time = data["modify_time"]
+            self.ids = set(data["ids"])
+            self.scanned_at = data.get("scanned_at", 0)
+
+    def is_new(self, modify_time, obj_id):
+        """Whether an object tagged at `modify_time` (epoch seconds) has not been seen yet."""
+        if modify_time != self.modify_time:
+            return modify_time > self.modify_time
+        return obj_id not in self.ids
+
+    def advance(self, modify_time, obj_id):
+        """Mark an object as seen; the times must be given in increasing order."""
+        if modify_time > self.modify_time:
+            self.modify_time = modify_time
+            self.ids = set()
+        if modify_time == self.modify_time:
+            self.ids.add(obj_id)
+
+    def save(self):
+        """Store the watermark, replacing the file atomically."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "modify_time": self.modify_time,
+                    "ids": sorted(self.ids),
+                    "scanned_at": self.scanned_at,
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
+
+
+def epoch(value):
+    """Epoch seconds of a catalog time, as returned by python-irodsclient."""
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+    return int(value)
+
+
+@metrics.timed("discovery")
+def query_changes(atr, val, session, since=0):
+    """iRODS query of the data objects whose publication metadata changed since a given time.
+
+    Parameters
+    ----------
+    atr: str
+      the metadata attribute describing the status of publication
+    val: str
+      the metadata value describing the status of publication
+    session: iRODS session or SessionPool
+    since: int
+      epoch seconds; only metadata modified at or after this time is returned
+
+    Returns
+    -------
+    changes: list
+      `(modify time, object id, path)` tuples, sorted by modify time and id
+    """
+    from irods.column import Criterion
+    from irods.models import Collection, DataObject, DataObjectMeta
+
+    changes = {}
+    with checkout(session) as session:
+        query = (
+            session.query(
+                Collection.name,
+                DataObject.name,
+                DataObject.id,
+                DataObjectMeta.modify_time,
+            )
+            .filter(Criterion("=", DataObjectMeta.name, atr))
+            .filter(Criterion("=", DataObjectMeta.value, val))
+            .filter(
+                Criterion(
+                    ">=",
+                    DataObjectMeta.modify_time,
+                    datetime.datetime.fromtimestamp(since, datetime.timezone.utc),
+                )
+            )
+        )
+        for item in query:
+            path = f"{item[Collection.name]}/{item[DataObject.name]}"
+            obj_id = int(item[DataObject.id])
+            modify_time = epoch(item[DataObjectMeta.modify_time])
+            # one row per replica: keep one per object
+            changes[obj_id] = (modify_time, obj_id, path)
+    return sorted(changes.values())
+
+
+def discover(atr, val, session, watermark, full_scan_every=FULL_SCAN_EVERY):
+    """Yield the data objects newly tagged for publication since the previous call.
+
+    Only the metadata modified since the watermark is queried, so polling costs a single,
+    nearly empty query when nothing changed. The watermark moves past an object once the
+    next one is requested, and is saved when the generator is exhausted or closed: an object
+    whose processing failed (the consumer raised while handling it) is yielded again next time.
+
+    The modify time of the query is the one of the AVU, not of its association with the object:
+    iRODS shares an AVU between all the objects that have it, so tagging an object with an AVU
+    that already exists (e.g. `dv.publication: initiated` on another object) keeps the time of
+    its creation, before the watermark. To catch these, a full scan is done every
+    `full_scan_every` seconds instead of the incremental query: it yields all the objects that
+    still have the status, including ones already yielded but not processed yet.
+
+    Parameters
+    ----------
+    atr: str
+      the metadata attribute describing the status of publication, e.g. 'dv.publication'
+    val: str
+      the metadata value describing the status of publication, e.g. 'initiated'
+    session: iRODS session or SessionPool
+    watermark: Watermark or str
+      the watermark, or the path of its JSON file
+    full_scan_every: float
+      seconds between two full scans; 0 scans on every call, None never does
+
+    Yields
+    ------
+    obj: iRODSDataObject
+      data object destined for publication
+    """
+    if not isinstance(watermark, Watermark):
+        watermark = Watermark(watermark)
+    now = time.time()
+    full = full_scan_every is not None and now - watermark.scanned_at >= full_scan_every
+    changes = query_changes(atr, val, session, 0 if full else watermark.modify_time)
+    try:
+        for modify_time, obj_id, path in changes:
+            missed = full and modify_time < watermark.modify_time
+            if not (missed or watermark.is_new(modify_time, obj_id)):
+                continue
+            with checkout(session) as s:
+                obj = s.data_objects.get(path)
+            yield obj
+            watermark.advance(modify_time, obj_id)
+        if full:
+            watermark.scanned_at = now
+    finally:
+        watermark.save()
+
+
+if __name__ == "__main__":
+    """Polling of newly tagged data: this can be run e.g. every minute by a scheduler."""
+    parser = argparse.ArgumentParser(
+        description="Print the data objects tagged for publication since the previous run."
+    )
+    parser.add_argument("watermark", help="Path of the JSON file with the watermark.")
+    parser.add_argument(
+        "-e",
+        "--environment",
+        default=os.path.expanduser("~/.irods/irods_environment.json"),
+        help="Path to the iRODS environment file.",
+    )
+    parser.add_argument(
+        "-v",
+        "--value",
+        default="initiated",
+        help="Publication status to look for.",
+    )
+    parser.add_argument(
+        "--full-scan-every",
+        type=float,
+        default=FULL_SCAN_EVERY,
+        help="Seconds between two full scans, which find the objects tagged with an existing AVU.",
+    )
+    args = parser.parse_args()
+
+    session = from_irods.authenticate_iRODS(args.environment)
+    if not session:
+        raise SystemExit(1)
+    for obj in discover(
+        atr_publish, args.value, session, args.watermark, args.full_scan_every
+    ):
+        print(obj.path)
+    session.cleanup()
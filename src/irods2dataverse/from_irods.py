@@ -1,10 +1,11 @@
 import os
 import json
-import magic
-from irods.session import iRODSSession
-from irods.column import Criterion
-from irods.models import Collection, DataObject, DataObjectMeta
-import irods.keywords as kw
+import base64
+import posixpath
+from contextlib import contextmanager
+from irods2dataverse import metrics, mime
+from irods2dataverse.redirect import redirector
+from irods2dataverse.session_pool import SessionPool, checkout
 
 
 def authenticate_iRODS(env_path):
@@ -19,6 +20,8 @@ def authenticate_iRODS(env_path):
     -------
     session: iRODS session / or False
     """
+    from irods.session import iRODSSession
+
     if os.path.exists(env_path):
         env_file = os.getenv("iRODS_ENVIRONMENT_FILE", env_path)
         session = iRODSSession(irods_env_file=env_file)
@@ -39,8 +42,75 @@ def authenticate_iRODS(env_path):
         return False
 
 
+def authenticate_pool(env_path, size=4):
+    """Create a pool of iRODS sessions for parallel work, in the zone specified in the environment file.
+
+    Parameters
+    ----------
+    env_path: str
+      The filename and location of the JSON specification for the iRODS environment
+    size: int
+      Maximum number of sessions
+
+    Returns
+    -------
+    pool: SessionPool / or False
+      A pool that can be passed as `session` to the functions of this module
+    """
+    if not os.path.exists(env_path):
+        print(
+            "The environment file does not exist please make sure the client is configured correctly"
+        )
+        return False
+    try:
+        pool = SessionPool(env_path, size)
+        with pool.session() as session:
+            pool.check(session)
+    except:
+        print(
+            "Invalid authentication please make sure the client is configured correctly"
+        )
+        return False
+    return pool
+
+
+@metrics.timed("discovery")
+def query_paths(atr, val, session):
+    """iRODS query to get the paths of the data objects destined for publication based on metadata.
+
+    Parameters
+    ----------
+    atr: str
+      the metadata attribute describing the status of publication
+    val: str
+      the metadata value describing the status of publication, one of 'initiated', 'processed', 'deposited', 'published'
+    session: iRODS session or SessionPool
+
+    Returns
+    -------
+    paths: list
+      sorted iRODS paths of the data objects
+    """
+    from irods.column import Criterion
+    from irods.models import Collection, DataObject, DataObjectMeta
+
+    with checkout(session) as session:
+        qobj = (
+            session.query(Collection.name, DataObject.name)
+            .filter(Criterion("=", DataObjectMeta.name, atr))
+            .filter(Criterion("=", DataObjectMeta.value, val))
+        )
+        paths = {f"{item[Collection.name]}/{item[DataObject.name]}" for item in qobj}
+    return sorted(paths)
+
+
 def query_data(atr, val, session):
     """iRODS query to get the data objects destined for publication based on metadata.
+
+    The data objects are bound to `session`. With a SessionPool, use `query_paths()` and get the
+    objects with a session checked out for as long as they are used, or pass the pool to the
+    functions that use them (see `bound()`).
+
     Parameters
     ----------
     atr: str
@@ -54,17 +124,120 @@ def query_data(atr, val, session):
     lobj: list
       list of the data object(s) including iRODS path
     """
+    if isinstance(session, SessionPool):
+        raise TypeError(
+            "The data objects would be bound to a session given back to the pool: use query_paths()."
+        )
+    return [session.data_objects.get(path) for path in query_paths(atr, val, session)]
+
+
+@contextmanager
+def bound(obj, session=None):
+    """Use a data object with a session of a pool for the duration of a block.
+
+    A data object keeps the session it was fetched with. Once that session is back in a pool,
+    other threads can use it at the same time: with a SessionPool, the object is fetched again
+    with a session checked out for the block. Otherwise, the object is used as it is.
+
+    Parameters
+    ----------
+    obj: iRODSDataObject
+    session: iRODS session or SessionPool
+
+    Yields
+    ------
+    obj: iRODSDataObject
+      the data object, bound to a session that no other thread uses during the block
+    """
+    if not isinstance(session, SessionPool):
+        yield obj
+        return
+    with session.session() as s:
+        yield s.data_objects.get(obj.path)
+
+
+@metrics.timed("discovery")
+def query_md(atr, val, attributes, session):
+    """iRODS query to get the metadata of all the data objects in a given publication status.
+
+    A single query retrieves the status attribute together with the requested attributes,
+    without fetching the data objects themselves.
+
+    Parameters
+    ----------
+    atr: str
+      the metadata attribute describing the status of publication
+    val: str or list
+      the metadata value(s) describing the status of publication
+    attributes: list
+      the metadata attributes to retrieve, e.g. 'dv.ds.DOI'
+    session: iRODS session or SessionPool
+
+    Returns
+    -------
+    dmd: dict
+      for each iRODS path, a dictionary with the list of values of each attribute
+    """
+    from irods.column import In
+    from irods.models import Collection, DataObject, DataObjectMeta
 
-    qobj = (
-        session.query(Collection.name, DataObject.name)
-        .filter(Criterion("=", DataObjectMeta.name, atr))
-        .filter(Criterion("=", DataObjectMeta.value, val))
-    )
-    lobj = set(
-        session.data_objects.get(f"{item[Collection.name]}/{item[DataObject.name]}")
-        for item in qobj
-    )
-    return list(lobj)  # qobj
+    vals = [val] if isinstance(val, str) else val
+
+    dmd = {}
+    with checkout(session) as session:
+        qmd = session.query(
+            Collection.name, DataObject.name, DataObjectMeta.name, DataObjectMeta.value
+        ).filter(In(DataObjectMeta.name, [atr, *attributes]))
+        for item in qmd:
+            path = f"{item[Collection.name]}/{item[DataObject.name]}"
+            avus = dmd.setdefault(path, {})
+            avus.setdefault(item[DataObjectMeta.name], []).append(
+                item[DataObjectMeta.value]
+            )
+    return {k: v for k, v in dmd.items() if set(vals) & set(v.get(atr, []))}
+
+
+@metrics.timed("discovery")
+def query_checksums(atr, val, session):
+    """iRODS query to get the catalog checksums of the data objects in a given publication status.
+
+    Parameters
+    ----------
+    atr: str
+      the metadata attribute describing the status of publication
+    val: str or list
+      the metadata value(s) describing the status of publication
+    session: iRODS session or SessionPool
+
+    Returns
+    -------
+    dchksum: dict
+      for each iRODS path, the checksum of a good replica, or `None` if no replica has a checksum
+    """
+    from irods.column import Criterion, In
+    from irods.models import Collection, DataObject, DataObjectMeta
+
+    vals = [val] if isinstance(val, str) else val
+    dchksum = {}
+    with checkout(session) as session:
+        qchksum = (
+            session.query(
+                Collection.name,
+                DataObject.name,
+                DataObject.checksum,
+                DataObject.replica_status,
+            )
+            .filter(Criterion("=", DataObjectMeta.name, atr))
+            .filter(In(DataObjectMeta.value, vals))
+        )
+        for item in qchksum:
+            path = f"{item[Collection.name]}/{item[DataObject.name]}"
+            good = item[DataObject.replica_status] == "1"
+            if good and item[DataObject.checksum]:
+                dchksum[path] = item[DataObject.checksum]
+            else:
+                dchksum.setdefault(path, None)
+    return dchksum
 
 
 def query_dv(atr, data_objects, installations):
@@ -101,13 +274,20 @@ def query_dv(atr, data_objects, installations):
     return {k: v for k, v in installations_dict.items() if len(v) > 0}
 
 
-def get_object_info(obj):
+def get_object_info(obj, head=None, session=None):
     """Retrieve object information for direct upload.
 
+    The MIME type is only detected from the content of the object if it is not cached for its
+    checksum and not given by its extension (see `mime.detect()`).
+
     Parameters
     ----------
     obj: iRODSDataObject
       the object meant for publication
+    head: bytes
+      the first bytes of the object, if they were already read (e.g. by its upload)
+    session: SessionPool
+      to use the object with a session of the pool, see `bound()`
 
     Returns
     -------
@@ -118,15 +298,14 @@ def get_object_info(obj):
     objSize: str
       size of iRODS object
     """
+    with bound(obj, session) as obj:
+        # Get the checksum value from iRODS
+        with metrics.stage("checksum"):
+            chksumRes = obj.chksum()
+        objChecksum = chksumRes[5:]  # this is algorithm-specific
 
-    # Get the checksum value from iRODS
-    chksumRes = obj.chksum()
-    objChecksum = chksumRes[5:]  # this is algorithm-specific
-
-    # Get the mimetype (from paul, mango portal)
-    with obj.open("r") as f:
-        blub = f.read(50 * 1024)
-        objMimetype = magic.from_buffer(blub, mime=True)
+        # Get the mimetype (from paul, mango portal)
+        objMimetype = mime.detect(obj, chksumRes, head)
 
     # Get the size of the object
     objSize = obj.size + 1  # add 1 byte
@@ -134,7 +313,75 @@ def get_object_info(obj):
     return objChecksum, objMimetype, objSize
 
 
-def save_md(item, atr, val, op):
+def get_checksum(obj):
+    """Get the checksum of a data object, from the catalog if available.
+
+    Parameters
+    ----------
+    obj: iRODSDataObject
+      the object meant for publication
+
+    Returns
+    -------
+    checksum: str
+      checksum as stored in iRODS, e.g. 'sha2:...' (base64) or an MD5 hex digest
+    """
+    checksum = getattr(obj, "checksum", None)
+    if not checksum:
+        with metrics.stage("checksum"):
+            checksum = obj.chksum()
+    return checksum
+
+
+def same_checksum(irods_checksum, dv_checksum):
+    """Compare an iRODS checksum with the checksum of a file in Dataverse.
+
+    Parameters
+    ----------
+    irods_checksum: str
+      checksum as stored in iRODS, e.g. 'sha2:...' (base64) or an MD5 hex digest
+    dv_checksum: dict
+      checksum of a Dataverse file, with keys 'type' and 'value'
+
+    Returns
+    -------
+    same: bool
+      `True` if both checksums use the same algorithm and match. Checksums of
+      different algorithms cannot be compared and return `False`.
+    """
+    if not irods_checksum or not dv_checksum:
+        return False
+    dv_type = dv_checksum.get("type", dv_checksum.get("@type", "")).upper()
+    dv_value = dv_checksum.get("value", dv_checksum.get("@value", ""))
+    if irods_checksum.startswith("sha2:"):
+        if dv_type != "SHA-256":
+            return False
+        b64 = irods_checksum[5:]
+        # direct uploads register the base64 value, Dataverse computes hex digests
+        return dv_value in (b64, base64.b64decode(b64).hex())
+    return dv_type == "MD5" and dv_value.lower() == irods_checksum.lower()
+
+
+def get_relative_path(obj, root):
+    """Get the path of a data object relative to a collection.
+
+    Parameters
+    ----------
+    obj: iRODSDataObject
+      the object meant for publication
+    root: str
+      iRODS path of the collection that corresponds to the root of the dataset
+
+    Returns
+    -------
+    path: str
+      relative path, e.g. 'subcollection/filename'
+    """
+    return posixpath.relpath(obj.path, root)
+
+
+@metrics.timed("avu_writeback")
+def save_md(item, atr, val, op, session=None):
     """Add metadata in iRODS.
 
     Parameters
@@ -145,34 +392,77 @@ def save_md(item, atr, val, op):
         Name of metadata attribute
     val: str
         Value of metadata attribute
-    session: iRODS session
     op: str
         Metadata operation, one of "add" or "set".
+    session: SessionPool
+        to use the object with a session of the pool, see `bound()`
     """
 
     try:
-        if op == "add":
-            item.metadata.add(str(atr), str(val))
-            print(
-                f"Metadata attribute {atr} with value {val}> is added to data object {item}."
-            )
-            return True
-        elif op == "set":
-            item.metadata.set(f"{atr}", f"{val}")
-            print(f"Metadata attribute {atr} is set to <{val}> for data object {item}.")
-            return True
-        else:
-            print(
-                "No valid metadata operation is selected. Specify one of 'add' or 'set'."
-            )
-            return True
+        with bound(item, session) as item:
+            if op == "add":
+                item.metadata.add(str(atr), str(val))
+                print(
+                    f"Metadata attribute {atr} with value {val}> is added to data object {item}."
+                )
+                return True
+            elif op == "set":
+                item.metadata.set(f"{atr}", f"{val}")
+                print(
+                    f"Metadata attribute {atr} is set to <{val}> for data object {item}."
+                )
+                return True
+            else:
+                print(
+                    "No valid metadata operation is selected. Specify one of 'add' or 'set'."
+                )
+                return True
     except Exception as e:  # change this to specific exception
         print(type(e))
         print(f"An error occurred: {e}")
         return False
 
 
-def save_df(data_object, trg_path, session):
+@metrics.timed("avu_writeback")
+def save_md_batch(path, remove, add, session):
+    """Update several metadata items of a data object in a single atomic operation.
+
+    Parameters
+    ----------
+    path: str
+        Path and name of the data object in iRODS
+    remove: list
+        (attribute, value) pairs to remove
+    add: list
+        (attribute, value) pairs to add
+    session: iRODS session or SessionPool
+
+    Returns
+    -------
+    success: bool
+    """
+    from irods.models import DataObject
+    from irods.meta import iRODSMeta, AVUOperation
+
+    operations = [
+        AVUOperation(operation="remove", avu=iRODSMeta(str(atr), str(val)))
+        for atr, val in remove
+    ] + [
+        AVUOperation(operation="add", avu=iRODSMeta(str(atr), str(val)))
+        for atr, val in add
+    ]
+    try:
+        with checkout(session) as session:
+            session.metadata.apply_atomic_operations(DataObject, path, *operations)
+        return True
+    except Exception as e:  # change this to specific exception
+        print(type(e))
+        print(f"An error occurred: {e}")
+        return False
+
+
+@metrics.timed("download")
+def save_df(data_object, trg_path, session, installation=None):
     """Save locally the iRODS data objects destined for publication
 
     Parameters
@@ -183,8 +473,12 @@ def save_df(data_object, trg_path, session):
       Filename of a data object destined for publication
     trg_path: str
       Local directory to save data
-    session: iRODS session
+    session: iRODS session or SessionPool
+    installation: str
+      URL of the Dataverse installation, whose budget of throughput the download counts against
     """
+    import irods.keywords as kw
+
     opts = {kw.FORCE_FLAG_KW: True}
     # TO DO: checksum in case download is not needed?
     """
@@ -196,4 +490,9 @@ def save_df(data_object, trg_path, session):
     def is_contents_same(f1, f2):
         return checksum(f1) == checksum(f2)
     """
-    session.data_objects.get(data_object.path, f"{trg_path}/{data_object.name}", **opts)
+    with checkout(session) as session:
+        # from the resource server if possible
+        redirector.download(
+            session, data_object, f"{trg_path}/{data_object.name}", installation, **opts
+        )
+    metrics.count("bytes_downloaded", data_object.size)
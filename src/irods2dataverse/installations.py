@@ -0,0 +1,105 @@
+import os
+import threading
+import importlib
+from configparser import ConfigParser
+
+# configuration of the Dataverse installations shipped with the package
+CONFIG_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "customization.ini"
+)
+
+
+def config_path():
+    """Path of the configuration of the installations: `IRODS2DATAVERSE_CONFIG` or `CONFIG_PATH`."""
+    return os.getenv("IRODS2DATAVERSE_CONFIG", CONFIG_PATH)
+
+
+class Registry:
+    """Configured Dataverse installations, loaded once and shared by all the threads of a process.
+
+    The configuration is read on first use, wherever the process runs from. For each
+    installation, the Dataset class is imported once, and the API client and the status of the
+    authentication are kept per token. Datasets for many installations can then be prepared
+    concurrently: `new_dataset()` only instantiates the class.
+
+    Args:
+        path (str, optional): Configuration file, with a section per installation giving the
+          `className` of its datasets (e.g. `customClass.DemoDataset`). Defaults to `config_path()`.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._config = None
+        self._classes = {}
+        self._apis = {}
+
+    @property
+    def config(self):
+        """The parsed configuration (ConfigParser)."""
+        with self._lock:
+            if self._config is None:
+                path = self.path or config_path()
+                config = ConfigParser()
+                if not config.read(path):
+                    raise FileNotFoundError(f"The configuration {path} cannot be read.")
+                self._config = config
+            return self._config
+
+    def names(self):
+        """Names of the configured installations, e.g. 'Demo'."""
+        return self.config.sections()
+
+    def __contains__(self, name):
+        return self.config.has_section(name)
+
+    def dataset_class(self, name):
+        """Class of the datasets of an installation; `KeyError` if it is not configured."""
+        with self._lock:
+            if name not in self._classes:
+                modulename, classname = self.config[name]["className"].split(".", 1)
+                module = importlib.import_module(f"irods2dataverse.{modulename}")
+                self._classes[name] = getattr(module, classname)
+            return self._classes[name]
+
+    def new_dataset(self, name):
+        """A new, independent dataset for an installation."""
+        return self.dataset_class(name)()
+
+    def base_url(self, name):
+        """URL of an installation, without trailing slash."""
+        return self.dataset_class(name).baseURL.rstrip("/")
+
+    def authenticate(self, name, token):
+        """Get the API client of an installation for a token, checking the token once.
+
+        Args:
+            name (str): Name of the installation.
+            token (str): Dataverse API token, or `None` for anonymous access.
+
+        Returns:
+            tuple: The HTTP status of the authentication and the pyDataverse NativeApi.
+              Failed authentications are not kept, so that they can be tried again.
+        """
+        from irods2dataverse.to_dataverse import authenticate_DV
+
+        key = (name, token)
+        with self._lock:
+            if key in self._apis:
+                return self._apis[key]
+        status, api = authenticate_DV(self.base_url(name), token)
+        if status == 200:
+            with self._lock:
+                status, api = self._apis.setdefault(key, (status, api))
+        return status, api
+
+    def clear(self):
+        """Forget the configuration and the cached classes and clients, e.g. after editing the file."""
+        with self._lock:
+            self._config = None
+            self._classes.clear()
+            self._apis.clear()
+
+
+# shared by all the datasets of the process
+registry = Registry()
@@ -1,7 +1,4 @@
 import json
-from pyDataverse.api import NativeApi
-from pyDataverse.models import Dataset
-import requests  # http://docs.python-requests.org/en/master/
 
 
 class MetadataBlocks(object):
@@ -72,6 +69,8 @@ class MetadataBlocks(object):
         gets metadatablocks from dataverse
 
         """
+        from pyDataverse.api import NativeApi
+
         self.set_dv_url()
         print(self.dv_url)
         api = NativeApi(self.dv_url, self.dv_api_key)
@@ -123,6 +122,8 @@ class MetadataBlocks(object):
         self.remove_childfields()
 
     def get_datasetSchema(self):
+        import requests
+
         headers = {"X-Dataverse-key": self.dv_api_key}
         self.schema = requests.get(
             f"https://rdr.kuleuven.be/api/dataverses/{self.dv_installation.lower()}/datasetSchema",
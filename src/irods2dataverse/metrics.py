@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import atexit
+import bisect
+import threading
+import inspect
+import functools
+from contextlib import contextmanager, nullcontext
+
+# upper bounds (in seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_enabled = False
+_tracer = None
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+_disabled_stage = nullcontext()
+
+
+def enable(spans=False):
+    """Start recording timings and counters.
+
+    Args:
+        spans (bool, optional): Also emit an OpenTelemetry span per stage. Requires the
+          `opentelemetry-api` package. Defaults to False.
+    """
+    global _enabled, _tracer
+    if spans:
+        from opentelemetry import trace
+
+        _tracer = trace.get_tracer("irods2dataverse")
+    _enabled = True
+
+
+def disable():
+    """Stop recording timings and counters, keeping what was recorded."""
+    global _enabled, _tracer
+    _enabled = False
+    _tracer = None
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """Forget all the recorded timings and counters."""
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def stage(name):
+    """Time a stage of the pipeline, e.g. `with metrics.stage("checksum"): ...`.
+
+    Args:
+        name (str): Name of the stage.
+
+    Returns:
+        contextmanager: Records the duration of the block, or does nothing when disabled.
+    """
+    if not _enabled:
+        return _disabled_stage
+    return _record(name)
+
+
+@contextmanager
+def _record(name):
+    span = _tracer.start_as_current_span(name) if _tracer else nullcontext()
+    with span:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            observe(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator to time each call of a function as a stage.
+
+    Args:
+        name (str): Name of the stage.
+    """
+
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await function(*args, **kwargs)
+                with _record(name):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _record(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def observe(name, seconds):
+    """Add a duration to the histogram of a stage.
+
+    Args:
+        name (str): Name of the stage.
+        seconds (float): Duration.
+    """
+    with _lock:
+        histogram = _stages.get(name)
+        if histogram is None:
+            histogram = _stages[name] = {
+                "count": 0,
+                "sum": 0.0,
+                "max": 0.0,
+                "buckets": [0] * (len(BUCKETS) + 1),
+            }
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+        histogram["max"] = max(histogram["max"], seconds)
+        histogram["buckets"][bisect.bisect_left(BUCKETS, seconds)] += 1
+
+
+def count(name, value=1):
+    """Increase a counter, e.g. the number of bytes uploaded.
+
+    Args:
+        name (str): Name of the counter.
+        value (int, optional): Increment. Defaults to 1.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def snapshot():
+    """Get a copy of the recorded timings and counters.
+
+    Returns:
+        dict: Histograms by stage under "stages" (with the bucket upper bounds under "buckets")
+          and values by counter name under "counters".
+    """
+    with _lock:
+        return {
+            "buckets": list(BUCKETS),
+            "stages": {
+                k: dict(v, buckets=list(v["buckets"])) for k, v in _stages.items()
+            },
+            "counters": dict(_counters),
+        }
+
+
+def to_prometheus(prefix="irods2dataverse"):
+    """Render the recorded timings and counters in the Prometheus text format.
+
+    Args:
+        prefix (str, optional): Prefix of the metric names. Defaults to "irods2dataverse".
+
+    Returns:
+        str: Contents for a file read by the textfile collector of the node exporter.
+    """
+    data = snapshot()
+    lines = [
+        f"# HELP {prefix}_stage_seconds Duration of the stages of the pipeline.",
+        f"# TYPE {prefix}_stage_seconds histogram",
+    ]
+    for name, histogram in sorted(data["stages"].items()):
+        cumulative = 0
+        for bound, n in zip(list(BUCKETS) + ["+Inf"], histogram["buckets"]):
+            cumulative += n
+            lines.append(
+                f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}'
+            )
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {histogram["sum"]}')
+        lines.append(
+            f'{prefix}_stage_seconds_count{{stage="{name}"}} {histogram["count"]}'
+        )
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        lines.append(f"{prefix}_{name}_total {value}")
+    return "\n".join(lines) + "\n"
+
+
+def export(path):
+    """Write the recorded timings and counters to a file.
+
+    Args:
+        path (str): Path of the output file. If it ends with ".json", the output of `snapshot()`
+          is written as JSON, otherwise the Prometheus text format is used.
+    """
+    with open(path, "w") as f:
+        if path.endswith(".json"):
+            json.dump(snapshot(), f, indent=4)
+        else:
+            f.write(to_prometheus())
+
+
+# Switch for production runs without changes in the code:
+# IRODS2DATAVERSE_METRICS=/path/to/metrics.prom (or .json) records and exports at exit.
+if os.getenv("IRODS2DATAVERSE_METRICS"):
+    enable(spans=os.getenv("IRODS2DATAVERSE_SPANS", "") not in ("", "0"))
+    atexit.register(export, os.environ["IRODS2DATAVERSE_METRICS"])
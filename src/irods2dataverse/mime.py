@@ -0,0 +1,176 @@
+import os
+import json
+import atexit
+import posixpath
+import threading
+from irods2dataverse import metrics
+from irods2dataverse.redirect import redirector
+
+# bytes of the start of a data object given to libmagic
+SNIFF_SIZE = 50 * 1024
+CACHE_PATH = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "irods2dataverse",
+    "mimetypes.json",
+)
+# value of IRODS2DATAVERSE_MIME_CACHE that disables the file of the cache
+DISABLED = ("", "off")
+# formats with a signature, that libmagic would recognise anyway: the extension is trusted.
+# Text formats (CSV, JSON...) are always sniffed, libmagic and the extension can disagree on them.
+EXTENSIONS = {
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".tif": "image/tiff",
+    ".tiff": "image/tiff",
+    ".zip": "application/zip",
+    ".gz": "application/gzip",
+    ".bz2": "application/x-bzip2",
+    ".xz": "application/x-xz",
+}
+
+
+def cache_path():
+    """Path of the cache file: `IRODS2DATAVERSE_MIME_CACHE` if it is set, else `CACHE_PATH`.
+
+    `None` if the variable is empty or "off": the MIME types are then not kept between runs.
+    """
+    path = os.getenv("IRODS2DATAVERSE_MIME_CACHE")
+    if path is None:
+        return CACHE_PATH
+    return None if path.strip().lower() in DISABLED else path
+
+
+class Cache:
+    """MIME types of data objects by object id and checksum, kept in a JSON file between runs.
+
+    A data object keeps its id when it is modified, but not its checksum: an entry is only
+    used for the same content. New entries are written every `flush_every` detections and at
+    exit, merged with the entries written meanwhile by other processes.
+
+    Args:
+        path (str, optional): JSON file. Defaults to `cache_path()`; without a file, the entries
+          are only kept in memory.
+        flush_every (int, optional): New entries after which the file is written. Defaults to 1000.
+    """
+
+    def __init__(self, path=None, flush_every=1000):
+        self.path = path or cache_path()
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._entries = None
+        self._new = {}
+
+    def _read(self):
+        if self.path is None or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except ValueError:
+            # e.g. a file truncated by a crash
+            return {}
+
+    @staticmethod
+    def key(obj, checksum):
+        return f"{obj.id}|{checksum}"
+
+    def get(self, obj, checksum):
+        """Cached MIME type of a data object with this checksum, or `None`."""
+        if not checksum:
+            return None
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._read()
+            return self._entries.get(self.key(obj, checksum))
+
+    def put(self, obj, checksum, mimetype):
+        """Remember the MIME type of a data object with this checksum."""
+        if not checksum or not mimetype:
+            return
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._read()
+            self._entries[self.key(obj, checksum)] = mimetype
+            self._new[self.key(obj, checksum)] = mimetype
+            full = len(self._new) >= self.flush_every
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write the new entries to the file, replacing it atomically."""
+        with self._lock:
+            if not self._new or self.path is None:
+                return
+            entries = dict(self._read(), **self._new)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+            self._entries = entries
+            self._new = {}
+
+
+def from_extension(name):
+    """MIME type of a data object from its extension, if the extension can be trusted (see `EXTENSIONS`)."""
+    return EXTENSIONS.get(posixpath.splitext(name)[1].lower())
+
+
+def from_bytes(head):
+    """MIME type of a data object from its first bytes, with libmagic."""
+    import magic
+
+    return magic.from_buffer(head[:SNIFF_SIZE], mime=True)
+
+
+@metrics.timed("mime")
+def sniff(obj):
+    """MIME type of a data object, from its first bytes read from iRODS."""
+    with redirector.open(obj, SNIFF_SIZE) as f:
+        head = f.read(SNIFF_SIZE)
+    metrics.count("mime_bytes_read", len(head))
+    return from_bytes(head)
+
+
+def detect(obj, checksum=None, head=None, cache=None):
+    """Get the MIME type of a data object, reading from iRODS only if nothing else tells it.
+
+    The type is taken, in this order, from the cache (for the same checksum), from a trusted
+    extension, from the first bytes of the object if they were already read (e.g. by its upload)
+    and, last, from the first bytes read from iRODS.
+
+    Parameters
+    ----------
+    obj: iRODSDataObject
+      the object meant for publication
+    checksum: str
+      its checksum, to use the cache
+    head: bytes
+      the first bytes of the object (`SNIFF_SIZE` or the whole object), if they were read
+    cache: Cache
+      by default the cache shared by the process
+
+    Returns
+    -------
+    mimetype: str
+    """
+    cache = cache or shared_cache
+    mimetype = cache.get(obj, checksum)
+    if mimetype is not None:
+        metrics.count("mime_cached")
+        return mimetype
+    mimetype = from_extension(obj.name)
+    if mimetype is None and head is not None:
+        mimetype = from_bytes(head)
+    if mimetype is None:
+        mimetype = sniff(obj)
+    cache.put(obj, checksum, mimetype)
+    return mimetype
+
+
+# shared by all the uploads of the process
+shared_cache = Cache()
+atexit.register(shared_cache.flush)
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+from irods2dataverse.capabilities import CACHE_PATH
+
+# throughput of previous deposits, next to the cache of capabilities
+HISTORY_PATH = os.path.join(os.path.dirname(CACHE_PATH), "throughput.json")
+# number of deposits kept per strategy
+HISTORY_LENGTH = 50
+
+
+def read_history(history_path=None):
+    """Read the throughput of previous deposits, as lists of records by strategy."""
+    history_path = history_path or HISTORY_PATH
+    if not os.path.exists(history_path):
+        return {}
+    try:
+        with open(history_path) as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def record_throughput(strategy, n_files, n_bytes, seconds, history_path=None):
+    """Add a deposit to the throughput history, used to estimate the duration of the next ones.
+
+    Parameters
+    ----------
+    strategy: str
+      transfer strategy, see `capabilities.choose_strategy()`
+    n_files: int
+      number of files deposited
+    n_bytes: int
+      number of bytes deposited
+    seconds: float
+      duration of the deposit
+    history_path: str
+      JSON file of the history, by default `HISTORY_PATH`
+    """
+    history_path = history_path or HISTORY_PATH
+    history = read_history(history_path)
+    records = history.setdefault(strategy, [])
+    records.append(
+        {"files": n_files, "bytes": n_bytes, "seconds": seconds, "at": time.time()}
+    )
+    history[strategy] = records[-HISTORY_LENGTH:]
+    os.makedirs(os.path.dirname(history_path), exist_ok=True)
+    tmp_path = f"{history_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(history, f, indent=4)
+    os.replace(tmp_path, history_path)
+
+
+def estimate_seconds(n_files, n_bytes, records):
+    """Estimate the duration of a deposit from previous ones.
+
+    A deposit takes a fixed time per file (requests, checksums, metadata) plus a time per byte.
+    Both are fitted by least squares on the previous deposits when they differ enough;
+    otherwise the average throughput in bytes per second is used.
+
+    Parameters
+    ----------
+    n_files: int
+      number of files to deposit
+    n_bytes: int
+      number of bytes to deposit
+    records: list
+      previous deposits with the same strategy, from `record_throughput()`
+
+    Returns
+    -------
+    seconds: float
+      estimated duration, or `None` without history
+    """
+    records = [x for x in records if x["seconds"] > 0 and x["files"] > 0]
+    if not records:
+        return None
+    # time = a * files + b * bytes
+    sff = sum(x["files"] ** 2 for x in records)
+    sbb = sum(x["bytes"] ** 2 for x in records)
+    sfb = sum(x["files"] * x["bytes"] for x in records)
+    sft = sum(x["files"] * x["seconds"] for x in records)
+    sbt = sum(x["bytes"] * x["seconds"] for x in records)
+    det = sff * sbb - sfb**2
+    if det > 1e-9 * sff * sbb:
+        per_file = (sbb * sft - sfb * sbt) / det
+        per_byte = (sff * sbt - sfb * sft) / det
+        if per_file >= 0 and per_byte >= 0:
+            return per_file * n_files + per_byte * n_bytes
+    total_seconds = sum(x["seconds"] for x in records)
+    total_bytes = sum(x["bytes"] for x in records)
+    if total_bytes:
+        return n_bytes * total_seconds / total_bytes
+    return n_files * total_seconds / sum(x["files"] for x in records)
+
+
+def make_plan(data_objects, limits, strategy=None, history=None, files_in_dataset=0):
+    """Check data objects against the limits of a Dataverse installation before transferring them.
+
+    Objects larger than the maximum file size are rejected. Objects that do not fit in what
+    remains of the storage quota are deferred, keeping the order of the list. The accepted
+    objects are split in batches of at most the maximum number of files per dataset.
+    To add objects to an existing dataset, only the objects to upload are given, and the
+    files that stay in the dataset count against its maximum number of files: the objects
+    beyond it are deferred.
+
+    Parameters
+    ----------
+    data_objects: list
+      iRODSDataObjects meant for publication, e.g. from `from_irods.query_data()`
+    limits: dict
+      'max_file_size', 'max_files', 'quota' and 'storage_use', e.g. from
+      `capabilities.get_capabilities()`. Missing or `None` values mean no limit.
+    strategy: str
+      transfer strategy, to estimate the duration
+    history: dict
+      throughput history, by default `read_history()`
+    files_in_dataset: int
+      files that stay in the existing dataset the objects are added to, e.g. the unchanged
+      ones of a sync (see `deposit.compare_files()`)
+
+    Returns
+    -------
+    plan: dict
+      'accepted' objects, split in 'batches' (one dataset each), 'rejected' and 'deferred'
+      lists of `(object, reason)`, the number of 'files' and 'bytes' accepted and the
+      'estimated_seconds' of the transfer (`None` without history)
+    """
+    max_file_size = limits.get("max_file_size")
+    max_files = limits.get("max_files")
+    quota = limits.get("quota")
+    remaining = None if quota is None else quota - (limits.get("storage_use") or 0)
+    room = None
+    if max_files is not None and files_in_dataset:
+        room = max(0, max_files - files_in_dataset)
+
+    accepted, rejected, deferred = [], [], []
+    for obj in data_objects:
+        if max_file_size is not None and obj.size > max_file_size:
+            rejected.append(
+                (obj, f"is larger than the maximum file size ({max_file_size} bytes)")
+            )
+        elif room is not None and len(accepted) >= room:
+            deferred.append((obj, "exceeds the maximum number of files of the dataset"))
+        elif remaining is not None and obj.size > remaining:
+            deferred.append((obj, "exceeds the remaining storage quota"))
+        else:
+            accepted.append(obj)
+            if remaining is not None:
+                remaining -= obj.size
+
+    size = max_files or len(accepted) or 1
+    batches = [accepted[i : i + size] for i in range(0, len(accepted), size)]
+    n_bytes = sum(x.size for x in accepted)
+    estimated = None
+    if strategy is not None:
+        if history is None:
+            history = read_history()
+        estimated = estimate_seconds(len(accepted), n_bytes, history.get(strategy, []))
+
+    return {
+        "accepted": accepted,
+        "batches": batches,
+        "rejected": rejected,
+        "deferred": deferred,
+        "files": len(accepted),
+        "bytes": n_bytes,
+        "estimated_seconds": estimated,
+    }
+
+
+def format_plan(plan):
+    """Describe a deposit plan for the user.
+
+    Parameters
+    ----------
+    plan: dict
+      output of `make_plan()`
+
+    Returns
+    -------
+    text: str
+    """
+    lines = [f"{plan['files']} files ({plan['bytes'] / 1e6:.2f} MB) can be deposited"]
+    if len(plan["batches"]) > 1:
+        lines[
+            0
+        ] += f", in {len(plan['batches'])} datasets because of the file count limit"
+    if plan["estimated_seconds"] is not None:
+        lines[0] += f", in about {plan['estimated_seconds'] / 60:.1f} minutes"
+    lines[0] += "."
+    for obj, reason in plan["rejected"] + plan["deferred"]:
+        lines.append(f"{obj.path} is left out: it {reason}.")
+    return "\n".join(lines)
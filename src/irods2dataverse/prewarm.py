@@ -0,0 +1,211 @@
+import os
+import queue
+import argparse
+import threading
+from irods2dataverse import from_irods, metrics
+from irods2dataverse.replicas import leaf
+from irods2dataverse.session_pool import SessionPool, checkout
+
+atr_publish = "dv.publication"
+# checksums computed at the same time by each storage resource
+PER_RESOURCE = 2
+
+
+def group_by_resource(data_objects):
+    """Group the data objects without checksum by the storage resource of one of their good replicas.
+
+    Parameters
+    ----------
+    data_objects: list
+      iRODSDataObjects, e.g. from `from_irods.query_data()`
+
+    Returns
+    -------
+    missing: dict
+      iRODS paths by storage resource
+    """
+    missing = {}
+    for obj in data_objects:
+        if obj.checksum:
+            continue
+        good = [x for x in obj.replicas if x.status == "1"] or obj.replicas
+        missing.setdefault(leaf(good[0].resc_hier), []).append(obj.path)
+    return missing
+
+
+def query_missing(atr, val, session):
+    """iRODS query of the data objects in a given publication status that have no checksum.
+
+    Parameters
+    ----------
+    atr: str
+      the metadata attribute describing the status of publication
+    val: str or list
+      the metadata value(s) describing the status of publication
+    session: iRODS session or SessionPool
+
+    Returns
+    -------
+    missing: dict
+      iRODS paths by storage resource (of a good replica), as `group_by_resource()`
+    """
+    from irods.column import Criterion, In
+    from irods.models import Collection, DataObject, DataObjectMeta
+
+    vals = [val] if isinstance(val, str) else val
+    replicas, done = {}, set()
+    with checkout(session) as session:
+        query = (
+            session.query(
+                Collection.name,
+                DataObject.name,
+                DataObject.checksum,
+                DataObject.replica_status,
+                DataObject.resc_hier,
+            )
+            .filter(Criterion("=", DataObjectMeta.name, atr))
+            .filter(In(DataObjectMeta.value, vals))
+        )
+        for item in query:
+            path = f"{item[Collection.name]}/{item[DataObject.name]}"
+            good = item[DataObject.replica_status] == "1"
+            if good and item[DataObject.checksum]:
+                done.add(path)
+            elif good or path not in replicas:
+                replicas[path] = leaf(item[DataObject.resc_hier])
+    missing = {}
+    for path, resource in sorted(replicas.items()):
+        if path not in done:
+            missing.setdefault(resource, []).append(path)
+    return missing
+
+
+@metrics.timed("prewarm")
+def prewarm(missing, session, per_resource=PER_RESOURCE):
+    """Compute missing checksums, with `per_resource` computations at the same time on each resource.
+
+    Each storage resource server hashes its own replicas, so all the servers work in
+    parallel while none of them is overloaded. With a SessionPool, its size also limits
+    the number of computations at the same time.
+
+    Parameters
+    ----------
+    missing: dict
+      iRODS paths by storage resource, output of `group_by_resource()` or `query_missing()`
+    session: iRODS session or SessionPool
+    per_resource: int
+      maximum number of checksums computed at the same time on a resource
+
+    Returns
+    -------
+    checksums: dict
+      the checksum of each data object by iRODS path, or the exception raised when computing it
+    """
+    from irods import keywords as kw
+
+    def chksum(path, resource):
+        options = {kw.RESC_NAME_KW: resource}
+        if isinstance(session, SessionPool):
+            return session.run(lambda s: s.data_objects.chksum(path, **options))
+        return session.data_objects.chksum(path, **options)
+
+    checksums = {}
+    lock = threading.Lock()
+
+    def work(resource, pending):
+        while True:
+            try:
+                path = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                result = chksum(path, resource)
+            except Exception as e:
+                print(f"The checksum of {path} could not be computed: {e}")
+                result = e
+            with lock:
+                checksums[path] = result
+
+    threads = []
+    for resource, paths in missing.items():
+        pending = queue.Queue()
+        for path in paths:
+            pending.put(path)
+        for _ in range(min(per_resource, len(paths))):
+            threads.append(threading.Thread(target=work, args=(resource, pending)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return checksums
+
+
+def start(data_objects, session, per_resource=PER_RESOURCE):
+    """Compute the missing checksums of data objects in the background, e.g. while the user fills in metadata.
+
+    Parameters
+    ----------
+    data_objects: list
+      iRODSDataObjects meant for publication
+    session: iRODS session or SessionPool
+    per_resource: int
+      maximum number of checksums computed at the same time on a resource
+
+    Returns
+    -------
+    thread: threading.Thread
+      join it before the upload, so that the checksums are not computed twice
+    """
+    thread = threading.Thread(
+        target=prewarm,
+        args=(group_by_resource(data_objects), session, per_resource),
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    """Checksums of newly tagged data: this can be run e.g. every minute by a scheduler."""
+    parser = argparse.ArgumentParser(
+        description="Compute the missing checksums of the data objects tagged for publication."
+    )
+    parser.add_argument(
+        "-e",
+        "--environment",
+        default=os.path.expanduser("~/.irods/irods_environment.json"),
+        help="Path to the iRODS environment file.",
+    )
+    parser.add_argument(
+        "-v",
+        "--values",
+        nargs="+",
+        default=["initiated"],
+        help="Publication statuses to look for.",
+    )
+    parser.add_argument(
+        "-r",
+        "--per-resource",
+        type=int,
+        default=PER_RESOURCE,
+        help="Checksums computed at the same time on each storage resource.",
+    )
+    parser.add_argument(
+        "-s",
+        "--sessions",
+        type=int,
+        default=8,
+        help="Number of iRODS sessions.",
+    )
+    args = parser.parse_args()
+
+    pool = from_irods.authenticate_pool(args.environment, args.sessions)
+    if not pool:
+        raise SystemExit(1)
+    missing = query_missing(atr_publish, args.values, pool)
+    for resource, paths in missing.items():
+        print(f"{resource}: {len(paths)} checksums to compute")
+    checksums = prewarm(missing, pool, args.per_resource)
+    pool.close()
+    if any(isinstance(x, Exception) for x in checksums.values()):
+        raise SystemExit(1)
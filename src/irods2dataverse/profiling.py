@@ -0,0 +1,258 @@
+import os
+import sys
+import json
+import time
+import datetime
+import threading
+from collections import Counter
+from contextlib import nullcontext
+from irods2dataverse import metrics
+
+# stages of a deposit, reported even when they did not run
+STAGES = (
+    "discovery",
+    "avu_extraction",
+    "template_fill",
+    "validation",
+    "checksum",
+    "transfer",
+    "registration",
+    "avu_writeback",
+)
+CPU_MODES = ("sampling", "cprofile", "off")
+# lines of the text reports
+TOP = 50
+
+
+def frame_name(code):
+    """Name of a function in the reports, e.g. 'put_in_s3 (direct_upload.py:122)'."""
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class Sampler:
+    """Sample the stacks of all the threads at regular intervals, from a background thread.
+
+    Unlike cProfile, which only follows the thread that enables it, the samples cover the
+    threads of the transfers. They measure wall-clock time: a thread waiting for the network
+    or a lock is sampled where it waits.
+
+    Args:
+        interval (float, optional): Seconds between two samples. Defaults to 0.01.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        # number of samples by (thread name, outermost frame, ..., innermost frame)
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="profiling-sampler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {x.ident: x.name for x in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_name(frame.f_code))
+                    frame = frame.f_back
+                self.stacks[(names.get(ident, str(ident)),) + tuple(stack[::-1])] += 1
+
+    def folded(self):
+        """The samples in the folded format of flame graphs (flamegraph.pl, speedscope)."""
+        return "".join(
+            f"{';'.join(stack)} {n}\n" for stack, n in sorted(self.stacks.items())
+        )
+
+    def summary(self, top=TOP):
+        """The functions with the most samples, in the function itself and in total."""
+        total = sum(self.stacks.values()) or 1
+        own = Counter()
+        inclusive = Counter()
+        for stack, n in self.stacks.items():
+            own[stack[-1]] += n
+            for name in set(stack[1:]):
+                inclusive[name] += n
+        lines = [f"{total} samples every {self.interval} s, all threads"]
+        for title, counter in (("own", own), ("inclusive", inclusive)):
+            lines += ["", f"{'samples':>8} {'%':>6}  function ({title})"]
+            for name, n in counter.most_common(top):
+                lines.append(f"{n:>8} {100 * n / total:>6.1f}  {name}")
+        return "\n".join(lines) + "\n"
+
+
+class Profiler:
+    """Profile a deposit run and write the reports in a directory of its own.
+
+    The reports are, in `<directory>/run-<date>-<pid>`:
+
+    - `stages.txt` and `stages.json`: the wall-clock time of each stage of the pipeline
+      (see `metrics`) during the run, e.g. checksum, transfer, registration;
+    - `cpu.txt`, with `cpu.folded` (sampling) or `cpu.pstats` (cProfile): where the time goes;
+    - `memory.txt` and `memory.tracemalloc`: the allocations still alive at the end of the run
+      and their growth since its start, from `tracemalloc`.
+
+    Args:
+        directory (str): Directory of the reports of the runs.
+        cpu (str, optional): "sampling" (all threads, see `Sampler`), "cprofile" (only the thread
+          that starts the profiler, deterministic) or "off". Defaults to "sampling".
+        memory (bool, optional): Trace the memory allocations; this slows the run down.
+          Defaults to True.
+        interval (float, optional): Seconds between two samples. Defaults to 0.01.
+    """
+
+    def __init__(self, directory, cpu="sampling", memory=True, interval=0.01):
+        if cpu not in CPU_MODES:
+            raise ValueError(
+                f"Unknown profiling mode {cpu}, expected one of {CPU_MODES}."
+            )
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.path = os.path.join(directory, f"run-{stamp}-{os.getpid()}")
+        self.cpu = cpu
+        self.memory = memory
+        self.interval = interval
+        self._profiler = None
+        self._metrics = None
+        self._was_enabled = False
+        self._memory_start = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        import tracemalloc
+
+        os.makedirs(self.path, exist_ok=True)
+        self._was_enabled = metrics.is_enabled()
+        metrics.enable()
+        self._metrics = metrics.snapshot()
+        if self.memory:
+            tracemalloc.start(10)
+            self._memory_start = tracemalloc.take_snapshot()
+        if self.cpu == "sampling":
+            self._profiler = Sampler(self.interval)
+            self._profiler.start()
+        elif self.cpu == "cprofile":
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._start = time.perf_counter()
+
+    def stop(self):
+        """Stop profiling and write the reports."""
+        import tracemalloc
+
+        wall = time.perf_counter() - self._start
+        if self.cpu == "sampling":
+            self._profiler.stop()
+            self.write("cpu.folded", self._profiler.folded())
+            self.write("cpu.txt", self._profiler.summary())
+        elif self.cpu == "cprofile":
+            import io
+            import pstats
+
+            self._profiler.disable()
+            self._profiler.dump_stats(os.path.join(self.path, "cpu.pstats"))
+            text = io.StringIO()
+            stats = pstats.Stats(self._profiler, stream=text)
+            stats.sort_stats("cumulative").print_stats(TOP)
+            self.write("cpu.txt", text.getvalue())
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            snapshot.dump(os.path.join(self.path, "memory.tracemalloc"))
+            self.write("memory.txt", self.memory_report(snapshot, current, peak))
+        stages = self.stages()
+        self.write(
+            "stages.json", json.dumps({"wall": wall, "stages": stages}, indent=4)
+        )
+        self.write("stages.txt", self.stages_report(stages, wall))
+        if not self._was_enabled:
+            metrics.disable()
+        print(f"The profile of the run is written to {self.path}")
+
+    def write(self, name, text):
+        with open(os.path.join(self.path, name), "w") as f:
+            f.write(text)
+
+    def stages(self):
+        """Count and seconds of each stage during the run, from the metrics."""
+        before = self._metrics["stages"]
+        stages = {x: {"count": 0, "seconds": 0.0} for x in STAGES}
+        for name, histogram in metrics.snapshot()["stages"].items():
+            previous = before.get(name, {"count": 0, "sum": 0.0})
+            stages[name] = {
+                "count": histogram["count"] - previous["count"],
+                "seconds": histogram["sum"] - previous["sum"],
+            }
+        return stages
+
+    @staticmethod
+    def stages_report(stages, wall):
+        lines = [
+            f"{wall:.3f} s of wall-clock time. Stages can run in several threads at once",
+            "and contain one another (e.g. checksum in transfer): the shares can add up to more than 100%.",
+            "",
+            f"{'stage':<16} {'count':>8} {'seconds':>10} {'mean':>10} {'% wall':>7}",
+        ]
+        for name, stage in sorted(stages.items(), key=lambda x: -x[1]["seconds"]):
+            mean = stage["seconds"] / stage["count"] if stage["count"] else 0.0
+            share = 100 * stage["seconds"] / wall if wall else 0.0
+            lines.append(
+                f"{name:<16} {stage['count']:>8} {stage['seconds']:>10.3f} {mean:>10.4f} {share:>7.1f}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def memory_report(self, snapshot, current, peak):
+        lines = [
+            f"traced memory: {current / 1000000:.1f} MB at the end, {peak / 1000000:.1f} MB at the peak",
+            "",
+            "allocations alive at the end of the run:",
+        ]
+        lines += [str(x) for x in snapshot.statistics("lineno")[:TOP]]
+        lines += ["", "growth since the start of the run:"]
+        lines += [
+            str(x) for x in snapshot.compare_to(self._memory_start, "lineno")[:TOP]
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def profile_run(directory=None, cpu=None, memory=None):
+    """Profile a block if profiling is asked for, e.g. `with profiling.profile_run(args.profile):`.
+
+    Args:
+        directory (str, optional): Directory of the reports. Defaults to `IRODS2DATAVERSE_PROFILE`;
+          without it, nothing is profiled.
+        cpu (str, optional): See `Profiler`. Defaults to `IRODS2DATAVERSE_PROFILE_CPU` or "sampling".
+        memory (bool, optional): See `Profiler`. Defaults to True, unless
+          `IRODS2DATAVERSE_PROFILE_MEMORY` is 0.
+
+    Returns:
+        contextmanager: A `Profiler`, or a context that does nothing.
+    """
+    directory = directory or os.getenv("IRODS2DATAVERSE_PROFILE")
+    if not directory:
+        return nullcontext()
+    cpu = cpu or os.getenv("IRODS2DATAVERSE_PROFILE_CPU", "sampling")
+    if memory is None:
+        memory = os.getenv("IRODS2DATAVERSE_PROFILE_MEMORY", "1") != "0"
+    return Profiler(directory, cpu, memory)
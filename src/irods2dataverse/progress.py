@@ -0,0 +1,321 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# seconds between two "progress" events of a transfer
+INTERVAL = 0.5
+# seconds of history of the aggregate throughput
+WINDOW = 10.0
+
+
+def format_rate(rate):
+    """Format a throughput in bytes per second, e.g. '12.30 MB/s'."""
+    if rate is None:
+        return "-"
+    return f"{rate / 1000000:.2f} MB/s"
+
+
+def format_eta(seconds):
+    """Format a remaining time, e.g. '0:01:05'."""
+    if seconds is None:
+        return "-"
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def estimate(remaining, rate):
+    """Seconds needed for `remaining` bytes at `rate` bytes per second; `None` if unknown."""
+    if remaining <= 0:
+        return 0.0
+    return remaining / rate if rate else None
+
+
+class Transfer:
+    """Progress of the transfer of one data object, fed with the number of bytes read.
+
+    Args:
+        tracker (Tracker): Tracker of the run.
+        name (str): Name of the transfer, e.g. the iRODS path.
+        size (int): Bytes to transfer.
+    """
+
+    def __init__(self, tracker, name, size):
+        self.tracker = tracker
+        self.name = name
+        self.size = size
+        self.done = 0
+        self.started = time.monotonic()
+        self._next = self.started + tracker.interval
+
+    def add(self, n):
+        """Count `n` bytes as transferred; cheap enough to be called for each block read."""
+        self.done += n
+        self.tracker._add(n)
+        now = time.monotonic()
+        if now >= self._next:
+            self._next = now + self.tracker.interval
+            self.tracker._emit("progress", self, now)
+
+    def rate(self, now=None):
+        """Average throughput of the transfer since its start, in bytes per second."""
+        elapsed = (now or time.monotonic()) - self.started
+        return self.done / elapsed if elapsed > 0 else None
+
+
+class Tracker:
+    """Progress of the transfers of a run: per data object and aggregate throughput and ETA.
+
+    The transfers count their bytes with `Transfer.add()` (the upload functions pass it to
+    the readers of the data objects). The progress is published as events, dictionaries with
+    the "kind" of event ("start", "progress", "done", "failed" or "end"), the "name", "size",
+    "done" bytes, "rate" and "eta" of the transfer, and the aggregate "files_done", "files",
+    "total_done", "total", "total_rate" and "total_eta" of the run. They can be received with
+    a callback (`subscribe()`), or with an asynchronous iterator (`events()`). The counts add
+    up until `reset()` starts a new run.
+
+    Args:
+        interval (float, optional): Seconds between two "progress" events of a transfer.
+          Defaults to `INTERVAL`.
+        window (float, optional): Seconds over which the aggregate throughput is measured.
+          Defaults to `WINDOW`.
+    """
+
+    def __init__(self, interval=INTERVAL, window=WINDOW):
+        self.interval = interval
+        self.window = window
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self.reset()
+
+    def reset(self):
+        """Start a new run: forget the counts and throughput of the previous one, keep the subscribers."""
+        with self._lock:
+            self.files = 0
+            self.total = 0
+            self.files_done = 0
+            self.total_done = 0
+            # (time, total_done) since the first transfer
+            self._samples = deque()
+
+    def expect(self, files, size):
+        """Announce transfers to come, so that the ETA of the run can be estimated.
+
+        Args:
+            files (int): Number of data objects.
+            size (int): Their total size in bytes.
+        """
+        with self._lock:
+            self.files += files
+            self.total += size
+
+    def subscribe(self, callback):
+        """Call `callback(event)` for each event, in the thread of the transfer.
+
+        The callback must return quickly; its exceptions are printed and ignored.
+
+        Returns:
+            callable: Stops the calls.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+
+        return unsubscribe
+
+    async def events(self):
+        """Iterate over the events from the start of the iteration until the "end" event.
+
+        The events of the threads of the transfers are handed to the event loop of the
+        iteration, e.g. for a web application to forward them to its clients.
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        unsubscribe = self.subscribe(
+            lambda event: loop.call_soon_threadsafe(queue.put_nowait, event)
+        )
+        try:
+            while True:
+                event = await queue.get()
+                yield event
+                if event["kind"] == "end":
+                    return
+        finally:
+            unsubscribe()
+
+    def start(self, name, size):
+        """Start following the transfer of a data object.
+
+        Args:
+            name (str): Name of the transfer, e.g. the iRODS path.
+            size (int): Bytes to transfer.
+
+        Returns:
+            Transfer: To count the bytes transferred.
+        """
+        transfer = Transfer(self, name, size)
+        with self._lock:
+            if not self._samples:
+                self._samples.append((transfer.started, self.total_done))
+        self._emit("start", transfer)
+        return transfer
+
+    def finish(self, transfer, failed=False):
+        """End the transfer of a data object.
+
+        The bytes a failed transfer did not send are no longer expected.
+        """
+        with self._lock:
+            self.files_done += 1
+            if failed:
+                self.total -= max(0, transfer.size - transfer.done)
+        self._emit("failed" if failed else "done", transfer)
+
+    @contextmanager
+    def track(self, name, size):
+        """Follow a transfer for the duration of a block, failed if it raises.
+
+        Yields:
+            Transfer: To count the bytes transferred.
+        """
+        transfer = self.start(name, size)
+        try:
+            yield transfer
+        except BaseException:
+            self.finish(transfer, failed=True)
+            raise
+        self.finish(transfer)
+
+    def close(self):
+        """Publish the "end" event of the run."""
+        self._emit("end")
+
+    @contextmanager
+    def show(self, console):
+        """Render the progress of the transfers in a rich console during a block.
+
+        A bar per data object in transfer and one for the run, with their throughput and ETA.
+
+        Args:
+            console (rich.console.Console): Console of the script.
+
+        Yields:
+            rich.progress.Progress: The display; what is printed meanwhile appears above it.
+        """
+        from rich.progress import BarColumn, DownloadColumn, Progress, TextColumn
+
+        display = Progress(
+            TextColumn("{task.description}"),
+            BarColumn(),
+            DownloadColumn(),
+            TextColumn("{task.fields[rate]}"),
+            TextColumn("ETA {task.fields[eta]}"),
+            console=console,
+        )
+        run = self.snapshot()
+        overall = display.add_task(
+            f"{run['files_done']}/{run['files']} files",
+            total=run["total"] or None,
+            rate="-",
+            eta="-",
+        )
+        tasks = {}
+
+        def on_event(event):
+            if event.get("name") is not None:
+                task = tasks.get(event["name"])
+                if event["kind"] == "start":
+                    tasks[event["name"]] = display.add_task(
+                        event["name"].rsplit("/", 1)[-1],
+                        total=event["size"],
+                        rate="-",
+                        eta="-",
+                    )
+                elif event["kind"] == "progress" and task is not None:
+                    display.update(
+                        task,
+                        completed=event["done"],
+                        rate=format_rate(event["rate"]),
+                        eta=format_eta(event["eta"]),
+                    )
+                elif task is not None:
+                    display.remove_task(tasks.pop(event["name"]))
+            display.update(
+                overall,
+                description=f"{event['files_done']}/{event['files']} files",
+                total=event["total"] or None,
+                completed=event["total_done"],
+                rate=format_rate(event["total_rate"]),
+                eta=format_eta(event["total_eta"]),
+            )
+
+        unsubscribe = self.subscribe(on_event)
+        try:
+            with display:
+                yield display
+        finally:
+            unsubscribe()
+
+    def _add(self, n):
+        with self._lock:
+            self.total_done += n
+
+    def rate(self, now=None):
+        """Aggregate throughput over the last `window` seconds, in bytes per second."""
+        now = now or time.monotonic()
+        with self._lock:
+            samples = self._samples
+            if not samples:
+                return None
+            samples.append((now, self.total_done))
+            while len(samples) > 2 and samples[1][0] < now - self.window:
+                samples.popleft()
+            (first, first_done), (last, last_done) = samples[0], samples[-1]
+        return (last_done - first_done) / (last - first) if last > first else None
+
+    def snapshot(self, now=None):
+        """Aggregate progress of the run, as in the events."""
+        now = now or time.monotonic()
+        rate = self.rate(now)
+        with self._lock:
+            return {
+                "files_done": self.files_done,
+                "files": self.files,
+                "total_done": self.total_done,
+                "total": self.total,
+                "total_rate": rate,
+                "total_eta": estimate(self.total - self.total_done, rate),
+            }
+
+    def _emit(self, kind, transfer=None, now=None):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+        now = now or time.monotonic()
+        event = {"kind": kind, "time": time.time()}
+        if transfer is not None:
+            rate = transfer.rate(now)
+            event.update(
+                name=transfer.name,
+                size=transfer.size,
+                done=transfer.done,
+                rate=rate,
+                eta=estimate(transfer.size - transfer.done, rate),
+            )
+        event.update(self.snapshot(now))
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"A progress subscriber failed: {e}")
+
+
+# shared by all the transfers of the process
+tracker = Tracker()
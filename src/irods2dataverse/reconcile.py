@@ -0,0 +1,183 @@
+import os
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from irods2dataverse import from_irods, to_dataverse
+from irods2dataverse.installations import registry
+from irods2dataverse.session_pool import SessionPool
+
+atr_publish = "dv.publication"
+atr_doi = "dv.ds.DOI"
+atr_dv = "dv.installation"
+atr_timestamp = "dv.publication.timestamp"
+
+
+# forms of the same DOI in the metadata and in Dataverse
+DOI_PREFIXES = ("https://doi.org/", "http://doi.org/", "https://dx.doi.org/", "doi:")
+
+
+def normalize_doi(doi):
+    """Write a DOI as Dataverse does, e.g. 'https://doi.org/10.5072/fk2/abc' as 'doi:10.5072/FK2/ABC'.
+
+    DOIs are case-insensitive. Other persistent identifiers are returned without surrounding spaces.
+    """
+    doi = doi.strip()
+    for prefix in DOI_PREFIXES:
+        if doi.lower().startswith(prefix):
+            return "doi:" + doi[len(prefix) :].upper()
+    return doi
+
+
+def group_by_doi(dmd):
+    """Group deposited data objects by installation and dataset.
+
+    Parameters
+    ----------
+    dmd: dict
+        Metadata by iRODS path, output of `from_irods.query_md()`
+
+    Returns
+    -------
+    groups: dict
+        For each installation, the iRODS paths by dataset DOI (see `normalize_doi()`).
+        Objects without a single installation or DOI are ignored.
+    """
+    groups = {}
+    for path, avus in dmd.items():
+        installations = avus.get(atr_dv, [])
+        dois = avus.get(atr_doi, [])
+        if len(installations) != 1:
+            continue
+        for doi in {normalize_doi(x) for x in dois}:
+            groups.setdefault(installations[0], {}).setdefault(doi, []).append(path)
+    return groups
+
+
+def reconcile(session, base_urls, tokens=None, max_workers=8, per_request=100):
+    """Update the publication status of deposited data objects whose dataset is published.
+
+    The deposited objects are found with one query, their datasets are checked per installation
+    concurrently, via the search API, and the metadata of each published object is
+    updated in a single atomic operation. With a session pool, the objects are updated
+    concurrently, one per session.
+
+    Parameters
+    ----------
+    session: iRODS session or SessionPool
+    base_urls: dict
+        URL of each Dataverse installation, by installation name
+    tokens: dict
+        Dataverse API token by installation name, optional
+    max_workers: int
+        Maximum number of concurrent requests
+    per_request: int
+        Number of datasets checked per request
+
+    Returns
+    -------
+    published: dict
+        For each published DOI, the iRODS paths that are updated. The datasets of a request
+        that fails are left out, and checked again in the next run.
+    """
+
+    tokens = tokens or {}
+    dmd = from_irods.query_md(
+        atr_publish, "deposited", [atr_doi, atr_dv, atr_timestamp], session
+    )
+    groups = group_by_doi(dmd)
+    for installation in set(groups) - set(base_urls):
+        print(f"The Dataverse installation {installation} is not configured.")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            installation: [
+                executor.submit(
+                    to_dataverse.get_published,
+                    base_urls[installation],
+                    chunk,
+                    tokens.get(installation),
+                    per_request,
+                )
+                for chunk in chunks(list(dois), per_request)
+            ]
+            for installation, dois in groups.items()
+            if installation in base_urls
+        }
+        published = {}
+        for installation, installation_futures in futures.items():
+            for future in installation_futures:
+                try:
+                    dois = future.result()
+                except Exception as e:
+                    print(f"The datasets of {installation} could not be checked: {e}")
+                    continue
+                for doi in dois:
+                    # the search can return other forms of the DOIs, or other datasets
+                    paths = groups[installation].get(normalize_doi(doi))
+                    if paths is not None:
+                        published[normalize_doi(doi)] = paths
+
+    timestamp = datetime.datetime.now()
+    # an object deposited in several datasets is published with any of them
+    paths = {path for paths in published.values() for path in paths}
+
+    def update(path):
+        return from_irods.save_md_batch(
+            path,
+            [(atr_publish, "deposited")]
+            + [(atr_timestamp, x) for x in dmd[path].get(atr_timestamp, [])],
+            [(atr_publish, "published"), (atr_timestamp, timestamp)],
+            session,
+        )
+
+    # a single session cannot be used by several threads
+    writers = session.size if isinstance(session, SessionPool) else 1
+    with ThreadPoolExecutor(max_workers=writers) as executor:
+        failed = sum(not x for x in executor.map(update, paths))
+    if failed:
+        print(f"The metadata of {failed} data objects could not be updated.")
+
+    return published
+
+
+def chunks(items, size):
+    """Split a list in lists of at most `size` items."""
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+if __name__ == "__main__":
+    """Periodic check of the deposited data: this can be run e.g. as a cron job."""
+    parser = argparse.ArgumentParser(
+        description="Update the metadata of the data objects whose dataset is published in Dataverse."
+    )
+    parser.add_argument(
+        "-e",
+        "--environment",
+        default=os.path.expanduser("~/.irods/irods_environment.json"),
+        help="Path to the iRODS environment file.",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=8,
+        help="Maximum number of concurrent requests.",
+    )
+    parser.add_argument(
+        "-s",
+        "--sessions",
+        type=int,
+        default=4,
+        help="Number of iRODS sessions used to update the metadata.",
+    )
+    args = parser.parse_args()
+
+    session = from_irods.authenticate_pool(args.environment, args.sessions)
+    if not session:
+        raise SystemExit(1)
+    base_urls = {x: registry.base_url(x) for x in registry.names()}
+    published = reconcile(session, base_urls, max_workers=args.workers)
+    print(
+        f"{len(published)} datasets are published, {len({y for x in published.values() for y in x})} data objects are updated."
+    )
+    session.close()
@@ -0,0 +1,189 @@
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+from irods2dataverse import metrics, replicas, throttle
+from irods2dataverse.session_pool import connection_errors
+
+# connections opened to each resource server at the same time
+MAX_PER_RESOURCE = 4
+# smaller reads go through the provider: a redirect opens a new connection
+MIN_SIZE = 8 * 1024 * 1024
+
+
+class Redirector:
+    """Read data objects from the best replica, on the resource server holding it if possible.
+
+    The replica is chosen by a `replicas.Ranker` (preferred resources, measured throughput, never
+    a stale replica) and opened explicitly. Without redirection, all the data read by a session
+    passes through the iRODS provider it is connected to. With `allow_redirect` (iRODS 4.3.1 or
+    later), python-irodsclient connects to the server of the resource instead. The number of such
+    connections is limited per resource; when the limit is reached, or for small reads, the
+    provider is used. When a resource server cannot be reached (e.g. it is behind a firewall),
+    reads from that resource go via the provider from then on.
+
+    Args:
+        max_per_resource (int, optional): Redirected reads at the same time on a resource.
+          Defaults to `MAX_PER_RESOURCE`.
+        min_size (int, optional): Size under which reads are not redirected. Defaults to `MIN_SIZE`.
+        ranker (replicas.Ranker, optional): Ranking of the replicas, also fed with the throughput
+          of the reads. Defaults to `replicas.ranker`.
+        limiter (throttle.Limiter, optional): Budgets of throughput the reads count against.
+          Defaults to `throttle.limiter`.
+    """
+
+    def __init__(
+        self,
+        max_per_resource=MAX_PER_RESOURCE,
+        min_size=MIN_SIZE,
+        ranker=None,
+        limiter=None,
+    ):
+        self.max_per_resource = max_per_resource
+        self.min_size = min_size
+        self.ranker = ranker or replicas.ranker
+        self.limiter = limiter or throttle.limiter
+        self._lock = threading.Lock()
+        self._active = {}
+        self._refused = set()
+        self._counts = {"redirected": 0, "proxied": 0, "refused": 0}
+
+    def stats(self):
+        """Get the number of reads redirected, via the provider and refused by a resource server."""
+        with self._lock:
+            return dict(self._counts, refused_resources=sorted(self._refused))
+
+    def _acquire(self, resource, size):
+        with self._lock:
+            if (
+                resource is None
+                or resource in self._refused
+                or size < self.min_size
+                or self._active.get(resource, 0) >= self.max_per_resource
+            ):
+                return False
+            self._active[resource] = self._active.get(resource, 0) + 1
+            return True
+
+    def _release(self, resource, outcome=None):
+        with self._lock:
+            self._active[resource] -= 1
+            if outcome is None:
+                return
+            self._counts[outcome] += 1
+            if outcome == "refused":
+                self._refused.add(resource)
+        metrics.count(f"{outcome}_reads")
+
+    def _proxied(self):
+        with self._lock:
+            self._counts["proxied"] += 1
+        metrics.count("proxied_reads")
+
+    def _choose(self, obj):
+        """Best replica of a data object: its resource and the options to open it."""
+        import irods.keywords as kw
+
+        replica = self.ranker.choose(obj.replicas)
+        if replica is None:
+            # let the server pick
+            return None, {}
+        return replicas.leaf(replica.resc_hier), {kw.REPL_NUM_KW: str(replica.number)}
+
+    @contextmanager
+    def open(self, obj, size=None, installation=None):
+        """Open the best replica of a data object for reading, redirected if possible.
+
+        The reads count against the budgets of throughput of `limiter` (see `throttle.Limiter`).
+
+        Args:
+            obj (iRODSDataObject): Data object to read.
+            size (int, optional): Number of bytes that will be read. Defaults to the object size.
+            installation (str, optional): URL of the Dataverse installation the data goes to.
+              Defaults to None.
+
+        Yields:
+            file-like: The opened data object.
+        """
+        resource, options = self._choose(obj)
+        size = obj.size if size is None else size
+        start = time.perf_counter()
+        f = None
+        if self._acquire(resource, size):
+            try:
+                f = obj.open("r", allow_redirect=True, **options)
+            except connection_errors() as e:
+                print(
+                    f"Reading from {resource} directly failed, using the provider: {e}"
+                )
+                self._release(resource, "refused")
+                start = time.perf_counter()
+            except BaseException:
+                self._release(resource)
+                raise
+        if f is None:
+            self._proxied()
+            with obj.open("r", **options) as f:
+                reader = self.limiter.reader(f, resource, installation)
+                yield reader
+        else:
+            try:
+                with f:
+                    reader = self.limiter.reader(f, resource, installation)
+                    yield reader
+            finally:
+                self._release(resource, "redirected")
+        if resource is not None and size >= self.min_size:
+            # the time waited for the budgets says nothing about the resource
+            elapsed = time.perf_counter() - start - reader.waited
+            self.ranker.record(resource, size, elapsed)
+
+    def download(self, session, obj, local_path, installation=None, **options):
+        """Save the best replica of a data object locally, redirected if possible (see `open()`).
+
+        When the transfer has a budget of throughput, the data object is streamed through
+        `open()` rather than downloaded in parallel by python-irodsclient.
+
+        Args:
+            session (iRODS session): Session used for the download.
+            obj (iRODSDataObject): Data object to save.
+            local_path (str): Local file.
+            installation (str, optional): URL of the Dataverse installation the data goes to.
+              Defaults to None.
+            **options: Options of `session.data_objects.get()`, e.g. to overwrite the file.
+        """
+        resource, replica_options = self._choose(obj)
+        if self.limiter.limited(resource, installation):
+            with self.open(obj, installation=installation) as f, open(
+                local_path, "wb"
+            ) as local:
+                shutil.copyfileobj(f, local, throttle.CHUNK_SIZE)
+            return
+        options.update(replica_options)
+        start = time.perf_counter()
+        if self._acquire(resource, obj.size):
+            try:
+                session.data_objects.get(
+                    obj.path, local_path, allow_redirect=True, **options
+                )
+            except connection_errors() as e:
+                print(
+                    f"Reading from {resource} directly failed, using the provider: {e}"
+                )
+                self._release(resource, "refused")
+                start = time.perf_counter()
+            except BaseException:
+                self._release(resource)
+                raise
+            else:
+                self._release(resource, "redirected")
+                self.ranker.record(resource, obj.size, time.perf_counter() - start)
+                return
+        self._proxied()
+        session.data_objects.get(obj.path, local_path, **options)
+        if resource is not None and obj.size >= self.min_size:
+            self.ranker.record(resource, obj.size, time.perf_counter() - start)
+
+
+# shared by all the transfers of the process
+redirector = Redirector()
@@ -0,0 +1,105 @@
+import os
+import threading
+
+# replica status of a good (up-to-date) replica; the others are stale or being written
+GOOD = "1"
+# weight of the latest measurement in the throughput of a resource
+SMOOTHING = 0.3
+
+
+def leaf(resc_hier):
+    """Storage resource at the end of a resource hierarchy, e.g. 'repl;disk1' -> 'disk1'."""
+    return resc_hier.split(";")[-1]
+
+
+def read_preference():
+    """Preferred resources, best first, from `IRODS2DATAVERSE_RESOURCES` (comma-separated names)."""
+    names = os.getenv("IRODS2DATAVERSE_RESOURCES", "")
+    return [x.strip() for x in names.split(",") if x.strip()]
+
+
+class Ranker:
+    """Rank the replicas of data objects to read from the fastest good copy.
+
+    Good replicas are ranked by the configured preference of their storage resource first, then by
+    the throughput measured for reads from that resource, and last by replica number. Resources
+    without measurement are tried before the slower measured ones, so that every resource gets
+    measured. Resources marked as slow (e.g. tape archives, see `deprioritize()`) come last.
+    Stale replicas (or replicas being written) are never chosen.
+
+    Args:
+        preference (list, optional): Resource names, best first; resources that are not listed
+          come after. Defaults to `read_preference()`.
+    """
+
+    def __init__(self, preference=None):
+        self.preference = read_preference() if preference is None else preference
+        self._lock = threading.Lock()
+        self._throughput = {}
+        self._slow = set()
+
+    def deprioritize(self, resources):
+        """Rank the replicas on these resources last, e.g. because they must be staged first."""
+        with self._lock:
+            self._slow.update(resources)
+
+    def record(self, resource, n_bytes, seconds):
+        """Measure the throughput (bytes per second) of a read from a resource."""
+        if seconds <= 0 or n_bytes <= 0:
+            return
+        with self._lock:
+            previous = self._throughput.get(resource)
+            measured = n_bytes / seconds
+            self._throughput[resource] = (
+                measured
+                if previous is None
+                else SMOOTHING * measured + (1 - SMOOTHING) * previous
+            )
+
+    def throughput(self, resource):
+        """Measured throughput of a resource in bytes per second, or `None`."""
+        with self._lock:
+            return self._throughput.get(resource)
+
+    def rank(self, replicas):
+        """Sort the good replicas of a data object, best first.
+
+        Parameters
+        ----------
+        replicas: list
+          replicas of a data object, e.g. `obj.replicas`
+
+        Returns
+        -------
+        ranked: list
+          the good replicas, best first
+        """
+        with self._lock:
+            best = max(self._throughput.values(), default=0)
+            throughput = dict(self._throughput)
+            slow = set(self._slow)
+
+        def key(replica):
+            resource = leaf(replica.resc_hier)
+            position = (
+                self.preference.index(resource)
+                if resource in self.preference
+                else len(self.preference)
+            )
+            return (
+                resource in slow,
+                position,
+                -throughput.get(resource, best),
+                int(replica.number),
+            )
+
+        return sorted([x for x in replicas if x.status == GOOD], key=key)
+
+    def choose(self, replicas):
+        """Get the best good replica of a data object, or `None` if it has none."""
+        ranked = self.rank(replicas)
+        return ranked[0] if ranked else None
+
+
+# shared by all the transfers of the process
+ranker = Ranker()
@@ -0,0 +1,171 @@
+import re
+import json
+import html
+from urllib.parse import urlsplit, quote
+from irods2dataverse import metrics
+from irods2dataverse.session_pool import checkout
+
+# types of the iRODS resources that store their replicas in S3
+S3_RESOURCE_TYPES = ("s3",)
+# (upload endpoint, bucket of the replica) for which a copy was refused
+refused = set()
+
+
+def parse_context(context):
+    """Parse the context string of an iRODS resource, e.g. 'S3_DEFAULT_HOSTNAME=host;S3_PROTO=HTTPS'."""
+    return dict(x.split("=", 1) for x in (context or "").split(";") if "=" in x)
+
+
+def find_sources(data_objects, session, chunk_size=500):
+    """Find the data objects that have a good replica in S3, from the resources in the catalog.
+
+    Parameters
+    ----------
+    data_objects: list
+      iRODSDataObjects meant for publication
+    session: iRODS session or SessionPool
+    chunk_size: int
+      number of data objects per query
+
+    Returns
+    -------
+    sources: dict
+      for each iRODS path with a replica in S3, the 'resource', its 'endpoints' (host names)
+      and the 'bucket' and 'key' of the replica
+    """
+    from irods.column import In
+    from irods.models import Collection, DataObject, Resource
+
+    sources = {}
+    ids = [x.id for x in data_objects]
+    with checkout(session) as session:
+        for i in range(0, len(ids), chunk_size):
+            query = session.query(
+                Collection.name,
+                DataObject.name,
+                DataObject.path,
+                DataObject.replica_status,
+                Resource.name,
+                Resource.type,
+                Resource.context,
+            ).filter(In(DataObject.id, ids[i : i + chunk_size]))
+            for item in query:
+                if item[Resource.type] not in S3_RESOURCE_TYPES:
+                    continue
+                if item[DataObject.replica_status] != "1":
+                    continue
+                context = parse_context(item[Resource.context])
+                # the physical path of an S3 replica is /bucket/key
+                bucket, _, key = item[DataObject.path].lstrip("/").partition("/")
+                sources[f"{item[Collection.name]}/{item[DataObject.name]}"] = {
+                    "resource": item[Resource.name],
+                    "endpoints": context.get("S3_DEFAULT_HOSTNAME", "").split(","),
+                    "bucket": bucket,
+                    "key": key,
+                }
+    return sources
+
+
+def same_endpoint(source, url):
+    """Whether an upload URL is on the S3 endpoint of a source replica (path or virtual-host style)."""
+    netloc = urlsplit(url).netloc
+    return any(
+        x and (netloc == x or netloc.endswith(f".{x}")) for x in source["endpoints"]
+    )
+
+
+def copied(response):
+    """Whether a copy request succeeded: S3 can answer 200 with an error in the body."""
+    return response.status_code == 200 and b"<Error>" not in response.content
+
+
+def refuse(key, response):
+    """Remember that the copies from a bucket to an endpoint are refused, so that they are no longer tried."""
+    if key in refused:
+        return
+    refused.add(key)
+    metrics.count("server_copy_refused")
+    print(
+        f"The server-side copies from the bucket {key[1]} to {key[0]} are refused (status {response.status_code}): the data objects are streamed."
+    )
+
+
+def get_etag(response):
+    """ETag of a copied part, from the XML of the response."""
+    return html.unescape(re.search(r"<ETag>(.*?)</ETag>", response.text).group(1))
+
+
+@metrics.timed("server_copy")
+def copy_to_s3(obj, source, data, BASE_URL, header_key):
+    """Copy an S3 replica of a data object to the storage of a dataset, without passing through the client.
+
+    The copy (CopyObject, or UploadPartCopy for each part of a multipart upload) is sent to
+    the upload URLs: it only works if the storage of Dataverse is on the same S3 endpoint, its
+    credentials can read the bucket of the replica and the URLs are presigned with the
+    `x-amz-copy-source` header, which Dataverse does not do by default. Otherwise nothing is
+    stored and the data must be streamed; a refusal is remembered for the endpoint and the
+    bucket (see `refused`), so the copy is only tried once for them.
+
+    Parameters
+    ----------
+    obj: iRODSDataObject
+      the object meant for publication
+    source: dict
+      its replica in S3, from `find_sources()`
+    data: dict
+      output of `direct_upload.request_upload()`
+    BASE_URL: str
+      class attribute baseURL
+    header_key: dict
+      the token used to complete the upload
+
+    Returns
+    -------
+    copied: bool
+      False if the data must be streamed instead
+    """
+    import requests
+
+    url = data["url"] if "url" in data else next(iter(data["urls"].values()))
+    if not same_endpoint(source, url):
+        return False
+    key = (urlsplit(url).netloc, source["bucket"])
+    if key in refused:
+        return False
+    headers = {"x-amz-copy-source": quote(f"/{source['bucket']}/{source['key']}")}
+    if "url" in data:
+        response = requests.put(url, headers=headers)
+        if not copied(response):
+            refuse(key, response)
+            return False
+        metrics.count("bytes_copied", obj.size)
+        return True
+
+    part_size = int(data["partSize"])
+    etags = {}
+    for number, url in sorted(data["urls"].items(), key=lambda x: int(x[0])):
+        offset = (int(number) - 1) * part_size
+        if offset >= obj.size and etags:
+            # the size requested for the upload can be larger than the object
+            break
+        last = min(offset + part_size, obj.size) - 1
+        response = requests.put(
+            url,
+            headers=dict(
+                headers, **{"x-amz-copy-source-range": f"bytes={offset}-{last}"}
+            ),
+        )
+        if not copied(response):
+            refuse(key, response)
+            # the URLs of the parts can still be used to stream them
+            return False
+        etags[number] = get_etag(response)
+    response = requests.put(
+        f"{BASE_URL}{data['complete']}",
+        headers=header_key,
+        data=json.dumps(etags),
+    )
+    if response.status_code != 200:
+        return False
+    metrics.count("bytes_copied", obj.size)
+    return True
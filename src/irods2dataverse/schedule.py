@@ -0,0 +1,201 @@
+import heapq
+import queue
+import threading
+
+POLICIES = ("fifo", "largest-first", "lpt")
+# fixed cost of a file (requests, metadata updates), expressed in bytes transferred
+PER_FILE_COST = 1024 * 1024
+# extra cost of a byte whose checksum must be computed before the transfer
+HASH_COST = 0.5
+# files smaller than this are batched by the `lpt` policy
+SMALL_FILE_SIZE = 4 * 1024 * 1024
+# seconds without a new object after which the objects that arrived are scheduled together
+SETTLE = 0.1
+
+
+def cost(obj):
+    """Estimated cost of sending a data object, from its size and checksum in the catalog."""
+    factor = 1 if getattr(obj, "checksum", None) else 1 + HASH_COST
+    return PER_FILE_COST + obj.size * factor
+
+
+def make_jobs(items, policy="lpt", small_file_size=SMALL_FILE_SIZE, batch_size=100):
+    """Order data objects for upload, as jobs of one or several objects.
+
+    Parameters
+    ----------
+    items: list
+      iRODSDataObjects meant for publication
+    policy: str
+      'fifo' (as given), 'largest-first' (by decreasing cost) or 'lpt' (largest-first, with the
+      small files batched in jobs of similar cost that fill the gaps at the end)
+    small_file_size: int
+      size under which files are batched with the 'lpt' policy
+    batch_size: int
+      maximum number of files in a batch
+
+    Returns
+    -------
+    jobs: list
+      lists of data objects, in the order they should be started
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown scheduling policy {policy}, use one of {POLICIES}.")
+    if policy == "fifo":
+        return [[x] for x in items]
+    ordered = sorted(items, key=cost, reverse=True)
+    if policy == "largest-first":
+        return [[x] for x in ordered]
+    large = [[x] for x in ordered if x.size >= small_file_size]
+    small = [x for x in ordered if x.size < small_file_size]
+    # a batch costs about as much as the smallest large file (or a full batch), so that
+    # the batches are started after the large files and finish together
+    target = cost(large[-1][0]) if large else batch_size * PER_FILE_COST
+    batches, batch, batch_cost = [], [], 0
+    for obj in small:
+        if batch and (batch_cost + cost(obj) > target or len(batch) == batch_size):
+            batches.append(batch)
+            batch, batch_cost = [], 0
+        batch.append(obj)
+        batch_cost += cost(obj)
+    if batch:
+        batches.append(batch)
+    return large + batches
+
+
+def waves(items, policy="lpt", settle=SETTLE, **options):
+    """Order data objects for upload as they arrive, e.g. from `staging.stage()`.
+
+    The objects are read by a thread. When a job is asked for, the objects that arrived
+    together (until none arrives for `settle` seconds) are ordered as a wave with `make_jobs()`:
+    the online objects are started without waiting for the recalls of the others, and the
+    staged objects follow in the waves of their arrival.
+
+    Parameters
+    ----------
+    items: iterable
+      iRODSDataObjects meant for publication
+    policy: str
+      see `make_jobs()`
+    settle: float
+      seconds to wait for more objects before ordering a wave
+    options:
+      other arguments of `make_jobs()`
+
+    Yields
+    ------
+    job: list
+      data objects, in the order they should be started
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown scheduling policy {policy}, use one of {POLICIES}.")
+    arrived = queue.Queue()
+    end = object()
+    errors = []
+
+    def read():
+        try:
+            for item in items:
+                arrived.put(item)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            arrived.put(end)
+
+    threading.Thread(target=read, daemon=True).start()
+    while True:
+        wave = [arrived.get()]
+        while wave[-1] is not end:
+            try:
+                wave.append(arrived.get(timeout=settle))
+            except queue.Empty:
+                break
+        done = wave[-1] is end
+        if done:
+            wave.pop()
+        yield from make_jobs(wave, policy, **options)
+        if done:
+            break
+    if errors:
+        raise errors[0]
+
+
+def assign(jobs, workers):
+    """Assign jobs to workers, each job to the least loaded worker (longest processing time first).
+
+    Parameters
+    ----------
+    jobs: list
+      output of `make_jobs()`
+    workers: int
+      number of workers
+
+    Returns
+    -------
+    queues: list
+      the jobs of each worker
+    makespan: float
+      estimated cost of the most loaded worker
+    """
+    loads = [(0, i) for i in range(workers)]
+    queues = [[] for _ in range(workers)]
+    for job in sorted(jobs, key=lambda x: sum(map(cost, x)), reverse=True):
+        load, i = heapq.heappop(loads)
+        queues[i].append(job)
+        heapq.heappush(loads, (load + sum(map(cost, job)), i))
+    return queues, max(load for load, _ in loads)
+
+
+def run_jobs(jobs, process, workers=1):
+    """Process jobs with several threads, each taking the next job when it is free.
+
+    With jobs ordered by decreasing cost, this is the longest-processing-time-first schedule,
+    which also adapts to the actual duration of each job.
+
+    Parameters
+    ----------
+    jobs: iterable
+      output of `make_jobs()` or `waves()`; a job is taken from it when a thread is free
+    process: callable
+      function called with a job (a list of data objects), returning a dict of results by iRODS path
+    workers: int
+      number of threads
+
+    Returns
+    -------
+    results: dict
+      the results of all the jobs, by iRODS path; the exception raised for a job is the
+      result of all its objects
+    """
+    pending = iter(jobs)
+    results = {}
+    errors = []
+    lock = threading.Lock()
+    taking = threading.Lock()
+
+    def work():
+        while True:
+            # a generator cannot be advanced by several threads at the same time
+            with taking:
+                try:
+                    job = next(pending, None)
+                except Exception as e:
+                    errors.append(e)
+                    job = None
+            if job is None:
+                return
+            try:
+                outcome = process(job)
+            except Exception as e:
+                outcome = {x.path: e for x in job}
+            with lock:
+                results.update(outcome)
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+def connection_errors():
+    """Errors after which a session is not reused, e.g. when the agent timed out."""
+    from irods.exception import NetworkException
+
+    return (NetworkException, OSError)
+
+
+class SessionPool:
+    """Bounded pool of authenticated iRODS sessions, to be shared by threads.
+
+    A single session serialises the work of all the threads on one connection. The pool hands
+    each thread its own session, creates sessions on demand up to `size`, checks the sessions
+    that were idle for a while before handing them out again, closes those that were idle for too
+    long and replaces the sessions whose connection is broken.
+
+    Args:
+        env_path (str, optional): Path of the iRODS environment file, as for
+          `from_irods.authenticate_iRODS()`. Defaults to None.
+        size (int, optional): Maximum number of sessions. Defaults to 4.
+        max_idle (float, optional): Seconds after which an idle session is closed. Defaults to 600.
+        check_after (float, optional): Seconds of idleness after which a session is checked
+          before being reused. Defaults to 60.
+        factory (callable, optional): Function without arguments that creates a session.
+          Defaults to a session from the environment file.
+        check (callable, optional): Function that raises an error if a session cannot be used.
+          Defaults to getting the current working collection of the environment file.
+    """
+
+    def __init__(
+        self,
+        env_path=None,
+        size=4,
+        max_idle=600,
+        check_after=60,
+        factory=None,
+        check=None,
+    ):
+        if factory is None or check is None:
+            with open(env_path) as f:
+                cwd = json.load(f).get("irods_cwd")
+        self.env_path = env_path
+        self.size = size
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self.factory = factory or self._new_session
+        self.check = check or (lambda session: session.collections.get(cwd))
+        self.closed = False
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []  # (session, last used), most recently used last
+        self._created = 0
+        self._reconnects = 0
+
+    def _new_session(self):
+        from irods.session import iRODSSession
+
+        env_file = os.getenv("iRODS_ENVIRONMENT_FILE", self.env_path)
+        return iRODSSession(irods_env_file=env_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def stats(self):
+        """Get the number of sessions created, replaced after an error and currently idle."""
+        with self._lock:
+            return {
+                "created": self._created,
+                "reconnects": self._reconnects,
+                "idle": len(self._idle),
+            }
+
+    def _evict(self, now):
+        """Take out the sessions that were idle for too long (the caller closes them)."""
+        expired = [x for x, used in self._idle if now - used > self.max_idle]
+        self._idle = [x for x in self._idle if now - x[1] <= self.max_idle]
+        return expired
+
+    def checkout(self, timeout=None):
+        """Take a session from the pool, waiting for one if all of them are in use.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait. Defaults to None (no limit).
+
+        Returns:
+            iRODSSession: A session that must be given back with `checkin()`.
+        """
+        if self.closed:
+            raise RuntimeError("The session pool is closed.")
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("No iRODS session is available.")
+        try:
+            while True:
+                now = time.monotonic()
+                with self._lock:
+                    expired = self._evict(now)
+                    session, used = self._idle.pop() if self._idle else (None, now)
+                for x in expired:
+                    cleanup(x)
+                if session is None:
+                    session = self.factory()
+                    with self._lock:
+                        self._created += 1
+                    return session
+                if now - used <= self.check_after:
+                    return session
+                try:
+                    self.check(session)
+                    return session
+                except Exception:
+                    # e.g. the agent closed the connection: try the next one or a new session
+                    cleanup(session)
+                    with self._lock:
+                        self._reconnects += 1
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def checkin(self, session, broken=False):
+        """Give a session back to the pool.
+
+        Args:
+            session (iRODSSession): Session from `checkout()`.
+            broken (bool, optional): The session cannot be reused and is closed. Defaults to False.
+        """
+        try:
+            if broken or self.closed:
+                cleanup(session)
+                if broken:
+                    with self._lock:
+                        self._reconnects += 1
+            else:
+                with self._lock:
+                    self._idle.append((session, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def session(self, timeout=None):
+        """Use a session of the pool, e.g. `with pool.session() as session: ...`.
+
+        A session whose connection fails within the block is closed instead of being reused.
+        """
+        session = self.checkout(timeout)
+        broken = False
+        try:
+            yield session
+        except connection_errors():
+            broken = True
+            raise
+        finally:
+            self.checkin(session, broken)
+
+    def run(self, function, *args, retries=1, **kwargs):
+        """Call `function(session, *args, **kwargs)` with a session of the pool.
+
+        If the connection fails, the call is repeated with another session: use this for
+        operations that can safely be repeated, such as queries and checksums.
+
+        Args:
+            function (callable): Function with a session as first argument.
+            retries (int, optional): Number of times a call is repeated. Defaults to 1.
+
+        Returns:
+            The result of the function.
+        """
+        for attempt in range(retries + 1):
+            try:
+                with self.session() as session:
+                    return function(session, *args, **kwargs)
+            except connection_errors():
+                if attempt == retries:
+                    raise
+
+    def close(self):
+        """Close the idle sessions; the sessions in use are closed when they are given back."""
+        self.closed = True
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session, _ in idle:
+            cleanup(session)
+
+
+def cleanup(session):
+    """Close a session, ignoring errors of connections that are already broken."""
+    try:
+        session.cleanup()
+    except Exception:
+        pass
+
+
+@contextmanager
+def checkout(session):
+    """Use a session or a session of a pool.
+
+    This lets functions accept either an iRODS session or a `SessionPool` as `session` argument.
+    """
+    if isinstance(session, SessionPool):
+        with session.session() as s:
+            yield s
+    else:
+        yield session
@@ -0,0 +1,166 @@
+import os
+import queue
+import threading
+from irods2dataverse import metrics, replicas
+from irods2dataverse.session_pool import SessionPool, checkout
+
+# types of the iRODS resources whose replicas must be staged before they can be read
+ARCHIVE_TYPES = ("univmss",)
+# recalls requested at the same time from each archive resource
+PER_ARCHIVE = 4
+
+
+def archive_resources(data_objects, session, archive_types=ARCHIVE_TYPES):
+    """Find the archive (e.g. tape) resources among those holding the replicas of data objects.
+
+    Resources are archives if their type is one of `archive_types`, or if they are listed in
+    `IRODS2DATAVERSE_ARCHIVE_RESOURCES` (comma-separated names).
+
+    Parameters
+    ----------
+    data_objects: list
+      iRODSDataObjects meant for publication
+    session: iRODS session or SessionPool
+    archive_types: tuple
+      types of archive resources
+
+    Returns
+    -------
+    archives: set
+      names of the archive resources
+    """
+    from irods.column import In
+    from irods.models import Resource
+
+    names = {replicas.leaf(x.resc_hier) for obj in data_objects for x in obj.replicas}
+    listed = os.getenv("IRODS2DATAVERSE_ARCHIVE_RESOURCES", "")
+    archives = {x.strip() for x in listed.split(",") if x.strip()} & names
+    if not names:
+        return archives
+    with checkout(session) as session:
+        query = session.query(Resource.name, Resource.type).filter(
+            In(Resource.name, sorted(names))
+        )
+        for item in query:
+            if item[Resource.type] in archive_types:
+                archives.add(item[Resource.name])
+    return archives
+
+
+def is_online(obj, archives):
+    """Whether a data object has a good replica that can be read without staging."""
+    return any(
+        x.status == replicas.GOOD and replicas.leaf(x.resc_hier) not in archives
+        for x in obj.replicas
+    )
+
+
+def stage_replica(session, obj, replica, stage_to=None):
+    """Request the staging of an archive replica, by replicating it to an online resource.
+
+    Parameters
+    ----------
+    session: iRODS session
+    obj: iRODSDataObject
+      the object to stage
+    replica: iRODSReplica
+      its replica on the archive
+    stage_to: str
+      resource to replicate to, by default the root of the hierarchy of the archive replica
+      (e.g. a compound resource, which stages into its cache)
+    """
+    import irods.keywords as kw
+
+    target = stage_to or replica.resc_hier.split(";")[0]
+    if target == replicas.leaf(replica.resc_hier):
+        raise ValueError(
+            f"{obj.path} cannot be staged: set a resource to stage {target} to."
+        )
+    session.data_objects.replicate(obj.path, **{kw.DEST_RESC_NAME_KW: target})
+
+
+def stage(
+    data_objects,
+    session,
+    per_archive=PER_ARCHIVE,
+    stage_to=None,
+    archive_types=ARCHIVE_TYPES,
+):
+    """Stage the archive-resident data objects in bulk, and feed each object as soon as it is online.
+
+    The staging of all the objects that are only on an archive resource is requested right away,
+    `per_archive` at a time per archive resource, so that the recalls overlap each other and the
+    transfers of the objects yielded before. The objects that are already online are yielded
+    first. Staged objects are fetched again from the catalog, with their new replica; archive
+    resources are ranked last for reading (see `replicas.Ranker`).
+
+    Parameters
+    ----------
+    data_objects: list
+      iRODSDataObjects meant for publication
+    session: iRODS session or SessionPool
+    per_archive: int
+      recalls requested at the same time from each archive resource
+    stage_to: str
+      resource to stage to, see `stage_replica()`; by default `IRODS2DATAVERSE_STAGING_RESOURCE`
+    archive_types: tuple
+      types of archive resources
+
+    Returns
+    -------
+    objects: iterator
+      the data objects, each one once it can be read without waiting; an object that could
+      not be staged is still given (its first read will stage it)
+    """
+    stage_to = stage_to or os.getenv("IRODS2DATAVERSE_STAGING_RESOURCE")
+    archives = archive_resources(data_objects, session, archive_types)
+    replicas.ranker.deprioritize(archives)
+    online, offline = [], {}
+    for obj in data_objects:
+        if is_online(obj, archives):
+            online.append(obj)
+            continue
+        replica = replicas.ranker.choose(obj.replicas) or obj.replicas[0]
+        offline.setdefault(replicas.leaf(replica.resc_hier), []).append((obj, replica))
+
+    def run(function, *args):
+        if isinstance(session, SessionPool):
+            return session.run(function, *args)
+        return function(session, *args)
+
+    def fetch(s, path):
+        return s.data_objects.get(path)
+
+    done = queue.Queue()
+
+    def work(pending):
+        while True:
+            try:
+                obj, replica = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                with metrics.stage("staging"):
+                    run(stage_replica, obj, replica, stage_to)
+                obj = run(fetch, obj.path)
+                metrics.count("staged_objects")
+            except Exception as e:
+                print(f"{obj.path} could not be staged: {e}")
+            done.put(obj)
+
+    threads = []
+    for archive, objs in offline.items():
+        pending = queue.Queue()
+        for x in objs:
+            pending.put(x)
+        for _ in range(min(per_archive, len(objs))):
+            threads.append(threading.Thread(target=work, args=(pending,), daemon=True))
+    for thread in threads:
+        thread.start()
+
+    def feed():
+        yield from online
+        for _ in range(sum(map(len, offline.values()))):
+            yield done.get()
+
+    return feed()
@@ -0,0 +1,215 @@
+import queue
+import threading
+
+# size of the blocks read from iRODS: each read is a round trip to the server
+BLOCK_SIZE = 16 * 1024 * 1024
+# smallest buffer size: the sizes are powers of two from it, so that objects of any size share them
+MIN_BUFFER_SIZE = 64 * 1024
+# bytes of released buffers kept for reuse, all sizes together
+MAX_POOLED = 4 * BLOCK_SIZE
+
+_pool = {}
+_pooled = 0
+_pool_lock = threading.Lock()
+
+
+def buffer_size(size):
+    """Size of the buffer given for `size` bytes: the next power of two, at least `MIN_BUFFER_SIZE`."""
+    return max(MIN_BUFFER_SIZE, 1 << (max(1, size) - 1).bit_length())
+
+
+def take_buffer(size):
+    """Get a preallocated buffer of at least `size` bytes, reusing released ones."""
+    global _pooled
+    size = buffer_size(size)
+    with _pool_lock:
+        free = _pool.get(size)
+        if free:
+            _pooled -= size
+            return free.pop()
+    return bytearray(size)
+
+
+def release_buffer(buffer, max_pooled=MAX_POOLED):
+    """Give a buffer back for reuse by other readers, unless `max_pooled` bytes are kept already."""
+    global _pooled
+    with _pool_lock:
+        if _pooled + len(buffer) > max_pooled:
+            return
+        _pool.setdefault(len(buffer), []).append(buffer)
+        _pooled += len(buffer)
+
+
+class ReadAheadReader:
+    """Read a stream in large blocks, fetching the next block in the background.
+
+    HTTP clients read their request body in small chunks (e.g. 8 KiB). On an iRODS data object
+    each of those reads would be a round trip to the server. This reader serves them from memory
+    while a background thread fills the other of two (reused) buffers with the next block.
+
+    Args:
+        fileobj (file-like): Source stream, with `readinto()` or `read()`, e.g. the result of
+          `obj.open("r")` on an iRODS data object.
+        size (int, optional): Number of bytes that will be read. If given, it is reported as the
+          length of the reader (so that requests sends a Content-Length) and small streams get
+          smaller buffers. Defaults to None.
+        block_size (int, optional): Size of the blocks read from the source. Defaults to `BLOCK_SIZE`.
+        progress (callable, optional): Called with the number of bytes of each read from the
+          source, e.g. `progress.Transfer.add`. Defaults to None.
+    """
+
+    def __init__(self, fileobj, size=None, block_size=None, progress=None):
+        self.fileobj = fileobj
+        self.size = size
+        self.progress = progress
+        block_size = block_size or BLOCK_SIZE
+        if size is not None:
+            block_size = max(1, min(block_size, size))
+        self.block_size = block_size
+        self.position = 0
+        self.closed = False
+        self._free = queue.Queue()
+        self._filled = queue.Queue()
+        for _ in range(2):
+            self._free.put(take_buffer(block_size))
+        self._current = None
+        self._view = memoryview(b"")
+        self._offset = 0
+        self._last = False
+        self._thread = threading.Thread(target=self._fetch, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.size if self.size is not None else 0
+
+    def __bool__(self):
+        return True
+
+    def _fill(self, buffer, limit):
+        view = memoryview(buffer)[:limit]
+        n = 0
+        while n < limit:
+            if hasattr(self.fileobj, "readinto"):
+                read = self.fileobj.readinto(view[n:])
+            else:
+                chunk = self.fileobj.read(limit - n)
+                read = len(chunk)
+                view[n : n + read] = chunk
+            if not read:
+                break
+            n += read
+            if self.progress is not None:
+                self.progress(read)
+        return n
+
+    def _fetch(self):
+        """Background thread: fill free buffers until the end of the stream."""
+        total = 0
+        try:
+            while True:
+                buffer = self._free.get()
+                if buffer is None or self.closed:
+                    return
+                # the buffer can be larger than a block
+                limit = self.block_size
+                if self.size is not None:
+                    limit = min(limit, self.size - total)
+                n = self._fill(buffer, limit)
+                total += n
+                # a block that is not full is the last one, no need to read further
+                # than the announced size either
+                last = n < self.block_size or (
+                    self.size is not None and total >= self.size
+                )
+                self._filled.put((buffer, n, last))
+                if last:
+                    return
+        except BaseException as e:
+            self._filled.put(e)
+
+    def _next_block(self):
+        if self._current is not None:
+            self._free.put(self._current)
+            self._current = None
+        item = self._filled.get()
+        if isinstance(item, BaseException):
+            self._last = True
+            raise item
+        self._current, n, self._last = item
+        self._view = memoryview(self._current)[:n]
+        self._offset = 0
+
+    def _available(self):
+        """Make sure the current block has unread bytes; `False` at the end of the stream."""
+        while self._offset == len(self._view):
+            if self._last:
+                return False
+            self._next_block()
+        return True
+
+    def peek(self, n):
+        """Get up to `n` bytes without consuming them (at most the rest of the current block)."""
+        if not self._available():
+            return b""
+        return bytes(self._view[self._offset : self._offset + n])
+
+    def read(self, n=-1):
+        """Read up to `n` bytes (all the rest if `n` is negative); `b""` at the end."""
+        if n is None or n < 0:
+            chunks = []
+            while self._available():
+                chunks.append(self.read(len(self._view) - self._offset))
+            return b"".join(chunks)
+        if n == 0 or not self._available():
+            return b""
+        chunk = bytes(self._view[self._offset : self._offset + n])
+        self._offset += len(chunk)
+        self.position += len(chunk)
+        return chunk
+
+    def readinto(self, b):
+        if not self._available():
+            return 0
+        n = min(len(b), len(self._view) - self._offset)
+        memoryview(b)[:n] = self._view[self._offset : self._offset + n]
+        self._offset += n
+        self.position += n
+        return n
+
+    def __iter__(self):
+        """Iterate over the blocks, as bytes."""
+        while self._available():
+            yield self.read(len(self._view) - self._offset)
+
+    def tell(self):
+        return self.position
+
+    def readable(self):
+        return True
+
+    def close(self):
+        """Stop the background thread and release the buffers (the source stream is not closed)."""
+        if self.closed:
+            return
+        self.closed = True
+        self._free.put(None)
+        self._thread.join()
+        buffers = [self._current] if self._current is not None else []
+        while not self._filled.empty():
+            item = self._filled.get()
+            if not isinstance(item, BaseException):
+                buffers.append(item[0])
+        while not self._free.empty():
+            item = self._free.get()
+            if item is not None:
+                buffers.append(item)
+        self._current = None
+        self._view = memoryview(b"")
+        for buffer in buffers:
+            release_buffer(buffer)
@@ -0,0 +1,252 @@
+import os
+import re
+import time
+import threading
+from urllib.parse import urlsplit
+from irods2dataverse import metrics
+
+# bytes read from the source between two takes from the budgets, so that the rate stays smooth
+CHUNK_SIZE = 1024 * 1024
+UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+SCOPES = ("total", "resource", "installation")
+
+
+def parse_rate(text):
+    """Parse a rate in bytes per second, e.g. '50M' (MiB/s), '500K' or '1G'; `None` if empty or 0."""
+    text = (text or "").strip().upper()
+    if not text:
+        return None
+    match = re.fullmatch(r"([0-9.]+)\s*([KMG]?)(?:I?B)?(?:/S)?", text)
+    if match is None:
+        raise ValueError(f"Invalid rate {text}, expected e.g. 50M.")
+    rate = float(match.group(1)) * UNITS[match.group(2)]
+    return rate or None
+
+
+def parse_rates(text):
+    """Parse rates by name, e.g. 'disk1=20M,archive=5M'."""
+    rates = {}
+    for item in (text or "").split(","):
+        if "=" in item:
+            name, rate = item.split("=", 1)
+            rates[name.strip()] = parse_rate(rate)
+    return rates
+
+
+def installation_of(url):
+    """Name of the budget of a Dataverse installation: the host of its URL."""
+    return (urlsplit(url).netloc or url) if url else None
+
+
+class TokenBucket:
+    """Token bucket: bytes can be taken at `rate` on average, with bursts of up to `burst` bytes.
+
+    Takes are never refused: the bucket goes into debt and the taker waits until it is paid back,
+    so that concurrent takers are served in order.
+
+    Args:
+        rate (float, optional): Bytes per second, `None` for no limit. Defaults to None.
+        burst (float, optional): Bytes that can be taken at once. Defaults to one second of `rate`.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self._lock = threading.Lock()
+        self.rate = None
+        self._stamp = time.monotonic()
+        self._tokens = 0.0
+        self._start = None
+        self._bytes = 0
+        self.set_rate(rate, burst)
+
+    def _refill(self, now):
+        if self.rate:
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._stamp) * self.rate
+            )
+        self._stamp = now
+
+    def set_rate(self, rate, burst=None):
+        """Change the limit, also while transfers are running."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate or None
+            self.burst = burst or self.rate or 0
+            self._tokens = min(self._tokens, self.burst)
+
+    def reserve(self, n):
+        """Take `n` bytes; get the number of seconds to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            if self._start is None:
+                self._start = now
+            self._bytes += n
+            if not self.rate:
+                return 0.0
+            self._refill(now)
+            self._tokens -= n
+            return max(0.0, -self._tokens / self.rate)
+
+    def achieved(self):
+        """Average rate since the first take, in bytes per second (0 before)."""
+        with self._lock:
+            if self._start is None:
+                return 0.0
+            elapsed = time.monotonic() - self._start
+            return self._bytes / elapsed if elapsed > 0 else 0.0
+
+
+class Limiter:
+    """Budgets of throughput shared by all the transfers of the process.
+
+    A read counts against the total budget, the budget of the iRODS storage resource it comes
+    from, and the budget of the Dataverse installation it is uploaded to: it waits for the
+    most restrictive of them. The rates can be changed at any time with `set_rate()`.
+
+    Args:
+        total (float, optional): Bytes per second for all the transfers. Defaults to no limit.
+        resources (dict, optional): Bytes per second by storage resource name. Defaults to None.
+        installations (dict, optional): Bytes per second by Dataverse URL or host. Defaults to None.
+    """
+
+    def __init__(self, total=None, resources=None, installations=None):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self.set_rate("total", None, total)
+        for name, rate in (resources or {}).items():
+            self.set_rate("resource", name, rate)
+        for name, rate in (installations or {}).items():
+            self.set_rate("installation", name, rate)
+
+    def _bucket(self, scope, name):
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown scope {scope}, expected one of {SCOPES}.")
+        if scope == "installation":
+            name = installation_of(name)
+        key = (scope, None if scope == "total" else name)
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket()
+            return self._buckets[key]
+
+    def set_rate(self, scope, name=None, rate=None):
+        """Set the budget of a scope, in bytes per second (`None` for no limit).
+
+        Args:
+            scope (str): "total", "resource" or "installation".
+            name (str, optional): Storage resource, or URL or host of the installation.
+            rate (float, optional): Bytes per second. Defaults to no limit.
+        """
+        self._bucket(scope, name).set_rate(rate)
+
+    def _buckets_of(self, resource, installation):
+        buckets = [self._bucket("total", None)]
+        if resource:
+            buckets.append(self._bucket("resource", resource))
+        if installation:
+            buckets.append(self._bucket("installation", installation))
+        return buckets
+
+    def limited(self, resource=None, installation=None):
+        """Whether transfers from a resource to an installation have a budget."""
+        return any(x.rate for x in self._buckets_of(resource, installation))
+
+    def consume(self, n, resource=None, installation=None):
+        """Count `n` bytes against the budgets, waiting as long as needed.
+
+        Returns:
+            float: Seconds waited.
+        """
+        wait = max(x.reserve(n) for x in self._buckets_of(resource, installation))
+        if wait:
+            with metrics.stage("throttle"):
+                time.sleep(wait)
+        return wait
+
+    def reader(self, fileobj, resource=None, installation=None):
+        """Wrap a stream so that its reads count against the budgets."""
+        return ThrottledReader(fileobj, self, resource, installation)
+
+    def report(self):
+        """Get the allowed and achieved rates (bytes per second) of the budgets that were used.
+
+        Returns:
+            dict: {"allowed": rate or None, "achieved": rate} by (scope, name).
+        """
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {
+            key: {"allowed": bucket.rate, "achieved": bucket.achieved()}
+            for key, bucket in buckets.items()
+            if bucket.rate or bucket.achieved()
+        }
+
+
+class ThrottledReader:
+    """File-like object reading from a stream in chunks of at most `CHUNK_SIZE`, within the budgets.
+
+    Args:
+        fileobj (file-like): Source stream, e.g. an opened iRODS data object.
+        limiter (Limiter): Budgets to count the reads against.
+        resource (str, optional): Storage resource of the stream. Defaults to None.
+        installation (str, optional): Dataverse installation the data goes to. Defaults to None.
+    """
+
+    def __init__(self, fileobj, limiter, resource=None, installation=None):
+        self.fileobj = fileobj
+        self.limiter = limiter
+        self.resource = resource
+        self.installation = installation
+        # seconds spent waiting for the budgets
+        self.waited = 0.0
+
+    def __getattr__(self, name):
+        # seek, tell, close... go to the source stream
+        return getattr(self.fileobj, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.fileobj.close()
+
+    def _consume(self, n):
+        if n:
+            self.waited += self.limiter.consume(n, self.resource, self.installation)
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            chunks = []
+            while True:
+                chunk = self.read(CHUNK_SIZE)
+                if not chunk:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+        chunk = self.fileobj.read(min(n, CHUNK_SIZE))
+        self._consume(len(chunk))
+        return chunk
+
+    def readinto(self, b):
+        view = memoryview(b)[:CHUNK_SIZE]
+        if hasattr(self.fileobj, "readinto"):
+            n = self.fileobj.readinto(view)
+        else:
+            chunk = self.fileobj.read(len(view))
+            n = len(chunk)
+            view[:n] = chunk
+        self._consume(n)
+        return n
+
+
+def from_env():
+    """Budgets from `IRODS2DATAVERSE_BANDWIDTH` (total), `IRODS2DATAVERSE_RESOURCE_BANDWIDTH` and
+    `IRODS2DATAVERSE_INSTALLATION_BANDWIDTH` (e.g. 'disk1=20M,archive=5M', 'demo.dataverse.org=30M').
+    """
+    return Limiter(
+        parse_rate(os.getenv("IRODS2DATAVERSE_BANDWIDTH")),
+        parse_rates(os.getenv("IRODS2DATAVERSE_RESOURCE_BANDWIDTH")),
+        parse_rates(os.getenv("IRODS2DATAVERSE_INSTALLATION_BANDWIDTH")),
+    )
+
+
+# shared by all the transfers of the process
+limiter = from_env()
@@ -1,10 +1,11 @@
+import os
 import json
-from pyDataverse.api import NativeApi
-from pyDataverse.models import Datafile
-from pyDataverse.utils import read_file
-from configparser import ConfigParser
+import importlib
+from irods2dataverse import metrics
+from irods2dataverse.installations import registry
 
 
+@metrics.timed("authentication")
 def authenticate_DV(url, tk):
     """Check that the use can be authenticated to Dataverse.
 
@@ -22,6 +23,7 @@ def authenticate_DV(url, tk):
     api: list
         Status and pyDataverse object
     """
+    from pyDataverse.api import NativeApi
 
     api = NativeApi(url, tk)
     resp = api.get_info_version()
@@ -30,15 +32,16 @@ def authenticate_DV(url, tk):
     return status, api
 
 
-def instantiate_selected_class(installationName, config):
+def instantiate_selected_class(installationName, config=None):
     """Instantiate Dataset class based on the selected Dataverse installation.
 
     Parameters
     ----------
      installationName: str
         The Dataverse installation specified by the user
-    config: ini
-        The file to initialize the configured Dataset classes
+    config: ConfigParser
+        The configuration of the Dataset classes, by default the one of `installations.registry`
+        (whose classes are imported once)
 
     Returns
     -------
@@ -46,15 +49,30 @@ def instantiate_selected_class(installationName, config):
         The class to instantiate
     """
 
-    config_section = config[installationName]
-    modulename, classname = config_section["className"].split(".", 2)
-    importlib = __import__("importlib")
+    if config is None:
+        return registry.new_dataset(installationName)
+    modulename, classname = config[installationName]["className"].split(".", 1)
     module = importlib.import_module(f"irods2dataverse.{modulename}")
     selectedClass = getattr(module, classname)
 
     return selectedClass()
 
 
+def read_config():
+    """Read the configuration of the Dataverse installations.
+
+    The configuration is read once, from `IRODS2DATAVERSE_CONFIG` or the file shipped with the
+    package (see `installations.config_path()`).
+
+    Returns
+    -------
+    config: ConfigParser
+        One section per configured installation
+    """
+
+    return registry.config
+
+
 def setup(inp_dv, inp_tk):
     """Establish a session for the selected Dataverse installation and create an empty dataset.
 
@@ -77,19 +95,15 @@ def setup(inp_dv, inp_tk):
         The class that is instantiated
     """
 
-    # read once the configuration file located in a hard-coded path
-    config = ConfigParser()
-    config.read("src/irods2dataverse/customization.ini")
     # Check that the Dataverse installation is configured
-    if inp_dv in config.sections():
+    if inp_dv in registry:
         print("The selected Dataverse installation is configured")
         # Instantiate the Dataset class of the selected Dataverse installation
-        ds = instantiate_selected_class(inp_dv, config)
+        ds = registry.new_dataset(inp_dv)
         # Gen information of the instantiated class
-        BASE_URL = ds.baseURL
         mdPath = ds.metadata_template
-        # Authenticate to Dataverse installation
-        status, api = authenticate_DV(BASE_URL, inp_tk)
+        # Authenticate to Dataverse installation (once per token)
+        status, api = registry.authenticate(inp_dv, inp_tk)
         if status == 200:
             # If the user is authenticated, direct to the minimum metadata of the selected Dataverse installation
             msg = f"Minimum metadata should be provided to proceed with the publication.\nThe metadata template can be found in {mdPath}."
@@ -103,6 +117,7 @@ def setup(inp_dv, inp_tk):
     return api, ds
 
 
+@metrics.timed("validation")
 def validate_md(ds, md):
     """Validate that the metadata template is up-to-date
 
@@ -118,6 +133,8 @@ def validate_md(ds, md):
     resp : bool
         It is `True` if the metadata template fits the Dataverse expectations and `False` if it does not.
     """
+    from pyDataverse.utils import read_file
+
     if isinstance(md, str):
         md = read_file(md)
     elif isinstance(md, dict):
@@ -134,6 +151,7 @@ def validate_md(ds, md):
         return False
 
 
+@metrics.timed("dataset_create")
 def deposit_ds(api, ds):
     """Create a Dataverse dataset with user specified metadata
 
@@ -149,15 +167,18 @@ def deposit_ds(api, ds):
     dsStatus : bool
         Upload status
     dsPID : str
-        Dataset Persistent Identifier
+        Dataset Persistent Identifier, None if the dataset could not be created
     dsID : str
-        Dataverse Identifier
+        Dataverse Identifier, None if the dataset could not be created
     dsPURL : str
         Dataset Private URL
     """
 
     resp = api.create_dataset(ds.alias, ds.json()).json()
     dsStatus = resp["status"]
+    if dsStatus != "OK" or "data" not in resp:
+        print(f"The dataset could not be created: {resp.get('message', resp)}")
+        return dsStatus, None, None
     dsPID = resp["data"]["persistentId"]
     dsID = resp["data"]["id"]
     # resp = api.create_dataset_private_url(dsPID) # RDR does not allow PURL creation; move to Class definition?
@@ -170,7 +191,8 @@ def deposit_ds(api, ds):
     )  # dsPURL
 
 
-def deposit_df(api, dsPID, data_object_name, inp_path):
+@metrics.timed("transfer")
+def deposit_df(api, dsPID, data_object_name, inp_path, directoryLabel=None):
     """Upload the list of data files in Dataverse Dataset
 
     Parameters
@@ -183,6 +205,8 @@ def deposit_df(api, dsPID, data_object_name, inp_path):
         The name of the file destined for publication
     inp_path: str
         The path to the local directory to save the data files
+    directoryLabel: str
+        The folder of the file in the dataset, if any
 
     Returns
     -------
@@ -191,14 +215,144 @@ def deposit_df(api, dsPID, data_object_name, inp_path):
     dfPID: list
         String in JSON format with persistent ID and filename.
     """
+    from pyDataverse.models import Datafile
 
     df = Datafile()
-    df.set({"pid": dsPID, "filename": data_object_name})
+    df_md = {"pid": dsPID, "filename": data_object_name}
+    if directoryLabel:
+        df_md["directoryLabel"] = directoryLabel
+    df.set(df_md)
     df.get()
     resp = api.upload_datafile(dsPID, f"{inp_path}/{data_object_name}", df.json())
+    metrics.count("bytes_uploaded", os.path.getsize(f"{inp_path}/{data_object_name}"))
     # if resp.status_code != 200: # deal with errors?
     #     return resp
 
     print(f"{data_object_name} is uploaded")
 
     return resp.json()  # , df.json()
+
+
+@metrics.timed("listing")
+def list_ds_files(api, dsPID):
+    """List the files of the latest version of a Dataverse dataset
+
+    Parameters
+    ----------
+    api : list
+        Status and pyDataverse object
+    dsPID : str
+        Dataset Persistent Identifier
+
+    Returns
+    -------
+    dsFiles: dict
+        The files of the dataset, by their path (directory label and file name).
+        Each value has the file `id`, its `checksum` (dict with `type` and `value`),
+        its `storageIdentifier` and its `filesize`.
+    """
+
+    resp = api.get_datafiles_metadata(dsPID, version=":latest")
+    if resp.status_code != 200:
+        raise ConnectionError("The files of the dataset could not be listed", resp)
+    dsFiles = {}
+    for item in resp.json()["data"]:
+        df = item["dataFile"]
+        path = "/".join(x for x in [item.get("directoryLabel"), item["label"]] if x)
+        dsFiles[path] = {
+            "id": df["id"],
+            "label": item["label"],
+            "checksum": df.get("checksum", {}),
+            "storageIdentifier": df.get("storageIdentifier"),
+            "filesize": df.get("filesize"),
+        }
+
+    return dsFiles
+
+
+@metrics.timed("transfer")
+def replace_df(api, file_id, data_object_name, inp_path):
+    """Replace a data file of a Dataverse Dataset with a new version
+
+    Parameters
+    ----------
+    api : list
+        Status and pyDataverse object
+    file_id : int
+        Dataverse identifier of the file to replace
+    data_object_name : str
+        The name of the file destined for publication
+    inp_path: str
+        The path to the local directory where the data file was saved
+
+    Returns
+    -------
+    dfResp: dict
+        API response from the replacement
+    """
+
+    resp = api.replace_datafile(
+        file_id,
+        f"{inp_path}/{data_object_name}",
+        json.dumps({"forceReplace": True}),
+        is_filepid=False,
+    )
+    metrics.count("bytes_uploaded", os.path.getsize(f"{inp_path}/{data_object_name}"))
+
+    print(f"{data_object_name} is replaced")
+
+    return resp.json()
+
+
+@metrics.timed("listing")
+def get_published(url, dsPIDs, tk=None, per_request=100):
+    """Find which datasets have a published version, with as few requests as possible
+
+    The search API is queried for many persistent identifiers at once.
+    Datasets that are not found have no published version (or are not indexed yet).
+
+    Parameters
+    ----------
+    url: str
+        The URL to the Dataverse installation
+    dsPIDs: list
+        Dataset Persistent Identifiers
+    tk: str
+        The Dataverse API Token, optional since published datasets are public
+    per_request: int
+        Number of persistent identifiers queried per request
+
+    Returns
+    -------
+    published: dict
+        Publication date of the published datasets, by persistent identifier
+    """
+    from pyDataverse.api import SearchApi
+
+    api = SearchApi(url.rstrip("/"), tk)
+    dsPIDs = list(dsPIDs)
+    published = {}
+    for i in range(0, len(dsPIDs), per_request):
+        q_str = " OR ".join(
+            f'dsPersistentId:"{pid}"' for pid in dsPIDs[i : i + per_request]
+        )
+        start = 0
+        while True:
+            resp = api.search(
+                q_str,
+                data_type="dataset",
+                per_page=1000,
+                start=start,
+                auth=tk is not None,
+            )
+            if resp.status_code != 200:
+                raise ConnectionError("The search API could not be queried", resp)
+            data = resp.json()["data"]
+            for item in data["items"]:
+                if item.get("versionState") == "RELEASED":
+                    published[item["global_id"]] = item.get("published_at")
+            start += len(data["items"])
+            if len(data["items"]) == 0 or start >= data["total_count"]:
+                break
+
+    return published
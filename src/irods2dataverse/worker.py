@@ -0,0 +1,639 @@
+import os
+import time
+import zlib
+import socket
+import argparse
+import datetime
+import posixpath
+import threading
+from irods2dataverse import from_irods
+from irods2dataverse.session_pool import SessionPool, checkout
+
+atr_publish = "dv.publication"
+atr_lease = "dv.lease"
+atr_dv = "dv.installation"
+atr_doi = "dv.ds.DOI"
+# statuses of the data objects that are still to be deposited: 'processed' ones were left by
+# a worker or a user that stopped (their lease is no longer held)
+PENDING = ("initiated", "processed")
+
+
+def default_worker_id():
+    """Identifier of this worker: host name and process id."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def parse_lease(avu):
+    """Get the worker id and expiry (epoch seconds) of a lease AVU, whose value is 'worker@expiry'."""
+    worker_id, _, expiry = avu.value.rpartition("@")
+    return worker_id, float(expiry)
+
+
+class Lease:
+    """Lease on a data object or collection, stored as an AVU 'dv.lease: <worker id>@<expiry>'.
+
+    iRODS has no compare-and-swap on metadata, so a lease is claimed in two steps: the worker adds
+    its lease (removing any expired one) in one atomic operation, then reads the leases back.
+    If several workers claimed at the same time, the lease that was added first (lowest AVU id)
+    wins and the others withdraw. The expiry lets other workers reclaim the work of a worker that
+    died; the holder renews the lease while working (see `keep()`), and must stop working once
+    it is lost (see `lost`).
+    The clocks of the workers are assumed to be synchronised (e.g. with NTP).
+
+    Args:
+        target (iRODSDataObject or iRODSCollection): What is claimed.
+        worker_id (str, optional): Identifier of the worker. Defaults to `default_worker_id()`.
+        ttl (float, optional): Seconds before the lease expires if it is not renewed. Defaults to 600.
+    """
+
+    def __init__(self, target, worker_id=None, ttl=600):
+        self.target = target
+        self.worker_id = worker_id or default_worker_id()
+        self.ttl = ttl
+        self.value = None
+        # set when the lease could not be renewed: another worker may hold it
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def _leases(self):
+        leases = []
+        for avu in self.target.metadata.get_all(atr_lease):
+            try:
+                leases.append((avu, *parse_lease(avu)))
+            except ValueError:
+                continue
+        return leases
+
+    def _replace(self, remove, expiry):
+        from irods.meta import iRODSMeta, AVUOperation
+
+        value = f"{self.worker_id}@{expiry:.3f}"
+        operations = [
+            AVUOperation(operation="remove", avu=iRODSMeta(atr_lease, x))
+            for x in remove
+        ] + [AVUOperation(operation="add", avu=iRODSMeta(atr_lease, value))]
+        self.target.metadata.apply_atomic_operations(*operations)
+        self.value = value
+
+    def holder(self, now=None):
+        """Get the value of the winning valid lease, or `None` if there is none."""
+        now = time.time() if now is None else now
+        valid = [x for x in self._leases() if x[2] > now]
+        if not valid:
+            return None
+        # deterministic tie-break: first lease added, then worker id
+        return min(valid, key=lambda x: (x[0].avu_id, x[1]))[0].value
+
+    def acquire(self):
+        """Claim the lease.
+
+        Returns:
+            bool: True if this worker holds the lease, False if another one does.
+        """
+        now = time.time()
+        self.lost.clear()
+        leases = self._leases()
+        if any(
+            expiry > now and worker != self.worker_id for _, worker, expiry in leases
+        ):
+            return False
+        # reclaim expired leases and our own from a previous run
+        self._replace(
+            [x[0].value for x in leases if x[2] <= now or x[1] == self.worker_id],
+            now + self.ttl,
+        )
+        if self.holder() == self.value:
+            return True
+        self.release()
+        return False
+
+    def renew(self):
+        """Extend the lease by `ttl` seconds.
+
+        Returns:
+            bool: False if the lease was lost, e.g. because it expired and was reclaimed.
+        """
+        if self.value is None or self.holder() != self.value:
+            return False
+        self._replace([self.value], time.time() + self.ttl)
+        return self.holder() == self.value
+
+    def release(self):
+        """Remove the lease of this worker."""
+        from irods.meta import iRODSMeta, AVUOperation
+
+        self._stop.set()
+        if self.value is not None and not self.lost.is_set():
+            self.target.metadata.apply_atomic_operations(
+                AVUOperation(operation="remove", avu=iRODSMeta(atr_lease, self.value))
+            )
+            self.value = None
+
+    def keep(self):
+        """Renew the lease in the background, every third of its `ttl`, until it is released or lost."""
+
+        def heartbeat():
+            while not self._stop.wait(self.ttl / 3):
+                if not self.renew():
+                    print(f"The lease on {self.target.path} was lost.")
+                    self.lost.set()
+                    return
+
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=heartbeat, daemon=True)
+        self._heartbeat.start()
+
+    def __enter__(self):
+        if not self.acquire():
+            raise RuntimeError(f"{self.target.path} is claimed by another worker.")
+        self.keep()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+def group_by_collection(data_objects):
+    """Group data objects by the collection that contains them.
+
+    Parameters
+    ----------
+    data_objects: list
+      iRODSDataObjects
+
+    Returns
+    -------
+    groups: dict
+      data objects by collection path
+    """
+    groups = {}
+    for obj in data_objects:
+        groups.setdefault(posixpath.dirname(obj.path), []).append(obj)
+    return groups
+
+
+def pending(obj):
+    """Whether a data object is still waiting to be deposited, e.g. after waiting for a lease."""
+    return any(x.value in PENDING for x in obj.metadata.get_all(atr_publish))
+
+
+def interrupted_dataset(obj):
+    """DOI of the dataset in which the deposit of a 'processed' data object was interrupted, if any.
+
+    The DOI is added once the dataset is created: an object without one is deposited in a new
+    dataset. If the object was deposited before, the latest DOI is the one of the dataset created
+    last (highest AVU id).
+    """
+    if not any(x.value == "processed" for x in obj.metadata.get_all(atr_publish)):
+        return None
+    dois = obj.metadata.get_all(atr_doi)
+    return max(dois, key=lambda x: x.avu_id).value if dois else None
+
+
+def claim(session, data_objects, worker_id=None, ttl=600):
+    """Lease the collections of data objects, like `work()` does, e.g. for an interactive deposit.
+
+    The leases are renewed in the background until they are released.
+
+    Parameters
+    ----------
+    session: iRODS session
+      the session of the data objects: the leases are used with it
+    data_objects: list
+      iRODSDataObjects selected for publication
+    worker_id: str
+      identifier of this worker, by default `default_worker_id()`
+    ttl: float
+      seconds before a lease of a worker that stopped can be reclaimed
+
+    Returns
+    -------
+    claimed: list
+      the data objects of the collections that no other worker holds
+    leases: list
+      Lease of each claimed collection, to release at the end
+    """
+    worker_id = worker_id or default_worker_id()
+    claimed = []
+    leases = []
+    for path, objs in sorted(group_by_collection(data_objects).items()):
+        lease = Lease(session.collections.get(path), worker_id, ttl)
+        if not lease.acquire():
+            continue
+        lease.keep()
+        leases.append(lease)
+        claimed.extend(objs)
+    return claimed, leases
+
+
+def dataset_metadata(ds, data_objects):
+    """Fill in the metadata template of an installation from the ManGO metadata of data objects.
+
+    Parameters
+    ----------
+    ds: Dataset
+      the Dataset for the selected Dataverse installation
+    data_objects: list
+      iRODSDataObjects, the first one with ManGO metadata for the installation is used
+
+    Returns
+    -------
+    md: dict
+      the dataset metadata, or `None` if no object has ManGO metadata
+    """
+    from irods2dataverse import avu2json
+
+    for obj in data_objects:
+        metadata = avu2json.parse_mango_metadata(ds.mango_schema, obj)
+        if metadata:
+            return avu2json.get_template(ds.metadata_template, metadata)
+    return None
+
+
+def deposit_group(
+    data_objects,
+    api,
+    ds,
+    token,
+    md,
+    session=None,
+    trg_path="doc/data",
+    policy=None,
+    workers=4,
+    engine=None,
+    dsPID=None,
+    lease=None,
+):
+    """Create a dataset for claimed data objects and upload them, without asking anything.
+
+    The steps are those of `userScript.py`: the objects are set to 'processed', the dataset is
+    created, its DOI is added to the objects, which are uploaded with the strategy supported by
+    the installation and set to 'deposited'. With `dsPID`, an interrupted deposit is resumed
+    instead: the objects already in the dataset are only set to 'deposited'. The objects that
+    do not fit in the limits of the installation or in a single dataset (see `plan.make_plan()`)
+    are left 'initiated', for a later deposit.
+
+    Parameters
+    ----------
+    data_objects: list
+      iRODSDataObjects to deposit in the same dataset
+    api: list
+      pyDataverse object, authenticated with `token`
+    ds: Dataset
+      the Dataset for the selected Dataverse installation
+    token: str
+      the Dataverse token
+    md: dict
+      the dataset metadata, e.g. from `dataset_metadata()`
+    session: iRODS session or SessionPool
+      to recall the objects stored on tape and find their replicas in S3
+    trg_path: str
+      local directory to save data, with the 'native' strategy
+    policy: str
+      scheduling policy of the uploads, see `deposit.upload_objects()`
+    workers: int
+      number of threads with a scheduling policy
+    engine: str
+      'async' to send the uploads from an event loop, see `deposit.upload_objects()`
+    dsPID: str
+      DOI of the dataset of an interrupted deposit, see `interrupted_dataset()`; `md` is not
+      used then
+    lease: Lease
+      the lease on the data objects: once it is lost, the deposit stops between two steps or
+      two objects, leaving the rest to the worker that holds it
+
+    Returns
+    -------
+    deposited: list
+      the data objects deposited in the dataset
+    """
+    from irods2dataverse import (
+        capabilities,
+        deposit,
+        direct_upload,
+        plan,
+        s3_copy,
+        staging,
+        to_dataverse,
+    )
+
+    def lost():
+        if lease is not None and lease.lost.is_set():
+            print(f"The deposit of {len(data_objects)} data objects is stopped.")
+            return True
+        return False
+
+    done = []
+    if lost():
+        return []
+    header_key, header_ct = direct_upload.create_headers(token)
+    files_in_dataset = 0
+    if dsPID is not None:
+        # registered before the interruption, but not marked
+        ds_files = to_dataverse.list_ds_files(api, dsPID)
+        changes = deposit.compare_files(data_objects, ds_files)
+        done = [x for x, _, _ in changes["unchanged"] + changes["moved"]]
+        for item in done:
+            deposit.mark_deposited(item, session=session)
+        data_objects = [x for x in data_objects if x not in done]
+        files_in_dataset = len(ds_files)
+
+    # checked before the dataset is created, so that no dataset is left empty
+    limits = dict(
+        capabilities.get_capabilities(api.base_url, ds.alias, header_key, dsPID)
+    )
+    limits["quota"], limits["storage_use"] = capabilities.get_storage(
+        api.base_url, ds.alias, header_key
+    )
+    deposit_plan = plan.make_plan(
+        data_objects, limits, files_in_dataset=files_in_dataset
+    )
+    left_out = [x for x, _ in deposit_plan["rejected"] + deposit_plan["deferred"]]
+    # a single dataset per group: the next batches are left for the next rounds
+    for batch in deposit_plan["batches"][1:]:
+        left_out.extend(batch)
+    if left_out:
+        print(plan.format_plan(deposit_plan))
+    for item in left_out:
+        if dsPID is not None:
+            # not resumed in this dataset
+            with from_irods.bound(item, session) as obj:
+                obj.metadata.remove(atr_doi, dsPID)
+        from_irods.save_md(item, atr_publish, "initiated", op="set")
+    data_objects = (deposit_plan["batches"] or [[]])[0]
+    if not data_objects:
+        return done
+
+    if dsPID is None:
+        if not to_dataverse.validate_md(ds, md):
+            print(f"The metadata of the dataset are not valid for {ds.name}.")
+            return []
+        for item in data_objects:
+            from_irods.save_md(item, atr_publish, "processed", op="set")
+            from_irods.save_md(
+                item, "dv.publication.timestamp", datetime.datetime.now(), op="set"
+            )
+        dsStatus, dsPID, dsID = to_dataverse.deposit_ds(api, ds)
+        if dsPID is None:
+            # left for another attempt
+            for item in data_objects:
+                from_irods.save_md(item, atr_publish, "initiated", op="set")
+            return []
+        for item in data_objects:
+            from_irods.save_md(item, atr_doi, dsPID, op="add")
+
+    strategy = capabilities.choose_strategy(
+        capabilities.get_capabilities(api.base_url, ds.alias, header_key, dsPID)
+    )
+    staged = data_objects
+    sources = {}
+    if session is not None:
+        staged = staging.stage(data_objects, session)
+        if strategy != "native":
+            sources = s3_copy.find_sources(data_objects, session)
+    ingest = os.getenv("IRODS2DATAVERSE_TAB_INGEST", "true").lower() != "false"
+    if lost():
+        return done
+    return done + deposit.upload_objects(
+        staged,
+        strategy,
+        api,
+        dsPID,
+        header_key,
+        header_ct,
+        session=session,
+        trg_path=trg_path,
+        ingest=ingest,
+        sources=sources,
+        policy=policy,
+        workers=workers,
+        engine=engine,
+        stop=None if lease is None else lease.lost,
+    )
+
+
+def make_process(session, tokens, policy=None, workers=4, engine=None):
+    """Make the `process` of `work()` that deposits each group of objects in a dataset.
+
+    The installation of a group comes from its 'dv.installation' metadata and the dataset
+    metadata from its ManGO metadata. Groups without either are left 'initiated'. The objects
+    whose deposit was interrupted are deposited in their dataset (see `interrupted_dataset()`).
+
+    Parameters
+    ----------
+    session: iRODS session or SessionPool
+    tokens: dict
+      Dataverse token by installation name
+    policy: str
+      scheduling policy of the uploads, see `deposit.upload_objects()`
+    workers: int
+      number of threads with a scheduling policy
+    engine: str
+      'async' to send the uploads from an event loop, see `deposit.upload_objects()`
+
+    Returns
+    -------
+    process: callable
+      function of the collection path, the list of claimed data objects and their lease
+    """
+    from irods2dataverse import to_dataverse
+    from irods2dataverse.installations import registry
+
+    def process(path, data_objects, lease=None):
+        ldv = from_irods.query_dv(atr_dv, data_objects, registry.names())
+        if len(ldv) != 1 or "missing" in ldv:
+            print(f"{path}: the data objects need a single <{atr_dv}>.")
+            return
+        [inp_dv] = ldv
+        if not tokens.get(inp_dv):
+            print(f"{path}: there is no token for {inp_dv}.")
+            return
+        api, ds = to_dataverse.setup(inp_dv, tokens[inp_dv])
+        if api is None:
+            return
+        datasets = {}
+        for obj in data_objects:
+            datasets.setdefault(interrupted_dataset(obj), []).append(obj)
+        # the interrupted deposits first, then a new dataset for the others
+        for dsPID, objs in sorted(datasets.items(), key=lambda x: x[0] is None):
+            md = None
+            if dsPID is None:
+                md = dataset_metadata(ds, objs)
+                if md is None:
+                    print(f"{path}: no ManGO metadata for {inp_dv} were found.")
+                    continue
+            try:
+                deposited = deposit_group(
+                    objs,
+                    api,
+                    ds,
+                    tokens[inp_dv],
+                    md,
+                    session=session,
+                    policy=policy,
+                    workers=workers,
+                    engine=engine,
+                    dsPID=dsPID,
+                    lease=lease,
+                )
+            except Exception as e:
+                print(f"{path} could not be deposited: {e}")
+                continue
+            print(
+                f"{path}: {len(deposited)} of {len(objs)} data objects are deposited."
+            )
+
+    return process
+
+
+def work(session, process, worker_id=None, ttl=600, groups=True):
+    """Process the data objects tagged for publication that no other worker claimed.
+
+    Several workers, on the same or different nodes, can run this against the same zone:
+    each group of objects is processed by a single worker. With `groups`, the objects of a
+    collection are claimed together (one lease on the collection), so that they end up in the
+    same dataset; otherwise each object is claimed on its own. The objects left 'processed' by
+    a worker that stopped are claimed again once its lease expires, and given to `process`
+    with the 'initiated' ones.
+
+    Parameters
+    ----------
+    session: iRODS session or SessionPool
+      a pool needs at least 2 sessions: one is held for each group while it is processed, and
+      the processing checks out the others (e.g. to stage and upload the objects)
+    process: callable
+      function called with the collection path, the list of claimed data objects and their
+      Lease, e.g. to create a dataset and deposit them (or resume their deposit, see
+      `interrupted_dataset()`). It must change their 'dv.publication' status, and stop once
+      the lease is lost.
+      With a SessionPool, the objects are bound to a session checked out for the call.
+    worker_id: str
+      identifier of this worker, by default `default_worker_id()`
+    ttl: float
+      seconds before a lease of a worker that stopped can be reclaimed
+    groups: bool
+      claim collections instead of individual objects
+
+    Returns
+    -------
+    processed: list
+      paths of the collections or objects processed by this worker
+    """
+    if isinstance(session, SessionPool) and session.size < 2:
+        raise ValueError(
+            "The pool of iRODS sessions of a worker needs at least 2 sessions."
+        )
+    worker_id = worker_id or default_worker_id()
+    paths = sorted(
+        {
+            x
+            for status in PENDING
+            for x in from_irods.query_paths(atr_publish, status, session)
+        }
+    )
+    if groups:
+        targets = {}
+        for path in paths:
+            targets.setdefault(posixpath.dirname(path), []).append(path)
+        targets = sorted(targets.items())
+    else:
+        targets = [(path, [path]) for path in paths]
+
+    # workers start at different places of the list, to avoid contending for the same leases
+    start = zlib.crc32(worker_id.encode()) % len(targets) if targets else 0
+    processed = []
+    for path, obj_paths in targets[start:] + targets[:start]:
+        # the objects are only used with this session, until they are processed
+        with checkout(session) as s:
+            if groups:
+                target = s.collections.get(path)
+            else:
+                target = s.data_objects.get(path)
+            lease = Lease(target, worker_id, ttl)
+            if not lease.acquire():
+                continue
+            lease.keep()
+            try:
+                # another worker may have finished them since the query
+                objs = [s.data_objects.get(x) for x in obj_paths]
+                objs = [x for x in objs if pending(x)]
+                if objs:
+                    process(path, objs, lease)
+                    processed.append(path)
+            finally:
+                lease.release()
+    return processed
+
+
+if __name__ == "__main__":
+    """Deposit worker: several can run at once, on the same or different nodes."""
+    from irods2dataverse import profiling
+
+    parser = argparse.ArgumentParser(
+        description="Deposit the data objects tagged for publication that no other worker claimed."
+    )
+    parser.add_argument(
+        "-e",
+        "--environment",
+        default=os.path.expanduser("~/.irods/irods_environment.json"),
+        help="Path to the iRODS environment file.",
+    )
+    parser.add_argument(
+        "-s",
+        "--sessions",
+        type=int,
+        default=4,
+        help="Number of iRODS sessions, at least 2.",
+    )
+    parser.add_argument(
+        "--ttl",
+        type=float,
+        default=600,
+        help="Seconds before the leases of a worker that stopped can be reclaimed.",
+    )
+    parser.add_argument(
+        "--objects",
+        action="store_true",
+        help="Claim each data object on its own instead of its collection.",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="Profile the run and write the reports in a new directory under DIR.",
+    )
+    parser.add_argument(
+        "--profile-cpu",
+        choices=profiling.CPU_MODES,
+        help="How the CPU time is profiled: sampling all the threads (default) or cProfile on the main thread.",
+    )
+    args = parser.parse_args()
+    if args.sessions < 2:
+        # one session is held for each group while it is processed
+        parser.error("a worker needs at least 2 iRODS sessions")
+
+    from irods2dataverse import schedule
+    from irods2dataverse.installations import registry
+
+    session = from_irods.authenticate_pool(args.environment, args.sessions)
+    if not session:
+        raise SystemExit(1)
+    # e.g. DATAVERSE_TOKEN_RDR_PILOT for RDR-pilot
+    tokens = {
+        x: os.getenv(f"DATAVERSE_TOKEN_{x.upper().replace('-', '_')}")
+        for x in registry.names()
+    }
+    policy = os.getenv("IRODS2DATAVERSE_SCHEDULE")
+    if policy not in schedule.POLICIES:
+        policy = None
+    process = make_process(
+        session,
+        tokens,
+        policy=policy,
+        workers=int(os.getenv("IRODS2DATAVERSE_UPLOAD_WORKERS", "4")),
+        engine=os.getenv("IRODS2DATAVERSE_ENGINE"),
+    )
+    with profiling.profile_run(args.profile, args.profile_cpu):
+        processed = work(session, process, ttl=args.ttl, groups=not args.objects)
+    print(f"{len(processed)} groups of data objects are processed.")
+    session.close()
@@ -1,14 +1,26 @@
-from irods2dataverse import from_irods, to_dataverse, direct_upload, avu2json
+from irods2dataverse import (
+    from_irods,
+    to_dataverse,
+    direct_upload,
+    avu2json,
+    deposit,
+    capabilities,
+    plan,
+    prewarm,
+    profiling,
+    progress,
+    s3_copy,
+    schedule,
+    staging,
+    throttle,
+    worker,
+)
 import json
-import maskpass
+import time
+import atexit
+import argparse
 import datetime
 import os.path
-from rich.console import Console
-from rich.style import Style
-from rich.panel import Panel
-from rich.prompt import Prompt, Confirm
-from rich.table import Table
-
 
 # Test with 2 files /set/home/datateam_set/iRODS2DV/20240718_demo
 # Use DVUploader and Include an option on which upload method should be chosen.
@@ -17,20 +29,30 @@ from rich.table import Table
 # This script implements the perspective where the individual data objects destined for publication are either annotated with metadata or their path is provided.
 # Another perspective that could be explored is the case where the dataset is all in a pre-specified iRODS collection and the structure is mirrored in Dataverse.
 
-# define custom colors
-info = Style(color="cyan")
-action = Style(color="yellow")
-warning = Style(color="red")
-panel_blue = Style(color="white", bold=True, bgcolor="blue")
-panel_black = Style(color="white", bgcolor="black")
 
-# create a rich console
-c = Console()
+def main():
+    """Publish data objects from iRODS in a Dataverse installation, asking the user along the way."""
+    import maskpass
+    from rich.console import Console
+    from rich.style import Style
+    from rich.panel import Panel
+    from rich.prompt import Prompt, Confirm
+    from rich.table import Table
+
+    # define custom colors
+    info = Style(color="cyan")
+    action = Style(color="yellow")
+    warning = Style(color="red")
+    panel_blue = Style(color="white", bold=True, bgcolor="blue")
+    panel_black = Style(color="white", bgcolor="black")
+
+    # create a rich console
+    c = Console()
 
-# --- Print instructions for the metadata-driven process --- #
-c.print(
-    Panel.fit(
-        """
+    # --- Print instructions for the metadata-driven process --- #
+    c.print(
+        Panel.fit(
+            """
  To drive the process based on metadata, go to your selected zone 
  and add the following metadata to at least one data object 
  for a configured Dataverse installation (e.g. Demo):             
@@ -38,299 +60,457 @@ c.print(
     A: dv.installation  V: Demo
 The configured Dataverse installations are: Demo, RDR, RDR-pilot  
                    """,
-        style=panel_blue,
-        title="Instructions",
+            style=panel_blue,
+            title="Instructions",
+        )
     )
-)
 
+    # --- Provide the iRODS environment file to authenticate in a specific zone --- #
 
-# --- Provide the iRODS environment file to authenticate in a specific zone --- #
+    print("\nAuthenticate to iRODS zone...")
+    session = from_irods.authenticate_iRODS(
+        os.path.expanduser("~") + "/.irods/irods_environment.json"
+    )
+    if session:
+        c.print("You are now authenticated to iRODS", style=info)
+    else:
+        raise SystemExit
 
-print("\nAuthenticate to iRODS zone...")
-session = from_irods.authenticate_iRODS(
-    os.path.expanduser("~") + "/.irods/irods_environment.json"
-)
-if session:
-    c.print("You are now authenticated to iRODS", style=info)
-else:
-    raise SystemExit
+    # --- Select Data: if there is no metadata specifying the object that needs to be published, ask user to provide the path --- #
 
+    print(
+        "Select data in iRODS, via attached metadata in iRODS or via iRODS paths as typed input"
+    )
 
-# --- Select Data: if there is no metadata specifying the object that needs to be published, ask user to provide the path --- #
+    atr_publish = "dv.publication"
+    val = "initiated"
 
-print(
-    "Select data in iRODS, via attached metadata in iRODS or via iRODS paths as typed input"
-)
+    data_objects_list = from_irods.query_data(
+        atr_publish, val, session
+    )  # look for data based on A = dv.publication & value = initiated
 
-atr_publish = "dv.publication"
-val = "initiated"
+    if len(data_objects_list) == 0:  # ldt = qdata
+        c.print(
+            f"No metadata with attribute <{atr_publish}> and value <{val}> are found.",
+            style=info,
+        )
+        add = True
+        while add:
+            inp_i = input(
+                "Provide the full iRODS path and name of the data object to be published in one of the configured Dataverse installations:\n"
+            )
+            try:
+                obj = session.data_objects.get(inp_i)
+                data_objects_list.append(obj)
+                if from_irods.save_md(obj, atr_publish, val, op="set"):
+                    c.print(
+                        f"Metadata with attribute <{atr_publish}> and value <{val}> are added in the selected data object."
+                    )
+                else:
+                    c.print(
+                        f"The path of the data object is not correct. Please provide a correct path. \n Hint: /zone/home/collection/folder/filename",
+                        style=warning,
+                    )
+            except Exception as e:  # change this to specific exception
+                c.print(
+                    f"The path of the data object is not correct. Please provide a correct path. \n Hint: /zone/home/collection/folder/filename",
+                    style=warning,
+                )
+            add = Confirm.ask("Add more objects? y/n\n")
+    else:
+        c.print(
+            f"Metadata with attribute <{atr_publish}> and value <{val}> are found in iRODS.",
+            style=info,
+        )
 
+    # --- Claim the collections of the selected data, as the deposit workers do --- #
+    claimed, leases = worker.claim(session, data_objects_list)
+    for lease in leases:
+        atexit.register(lease.release)
+    if len(claimed) < len(data_objects_list):
+        c.print(
+            f"{len(data_objects_list) - len(claimed)} data objects are being deposited by another worker and are left out.",
+            style=warning,
+        )
+        data_objects_list = claimed
+    if not data_objects_list:
+        session.cleanup()
+        raise SystemExit
+
+    # --- Print a table of the selected data --- #
+    c.print("The following objects are selected for publication:", style=info)
+    table = Table(title="data object overview")
+    table.add_column("unique id", justify="right", style="cyan", no_wrap=True)
+    table.add_column("name", style="magenta")
+    table.add_column("size (MB)", justify="right", style="green")
+    for object in data_objects_list:
+        table.add_row(f"{object.id}", f"{object.name}", f"{object.size/1000000:.2f}")
+    c.print(table)
+
+    # compute the missing checksums in the background, while the metadata is filled in
+    prewarming = prewarm.start(data_objects_list, session)
+
+    # --- Update metadata in iRODS from initiated to processed & add timestamp --- #
 
-data_objects_list = from_irods.query_data(
-    atr_publish, val, session
-)  # look for data based on A = dv.publication & value = initiated
+    for item in data_objects_list:
+        # Update status of publication in iRODS from 'initiated' to 'processed'
+        from_irods.save_md(item, atr_publish, "processed", op="set")
+        # Dataset status timestamp
+        from_irods.save_md(
+            item, "dv.publication.timestamp", datetime.datetime.now(), op="set"
+        )
 
-if len(data_objects_list) == 0:  # ldt = qdata
     c.print(
-        f"No metadata with attribute <{atr_publish}> and value <{val}> are found.",
+        f"Metadata attribute <{atr_publish}> is updated to <processed> for the selected objects.",
         style=info,
     )
-    add = True
-    while add:
-        inp_i = input(
-            "Provide the full iRODS path and name of the data object to be published in one of the configured Dataverse installations:\n"
+
+    # --- Select Dataverse: if there is no object metadata specifying the Dataverse installation, ask for user input --- #
+    print(
+        "Select one of the configured Dataverse installations, via attached metadata in iRODS or via typed input."
+    )
+    atr_dv = "dv.installation"
+    installations = ["RDR", "Demo", "RDR-pilot"]
+    ldv = from_irods.query_dv(atr_dv, data_objects_list, installations)
+    if len(ldv) == 1 and "missing" not in ldv:
+        inp_dv = list(ldv.keys())[0]
+        c.print(
+            f"Metadata with attribute <{atr_dv}> and value <{inp_dv}> for the selected data objects are found in iRODS.",
+            style=info,
         )
-        try:
-            obj = session.data_objects.get(inp_i)
-            data_objects_list.append(obj)
-            if from_irods.save_md(obj, atr_publish, val, op="set"):
-                c.print(
-                    f"Metadata with attribute <{atr_publish}> and value <{val}> are added in the selected data object."
+    else:
+        if len(ldv) > 1:
+            c.print(f"Not all the data objects are assigned to the same installation.")
+        else:
+            c.print(f"The selected objects have no attribute <{atr_dv}>.", style=action)
+        data_objects_list = []
+        inp_dv = Prompt.ask(
+            "Specify the configured Dataverse installation to publish the data",
+            choices=installations,
+            default="Demo",
+        )
+        if inp_dv in ldv:
+            data_objects_list = ldv[inp_dv]
+            c.print(f"{len(ldv[inp_dv])} items were tagged for this installation.")
+        if "missing" in ldv:
+            if len(ldv) > 1:
+                add_missing = Confirm.ask(
+                    f"{len(ldv['missing'])} data objects had no metadata for the installation. Would you still want to submit them to this Dataverse installation?"
                 )
             else:
+                add_missing = True
+            if add_missing:
+                for item in ldv["missing"]:
+                    from_irods.save_md(item, atr_dv, inp_dv, op="set")
+                    data_objects_list.append(item)
                 c.print(
-                    f"The path of the data object is not correct. Please provide a correct path. \n Hint: /zone/home/collection/folder/filename",
-                    style=warning,
+                    f"Metadata with attribute <{atr_dv}> and value <{inp_dv}> are added in the selected data objects.",
+                    style=action,
                 )
-        except Exception as e:  # change this to specific exception
-            c.print(
-                f"The path of the data object is not correct. Please provide a correct path. \n Hint: /zone/home/collection/folder/filename",
-                style=warning,
-            )
-        add = Confirm.ask("Add more objects? y/n\n")
-else:
-    c.print(
-        f"Metadata with attribute <{atr_publish}> and value <{val}> are found in iRODS.",
-        style=info,
-    )
 
+    # --- Set-up for the selected Dataverse installation --- #
+    print(
+        f"Provide your Token for <{inp_dv}> Dataverse installation or the name of its environment variable."
+    )
+    token = maskpass.askpass(prompt="", mask="*")
+    token = os.getenv(token, token)
+    api, ds = to_dataverse.setup(
+        inp_dv, token
+    )  # this function also validates that the selected Dataverse installations is configured.
+
+    # get the path for the first data object in the list
+    # check the metadata only from the first object in the list
+    # print(logical_path.path)
+    path_to_schema = ds.mango_schema
+    path_to_template = ds.metadata_template
+
+    # --- Create information to pass on the header for direct upload --- #
+    header_key, header_ct = direct_upload.create_headers(token)
+
+    # --- Check the limits of the installation before any transfer --- #
+    def plan_deposit(candidates, dsPID, files_in_dataset=0):
+        """Check the objects to add to a dataset against the limits of the installation, leaving out those that do not fit."""
+        # the transfer strategy depends on what the installation supports (cached for a day)
+        limits = dict(
+            capabilities.get_capabilities(ds.baseURL, ds.alias, header_key, dsPID)
+        )
+        limits["quota"], limits["storage_use"] = capabilities.get_storage(
+            ds.baseURL, ds.alias, header_key
+        )
+        strategy = capabilities.choose_strategy(limits)
+        deposit_plan = plan.make_plan(
+            candidates, limits, strategy, files_in_dataset=files_in_dataset
+        )
+        c.print(plan.format_plan(deposit_plan), style=info)
+        left_out = [x for x, _ in deposit_plan["rejected"] + deposit_plan["deferred"]]
+        # a single dataset is filled per run: the next batches are left for the next runs
+        for batch in deposit_plan["batches"][1:]:
+            left_out.extend(batch)
+        if left_out:
+            if not deposit_plan["batches"] or not Confirm.ask(
+                f"{len(left_out)} data objects cannot be deposited now. Continue with the others? y/n\n"
+            ):
+                session.cleanup()
+                raise SystemExit
+            for item in left_out:
+                from_irods.save_md(item, atr_publish, val, op="set")
+        return (deposit_plan["batches"] or [[]])[0], strategy
+
+    # --- Retrieve filled-in metadata --- #
+    def ask_metadata(path_to_template, path_to_schema, data_objects_list):
+        """..."""
+        if Confirm.ask(
+            "Are you ManGO user and have you filled in the ManGO metadata schema for your Dataverse installation?\n"
+        ):
+            # get metadata
+            for data_object in data_objects_list:
+                metadata = avu2json.parse_mango_metadata(path_to_schema, data_object)
+                if metadata:
+                    break
+            # get template
+            if not metadata:
+                c.print(
+                    "Sorry, no schema metadata for this Dataverse installation was found, let's try again!"
+                )
+                return ask_metadata(path_to_template, path_to_schema, data_objects_list)
+            md = avu2json.get_template(path_to_template, metadata)
 
-# --- Print a table of the selected data --- #
-c.print("The following objects are selected for publication:", style=info)
-table = Table(title="data object overview")
-table.add_column("unique id", justify="right", style="cyan", no_wrap=True)
-table.add_column("name", style="magenta")
-table.add_column("size (MB)", justify="right", style="green")
-for object in data_objects_list:
-    table.add_row(f"{object.id}", f"{object.name}", f"{object.size/1000000:.2f}")
-c.print(table)
+        else:
+            md = ""
+            while not os.path.exists(md):
+                md = Prompt.ask(
+                    f"""Provide the path for the filled-in Dataset metadata. This JSON file can either match the template <{path_to_template}> or be the simplified version (ADD REFERENCE to documentation or to the example file e.g. doc/metadata/short_metadata_demo.json).""",
+                    default=path_to_template,
+                )
+            with open(md, "r") as f:
+                try:
+                    md = json.load(f)
+                except:
+                    raise IOError("The file could not be read. Is this a valid JSON?")
+                if "datasetVersion" not in md:
+                    try:
+                        md = avu2json.get_template(path_to_template, md)
+                    except:
+                        raise ValueError("The JSON is not in the correct format.")
+
+        return md
+
+    # --- Incremental sync: if the objects were deposited before, update that dataset --- #
+    existing_dois = {
+        x.value
+        for item in data_objects_list
+        for x in item.metadata.get_all("dv.ds.DOI")
+    }
+    dsPID = None
+    if len(existing_dois) == 1:
+        existing_doi = existing_dois.pop()
+        if Confirm.ask(
+            f"The selected objects were deposited in <{existing_doi}>. Upload only new and modified objects to this dataset? y/n\n"
+        ):
+            dsPID = existing_doi
+            delete_removed = Confirm.ask(
+                "Delete the files of the dataset that are not among the selected objects? y/n\n",
+                default=False,
+            )
 
+    trg_path = "doc/data"
 
-# --- Update metadata in iRODS from initiated to processed & add timestamp --- #
+    if dsPID is not None:
+        # only the new and modified objects are added: the files that stay count against the limits
+        changes = deposit.compare_files(
+            data_objects_list, to_dataverse.list_ds_files(api, dsPID)
+        )
+        kept = (
+            changes["unchanged"]
+            + changes["moved"]
+            + ([] if delete_removed else changes["removed"])
+        )
+        accepted, strategy = plan_deposit(
+            [x for x, _, _ in changes["new"] + changes["modified"]], dsPID, len(kept)
+        )
+        accepted = {x.path for x in accepted}
+        for change in ("new", "modified"):
+            changes[change] = [x for x in changes[change] if x[0].path in accepted]
+        changes = deposit.sync_ds(
+            data_objects_list,
+            api,
+            dsPID,
+            ds.baseURL,
+            header_key,
+            header_ct,
+            delete=delete_removed,
+            trg_path=trg_path if strategy == "native" else None,
+            session=session,
+            changes=changes,
+        )
+        c.print(
+            f"The dataset <{dsPID}> is updated: {len(changes['new'])} new, {len(changes['modified'])} modified, {len(changes['unchanged']) + len(changes['moved'])} unchanged and {len(changes['removed'])} removed files.",
+            style=info,
+        )
+        session.cleanup()
+        raise SystemExit
 
-for item in data_objects_list:
-    # Update status of publication in iRODS from 'initiated' to 'processed'
-    from_irods.save_md(item, atr_publish, "processed", op="set")
-    # Dataset status timestamp
-    from_irods.save_md(
-        item, "dv.publication.timestamp", datetime.datetime.now(), op="set"
+    # --- Validate metadata --- #
+    md = ask_metadata(path_to_template, path_to_schema, data_objects_list)
+    vmd = to_dataverse.validate_md(ds, md)
+    while not (vmd):
+        c.print(
+            f"The metadata are not validated, modify <{md}>, save and hit enter to continue.",
+            style=info,
+        )
+        md = ask_metadata(path_to_template, path_to_schema, data_objects_list)
+        vmd = to_dataverse.validate_md(ds, md)
+    c.print(f"The metadata are validated, the process continues.", style=info)
+
+    # --- Deposit draft in selected Dataverse installation --- #
+    dsStatus, dsPID, dsID = to_dataverse.deposit_ds(api, ds)
+    if dsPID is None:
+        c.print(
+            f"The dataset could not be created (status = {dsStatus}).", style=warning
+        )
+        for item in data_objects_list:
+            from_irods.save_md(item, atr_publish, val, op="set")
+        session.cleanup()
+        raise SystemExit
+    c.print(
+        f"The Dataset publication metadata are: status = {dsStatus}, PID = {dsPID}, dsID = {dsID}",
+        style=info,
     )
 
-c.print(
-    f"Metadata attribute <{atr_publish}> is updated to <processed> for the selected objects.",
-    style=info,
-)
+    # --- Check the limits of the installation for the new dataset --- #
+    data_objects_list, strategy = plan_deposit(data_objects_list, dsPID)
+
+    # --- Add metadata in iRODS --- #
+    for item in data_objects_list:
+        # Dataset DOI
+        from_irods.save_md(item, "dv.ds.DOI", dsPID, op="add")
+        # # Dataset PURL
+        # from_irods.save_md(item, "dv.ds.PURL", dsPURL, op="set")
 
-# --- Select Dataverse: if there is no object metadata specifying the Dataverse installation, ask for user input --- #
-print(
-    "Select one of the configured Dataverse installations, via attached metadata in iRODS or via typed input."
-)
-atr_dv = "dv.installation"
-installations = ["RDR", "Demo", "RDR-pilot"]
-ldv = from_irods.query_dv(atr_dv, data_objects_list, installations)
-if len(ldv) == 1 and "missing" not in ldv:
-    inp_dv = list(ldv.keys())[0]
     c.print(
-        f"Metadata with attribute <{atr_dv}> and value <{inp_dv}> for the selected data objects are found in iRODS.",
+        f"The Dataset DOI is added as metadata to the selected data objects.",
         style=info,
     )
-else:
-    if len(ldv) > 1:
-        c.print(f"Not all the data objects are assigned to the same installation.")
-    else:
-        c.print(f"The selected objects have no attribute <{atr_dv}>.", style=action)
-    data_objects_list = []
-    inp_dv = Prompt.ask(
-        "Specify the configured Dataverse installation to publish the data",
-        choices=installations,
-        default="Demo",
+
+    # --- Upload data files --- #
+
+    if prewarming.is_alive():
+        c.print("Waiting for the checksums of the data objects...", style=info)
+    prewarming.join()
+    # recall the data objects stored only on tape: the online ones are uploaded meanwhile
+    staged = staging.stage(data_objects_list, session)
+
+    c.print(f"The data files are uploaded with the <{strategy}> strategy.", style=info)
+    # tabular files are ingested by Dataverse unless disabled here or per file with `dv.df.tabIngest: false`
+    ingest = os.getenv("IRODS2DATAVERSE_TAB_INGEST", "true").lower() != "false"
+    # several threads share the uploads, in the order of a scheduling policy (fifo, largest-first or lpt)
+    policy = os.getenv("IRODS2DATAVERSE_SCHEDULE")
+    if policy and policy not in schedule.POLICIES:
+        c.print(
+            f"Unknown scheduling policy <{policy}>, the files are uploaded in order.",
+            style=warning,
+        )
+        policy = None
+    # the direct uploads can be sent from an event loop instead of threads
+    engine = os.getenv("IRODS2DATAVERSE_ENGINE")
+    if engine and engine not in ("threads", "async"):
+        c.print(
+            f"Unknown upload engine <{engine}>, the uploads are sent from threads.",
+            style=warning,
+        )
+        engine = None
+    # replicas in S3 are copied server-side when Dataverse stores its files on the same endpoint
+    sources = (
+        {} if strategy == "native" else s3_copy.find_sources(data_objects_list, session)
     )
-    if inp_dv in ldv:
-        data_objects_list = ldv[inp_dv]
-        c.print(f"{len(ldv[inp_dv])} items were tagged for this installation.")
-    if "missing" in ldv:
-        if len(ldv) > 1:
-            add_missing = Confirm.ask(
-                f"{len(ldv['missing'])} data objects had no metadata for the installation. Would you still want to submit them to this Dataverse installation?"
-            )
-        else:
-            add_missing = True
-        if add_missing:
-            for item in ldv["missing"]:
-                from_irods.save_md(item, atr_dv, inp_dv, op="set")
-                data_objects_list.append(item)
-            c.print(
-                f"Metadata with attribute <{atr_dv}> and value <{inp_dv}> are added in the selected data objects.",
-                style=action,
-            )
+    start = time.perf_counter()
 
+    # live throughput and ETA of the transfers, per data object and for the whole selection
+    progress.tracker.reset()
+    progress.tracker.expect(
+        len(data_objects_list), sum(x.size for x in data_objects_list)
+    )
+    with progress.tracker.show(c):
+        # OPTION 1 'native': local download (without direct upload)
+        # OPTION 2 'direct-batch': direct upload, registering the files together
+        # OPTION 3 'direct': direct upload, registering the files one by one (tabular files last)
+        deposited = deposit.upload_objects(
+            staged,
+            strategy,
+            api,
+            dsPID,
+            header_key,
+            header_ct,
+            session=session,
+            trg_path=trg_path,
+            ingest=ingest,
+            sources=sources,
+            policy=policy,
+            workers=int(os.getenv("IRODS2DATAVERSE_UPLOAD_WORKERS", "4")),
+            engine=engine,
+        )
+    progress.tracker.close()
+    c.print(
+        f"{len(deposited)} of {len(data_objects_list)} data objects are deposited.",
+        style=info,
+    )
 
-# --- Set-up for the selected Dataverse installation --- #
-print(
-    f"Provide your Token for <{inp_dv}> Dataverse installation or the name of its environment variable."
-)
-token = maskpass.askpass(prompt="", mask="*")
-token = os.getenv(token, token)
-api, ds = to_dataverse.setup(
-    inp_dv, token
-)  # this function also validates that the selected Dataverse installations is configured.
-
-# get the path for the first data object in the list
-# check the metadata only from the first object in the list
-# print(logical_path.path)
-path_to_schema = ds.mango_schema
-path_to_template = ds.metadata_template
-
-# --- Create information to pass on the header for direct upload --- #
-header_key, header_ct = direct_upload.create_headers(token)
-
-
-# --- Retrieve filled-in metadata --- #
-def ask_metadata(path_to_template, path_to_schema, data_objects_list):
-    """..."""
-    if Confirm.ask(
-        "Are you ManGO user and have you filled in the ManGO metadata schema for your Dataverse installation?\n"
-    ):
-        # get metadata
-        for data_object in data_objects_list:
-            metadata = avu2json.parse_mango_metadata(path_to_schema, data_object)
-            if metadata:
-                break
-        # get template
-        if not metadata:
+    plan.record_throughput(
+        strategy,
+        len(data_objects_list),
+        sum(x.size for x in data_objects_list),
+        time.perf_counter() - start,
+    )
+    # achieved versus allowed throughput of the bandwidth budgets
+    for (scope, name), rates in throttle.limiter.report().items():
+        if rates["allowed"]:
             c.print(
-                "Sorry, no schema metadata for this Dataverse installation was found, let's try again!"
+                f"Throughput ({scope} {name or ''}): {rates['achieved']/1000000:.2f} MB/s, "
+                f"allowed {rates['allowed']/1000000:.2f} MB/s.",
+                style=info,
             )
-            return ask_metadata(path_to_template, path_to_schema, data_objects_list)
-        md = avu2json.get_template(path_to_template, metadata)
 
-    else:
-        md = ""
-        while not os.path.exists(md):
-            md = Prompt.ask(
-                f"""Provide the path for the filled-in Dataset metadata. This JSON file can either match the template <{path_to_template}> or be the simplified version (ADD REFERENCE to documentation or to the example file e.g. doc/metadata/short_metadata_demo.json).""",
-                default=path_to_template,
-            )
-        with open(md, "r") as f:
-            try:
-                md = json.load(f)
-            except:
-                raise IOError("The file could not be read. Is this a valid JSON?")
-            if "datasetVersion" not in md:
-                try:
-                    md = avu2json.get_template(path_to_template, md)
-                except:
-                    raise ValueError("The JSON is not in the correct format.")
+    # # Add metadata in iRODS
+    # from_irods.save_md(
+    #     f"{objPath[i]}/{objName[i]}", "dv.df.id", df_id, session, op="set"
+    # )
 
-    return md
-
-
-# --- Validate metadata --- #
-md = ask_metadata(path_to_template, path_to_schema, data_objects_list)
-vmd = to_dataverse.validate_md(ds, md)
-while not (vmd):
     c.print(
-        f"The metadata are not validated, modify <{md}>, save and hit enter to continue.",
+        f"Metadata attribute <{atr_publish}> is updated to <deposited> for the selected data objects.",
         style=info,
     )
-    md = ask_metadata(path_to_template, path_to_schema, data_objects_list)
-    vmd = to_dataverse.validate_md(ds, md)
-c.print(f"The metadata are validated, the process continues.", style=info)
-
-# --- Deposit draft in selected Dataverse installation --- #
-dsStatus, dsPID, dsID = to_dataverse.deposit_ds(api, ds)
-c.print(
-    f"The Dataset publication metadata are: status = {dsStatus}, PID = {dsPID}, dsID = {dsID}",
-    style=info,
-)
-
-# --- Add metadata in iRODS --- #
-for item in data_objects_list:
-    # Dataset DOI
-    from_irods.save_md(item, "dv.ds.DOI", dsPID, op="add")
-    # # Dataset PURL
-    # from_irods.save_md(item, "dv.ds.PURL", dsPURL, op="set")
-
-
-c.print(
-    f"The Dataset DOI is added as metadata to the selected data objects.",
-    style=info,
-)
-
-# --- Upload data files --- #
-
-trg_path = "doc/data"
-
-if inp_dv == "Demo":
-    ## OPTION 1: LOCAL DOWNLOAD (for Demo installation)
-    for item in data_objects_list:
-        # Save data locally
-        from_irods.save_df(item, trg_path, session)  # download object locally
-        # Upload file(s)
-        md = to_dataverse.deposit_df(api, dsPID, item.name, trg_path)
-        print(md)
-        # Update status of publication in iRODS from 'processed' to 'deposited'
-        from_irods.save_md(item, atr_publish, "deposited", op="set")
-        # Update timestamp
-        from_irods.save_md(
-            item, "dv.publication.timestamp", datetime.datetime.now(), op="set"
-        )
-else:
-    ## OPTION 2: DIRECT UPLOAD (for RDR and RDR-pilot)
-    for item in data_objects_list:
-        objChecksum, objMimetype, objSize = from_irods.get_object_info(item)
-        fileURL, storageID = direct_upload.get_du_url(
-            ds.baseURL, dsPID, objSize, header_key
-        )
-        du_step2 = direct_upload.put_in_s3(item, fileURL, header_ct)
-        md_dict = direct_upload.create_du_md(
-            storageID, item.name, objMimetype, objChecksum
-        )
-        du_step3 = direct_upload.post_to_ds(md_dict, ds.baseURL, dsPID, header_key)
-        # Update status of publication in iRODS from 'processed' to 'deposited'
-        from_irods.save_md(item, atr_publish, "deposited", op="set")
-        # Update timestamp
-        from_irods.save_md(
-            item, "dv.publication.timestamp", datetime.datetime.now(), op="set"
-        )
-        from_irods.save_md(
-            item,
-            "dv.df.storageIdentifier",
-            storageID,
-            op="add",
-        )  # TO DO: for the metadata that are added and not set, make a repeatable composite field to group them together
 
-# # Add metadata in iRODS
-# from_irods.save_md(
-#     f"{objPath[i]}/{objName[i]}", "dv.df.id", df_id, session, op="set"
-# )
+    # Additional metadata could be extracted from the filled-in Dataverse metadata template (e.g. author information)
 
+    # Next step - 1: Publication / Send for review via Dataverse installation UI
+    # The current agreement is to send for publication via the Dataverse UI.
+    # This is because different procedures may apply in each Dataverse installation.
 
-c.print(
-    f"Metadata attribute <{atr_publish}> is updated to <deposited> for the selected data objects.",
-    style=info,
-)
+    # Next step - 2: Update the metadata in iRODS
+    # From the iRODS side, to update the status of the publication (atr_publish) from deposited to "published", we need to check the situation in Dataverse.
+    # With periodic checks, query for the DOI of the dataset and check in the metadata if the dataset is published.
+    # This is done by `python -m irods2dataverse.reconcile`, e.g. as a cron job.
+    # We have talked about running checksums to see if the publication data are altered outside iRODS.
 
-# Additional metadata could be extracted from the filled-in Dataverse metadata template (e.g. author information)
+    # Clean-up iRODS session
+    session.cleanup()
 
-# Next step - 1: Publication / Send for review via Dataverse installation UI
-# The current agreement is to send for publication via the Dataverse UI.
-# This is because different procedures may apply in each Dataverse installation.
 
-# Next step - 2: Update the metadata in iRODS
-# From the iRODS side, to update the status of the publication (atr_publish) from deposited to "published", we need to check the situation in Dataverse.
-# With periodic checks, query for the DOI of the dataset and check in the metadata if the dataset is published.
-# We have talked about running checksums to see if the publication data are altered outside iRODS.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Publish data objects from iRODS in a Dataverse installation."
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="Profile the run and write the reports in a new directory under DIR.",
+    )
+    parser.add_argument(
+        "--profile-cpu",
+        choices=profiling.CPU_MODES,
+        help="How the CPU time is profiled: sampling all the threads (default) or cProfile on the main thread.",
+    )
+    args = parser.parse_args()
 
-# Clean-up iRODS session
-session.cleanup()
+    with profiling.profile_run(args.profile, args.profile_cpu):
+        main()
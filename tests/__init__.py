@@ -0,0 +1,8 @@
+import os
+import atexit
+import tempfile
+
+# the tests do not read or write the MIME types cache of the user
+_cache = tempfile.TemporaryDirectory()
+atexit.register(_cache.cleanup)
+os.environ["IRODS2DATAVERSE_MIME_CACHE"] = os.path.join(_cache.name, "mimetypes.json")
@@ -0,0 +1,350 @@
+"""Benchmark of the deposit pipeline against the local stand-ins of iRODS and Dataverse.
+
+Run from the root of the repository, e.g.:
+
+    PYTHONPATH=src python -m tests.benchmark --objects 1 1000 100000 --sizes 1KiB 1MiB -o report.json
+
+and gate regressions by comparing with a previous report:
+
+    PYTHONPATH=src python -m tests.benchmark -o new.json --baseline report.json --tolerance 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import contextlib
+from pyDataverse.api import NativeApi
+from irods2dataverse import (
+    from_irods,
+    to_dataverse,
+    direct_upload,
+    avu2json,
+    deposit,
+    metrics,
+    async_upload,
+    schedule,
+)
+from irods2dataverse.customClass import DemoDataset
+from tests.stand_ins import FakeDataverse, FakeSession
+
+resources = os.path.join(os.path.dirname(__file__), "resources")
+# attempts to create the dataset of a scenario, which can fail with `--error-rate`
+CREATE_ATTEMPTS = 10
+metadata = {
+    "author": {"authorAffiliation": "KU Leuven", "authorName": "Doe, Jane"},
+    "datasetContact": {
+        "datasetContactEmail": "user.name@kuleuven.be",
+        "datasetContactName": "Doe, Jane",
+    },
+    "dsDescription": [{"dsDescriptionValue": "Benchmark"}],
+    "subject": ["Demo Only"],
+    "title": "Benchmark",
+}
+units = {"KiB": 1024, "MiB": 1024**2, "GiB": 1024**3}
+
+
+def parse_size(text):
+    """Parse sizes such as '512', '1KiB' or '4MiB' into a number of bytes."""
+    for unit, factor in units.items():
+        if text.endswith(unit):
+            return int(float(text[: -len(unit)]) * factor)
+    return int(text)
+
+
+def scenario_name(
+    n_objects,
+    size,
+    dv_latency,
+    irods_latency,
+    error_rate,
+    engine="sequential",
+    **options,
+):
+    name = f"objects={n_objects},size={size},dv_latency={dv_latency},irods_latency={irods_latency},error_rate={error_rate}"
+    # names of the original scenarios are kept to compare with older reports
+    if engine != "sequential":
+        name += f",engine={engine}"
+    for k, v in options.items():
+        if v is not None:
+            name += f",{k}={v}"
+    return name
+
+
+def make_catalog(n_objects, size, irods_latency=0.0, large=None):
+    """Fake iRODS catalog with `n_objects` data objects tagged for publication.
+
+    If `large` is given, the last object (by path) has that size instead of `size`.
+    """
+    session = FakeSession(latency=irods_latency)
+    for i in range(n_objects):
+        session.add_object(
+            f"/zone/home/user/benchmark/{i // 1000:03d}/file{i:06d}.bin",
+            large if large is not None and i == n_objects - 1 else size,
+            [("dv.publication", "initiated"), ("dv.installation", "Demo")],
+        )
+    return session
+
+
+def run_scenario(
+    n_objects,
+    size,
+    dv_latency=0.0,
+    irods_latency=0.0,
+    error_rate=0.0,
+    verify=False,
+    engine="sequential",
+    policy="lpt",
+    workers=4,
+    large=None,
+    bandwidth=None,
+):
+    """Deposit `n_objects` of `size` bytes via direct upload and measure it.
+
+    The objects are sent one after the other with the `sequential` engine, concurrently
+    from an event loop with the `async` engine (see `async_upload.upload_many()`), or by
+    `workers` threads in the order of a scheduling `policy` with the `scheduled` engine
+    (see `schedule.make_jobs()`), registered with `addFiles`. With `large`, the last object
+    found in the catalog has this size. `bandwidth` limits the bytes per second of each upload.
+
+    Returns:
+        dict: Scenario parameters, duration, throughput, failures, Dataverse requests by endpoint
+          and time per stage.
+    """
+    session = make_catalog(n_objects, size, irods_latency, large)
+    token = "00000000-0000-0000-0000-000000000000"
+    header_key, header_ct = direct_upload.create_headers(token)
+    failures = 0
+    metrics.reset()
+    metrics.enable()
+    with FakeDataverse(
+        latency=dv_latency, error_rate=error_rate, verify=verify, bandwidth=bandwidth
+    ) as dv, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        data_objects = from_irods.query_data("dv.publication", "initiated", session)
+        ldv = from_irods.query_dv("dv.installation", data_objects, ["Demo"])
+        ds = DemoDataset()
+        api = NativeApi(dv.url, token)
+        md = avu2json.get_template(
+            os.path.join(resources, "template_Demo.json"), metadata
+        )
+        to_dataverse.validate_md(ds, md)
+        # the creation of the dataset is measured with its retries: it is tried again when it fails
+        for _ in range(CREATE_ATTEMPTS):
+            dsStatus, dsPID, dsID = to_dataverse.deposit_ds(api, ds)
+            if dsPID is not None:
+                break
+        else:
+            # nothing can be deposited
+            failures = n_objects
+        items = ldv["Demo"] if dsPID else []
+        for item in items:
+            from_irods.save_md(item, "dv.ds.DOI", dsPID, op="add")
+        if engine == "async" and items:
+            results = async_upload.run_uploads(
+                items, dv.url, dsPID, header_key, header_ct
+            )
+            failures = sum(isinstance(x, Exception) for x in results.values())
+        if engine == "scheduled" and items:
+            # in the order of discovery, i.e. of the catalog
+            items = sorted(items, key=lambda x: x.path)
+
+            storageIDs = deposit.upload_direct_scheduled(
+                items,
+                dv.url,
+                dsPID,
+                header_key,
+                header_ct,
+                policy=policy,
+                workers=workers,
+            )
+            for item in items:
+                if item.path in storageIDs:
+                    deposit.mark_deposited(item, storageIDs[item.path])
+            failures = len(items) - len(storageIDs)
+        for item in items if engine == "sequential" else []:
+            try:
+                storageID, _ = deposit.upload_direct(
+                    item, dv.url, dsPID, header_key, header_ct
+                )
+            except ConnectionError:
+                failures += 1
+                continue
+            deposit.mark_deposited(item, storageID)
+        duration = time.perf_counter() - start
+        requests = dict(dv.requests)
+        stored = len(dv.files(dsPID)) if dsPID else 0
+    metrics.disable()
+    stages = metrics.snapshot()["stages"]
+    n_bytes = sum(x.size for x in session.objects.values())
+    scheduled = engine == "scheduled"
+    return {
+        "name": scenario_name(
+            n_objects,
+            size,
+            dv_latency,
+            irods_latency,
+            error_rate,
+            engine,
+            policy=policy if scheduled else None,
+            workers=workers if scheduled else None,
+            large=large,
+            bandwidth=bandwidth,
+        ),
+        "engine": engine,
+        "objects": n_objects,
+        "size": size,
+        "dv_latency": dv_latency,
+        "irods_latency": irods_latency,
+        "error_rate": error_rate,
+        "seconds": duration,
+        "objects_per_second": n_objects / duration,
+        "bytes_per_second": n_bytes / duration,
+        "failures": failures,
+        "stored": stored,
+        "requests": requests,
+        "stages": {
+            k: {"count": v["count"], "seconds": v["sum"], "max": v["max"]}
+            for k, v in stages.items()
+        },
+        "session": session,
+    }
+
+
+def compare(report, baseline, tolerance=0.2):
+    """Find the scenarios whose throughput dropped compared to a baseline report.
+
+    Args:
+        report (dict): New report.
+        baseline (dict): Previous report with (some of) the same scenarios.
+        tolerance (float, optional): Accepted relative drop in objects per second. Defaults to 0.2.
+
+    Returns:
+        list: Names of the scenarios with a regression, with the baseline and new throughput.
+    """
+    previous = {x["name"]: x for x in baseline["scenarios"]}
+    regressions = []
+    for scenario in report["scenarios"]:
+        old = previous.get(scenario["name"])
+        if old is None:
+            continue
+        if scenario["objects_per_second"] < old["objects_per_second"] * (1 - tolerance):
+            regressions.append(
+                (
+                    scenario["name"],
+                    old["objects_per_second"],
+                    scenario["objects_per_second"],
+                )
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the deposit pipeline against local stand-ins of iRODS and Dataverse."
+    )
+    parser.add_argument("--objects", nargs="+", type=int, default=[1, 1000])
+    parser.add_argument("--sizes", nargs="+", default=["1KiB", "1MiB"])
+    parser.add_argument(
+        "--dv-latency", type=float, default=0.0, help="Seconds per Dataverse request."
+    )
+    parser.add_argument(
+        "--irods-latency",
+        type=float,
+        default=0.0,
+        help="Seconds per iRODS operation and read.",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Probability that a Dataverse request fails.",
+    )
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        choices=["sequential", "async", "scheduled"],
+        default=["sequential"],
+        help="Upload engines to compare.",
+    )
+    parser.add_argument(
+        "--policies",
+        nargs="+",
+        choices=schedule.POLICIES,
+        default=["lpt"],
+        help="Scheduling policies to compare with the scheduled engine.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of upload threads of the scheduled engine.",
+    )
+    parser.add_argument(
+        "--large",
+        help="Size of one large object, found last in the catalog, e.g. 64MiB.",
+    )
+    parser.add_argument(
+        "--bandwidth",
+        help="Bytes per second of each upload, e.g. 50MiB.",
+    )
+    parser.add_argument("-o", "--output", help="Path to store the JSON report.")
+    parser.add_argument("--baseline", help="Previous JSON report to compare with.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Accepted relative drop in throughput before failing.",
+    )
+    args = parser.parse_args(argv)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scenarios": [],
+    }
+    for n_objects in args.objects:
+        for size in args.sizes:
+            runs = [
+                (engine, policy)
+                for engine in args.engines
+                for policy in (args.policies if engine == "scheduled" else [None])
+            ]
+            for engine, policy in runs:
+                scenario = run_scenario(
+                    n_objects,
+                    parse_size(size),
+                    args.dv_latency,
+                    args.irods_latency,
+                    args.error_rate,
+                    engine=engine,
+                    policy=policy,
+                    workers=args.workers,
+                    large=parse_size(args.large) if args.large else None,
+                    bandwidth=parse_size(args.bandwidth) if args.bandwidth else None,
+                )
+                scenario.pop("session")
+                report["scenarios"].append(scenario)
+                print(
+                    f"{scenario['name']}: {scenario['seconds']:.2f} s, "
+                    f"{scenario['objects_per_second']:.1f} objects/s, "
+                    f"{scenario['bytes_per_second'] / units['MiB']:.1f} MiB/s, "
+                    f"{scenario['failures']} failures"
+                )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for name, old, new in regressions:
+            print(f"Regression in {name}: {old:.1f} -> {new:.1f} objects/s")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,967 @@
+"""Local stand-ins for iRODS and Dataverse, for tests and benchmarks without network access.
+
+`FakeDataverse` is an in-process HTTP server implementing the subset of the Dataverse API
+(and of S3) used by `irods2dataverse`. `FakeSession` mimics an iRODS session with an
+in-memory catalog. Both can inject latency and, for Dataverse, errors.
+"""
+
+import io
+import re
+import ast
+import json
+import time
+import email
+import random
+import hashlib
+import base64
+import datetime
+import threading
+import collections
+from types import SimpleNamespace
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import irods.keywords as kw
+from irods.meta import iRODSMeta
+from irods.column import Column, In
+from irods.models import Collection, DataObject, DataObjectMeta, Resource
+
+# ---- Dataverse ---- #
+
+
+def parse_json_data(text):
+    """Parse `jsonData`: the direct upload helpers send the repr of a dict."""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return ast.literal_eval(text)
+
+
+def parse_form(content_type, body):
+    """Parse a multipart/form-data body into a dict of name: bytes."""
+    message = email.message_from_bytes(
+        b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body
+    )
+    return {
+        part.get_param("name", header="content-disposition"): part.get_payload(
+            decode=True
+        )
+        for part in message.get_payload()
+    }
+
+
+class FakeDataverse:
+    """Dataverse installation (with S3 direct upload) running in a background thread.
+
+    Args:
+        latency (float, optional): Seconds added to every request. Defaults to 0.
+        error_rate (float, optional): Probability that a request fails with status 503. Defaults to 0.
+        part_size (int, optional): Files larger than this get multipart upload URLs. Defaults to None (never).
+        verify (bool, optional): Compute the SHA-256 of uploaded data. Defaults to False.
+        seed (int, optional): Seed for the injected errors. Defaults to 0.
+        direct_upload (bool, optional): Whether the storage accepts direct uploads. Defaults to True.
+        settings (dict, optional): Values of the settings exposed via `/api/info/settings`,
+          e.g. {":MaxFileUploadSizeInBytes": 1000}. Defaults to None.
+        quota (int, optional): Storage quota of the collections in bytes. Defaults to None (no quota).
+        version (str, optional): Version of Dataverse. Defaults to "6.2".
+        bandwidth (float, optional): Bytes per second of each upload to S3, to simulate the network.
+          Defaults to None (unlimited).
+        ingest_seconds (float, optional): Duration of the ingest of a tabular file, during which
+          its dataset is locked. Defaults to 0 (no ingest).
+        server_copy (bool, optional): Whether the upload URLs accept server-side copies from the
+          objects added with `add_s3_object()`. Defaults to True.
+    """
+
+    TABULAR_MIMETYPES = {
+        "text/csv",
+        "text/tab-separated-values",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "application/x-spss-sav",
+        "application/x-stata",
+    }
+
+    def __init__(
+        self,
+        latency=0.0,
+        error_rate=0.0,
+        part_size=None,
+        verify=False,
+        seed=0,
+        direct_upload=True,
+        settings=None,
+        quota=None,
+        version="6.2",
+        bandwidth=None,
+        ingest_seconds=0.0,
+        server_copy=True,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.part_size = part_size
+        self.verify = verify
+        self.direct_upload = direct_upload
+        self.settings = settings or {}
+        self.quota = quota
+        self.version = version
+        self.bandwidth = bandwidth
+        self.ingest_seconds = ingest_seconds
+        self.server_copy = server_copy
+        self.s3_objects = {}
+        self.bytes_copied = 0
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.datasets = {}
+        self.s3 = {}
+        self.requests = collections.Counter()
+        self.bytes_received = 0
+        self.ids = iter(range(1, 10**9))
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.make_handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_dataset(self, pid=None):
+        """Create an empty draft dataset and return its persistent identifier."""
+        with self.lock:
+            ds_id = next(self.ids)
+            pid = pid or f"doi:10.5072/FK2/{ds_id:06d}"
+            self.datasets[pid] = {
+                "id": ds_id,
+                "files": [],
+                "locks": [],
+                "published": False,
+            }
+        return pid
+
+    def files(self, pid):
+        return self.datasets[pid]["files"]
+
+    def add_s3_object(self, bucket, key, size):
+        """Add an object to the S3 endpoint, e.g. the replica of an iRODS S3 resource."""
+        with self.lock:
+            self.s3_objects[f"{bucket}/{key}"] = size
+
+    # ---- request handling ---- #
+
+    routes = [
+        ("GET", r"/api/info/version", "version"),
+        ("GET", r"/api/info/settings/(?P<setting>[^/]+)", "setting"),
+        ("GET", r"/api/dataverses/(?P<alias>[^/]+)/storage/quota", "quota"),
+        ("GET", r"/api/dataverses/(?P<alias>[^/]+)/storage/use", "storage_use"),
+        ("GET", r"/api/metadatablocks", "metadatablocks"),
+        ("GET", r"/api/metadatablocks/(?P<name>[^/]+)", "metadatablock"),
+        ("POST", r"/api/dataverses/(?P<alias>[^/]+)/datasets", "create_dataset"),
+        ("GET", r"/api/datasets/:persistentId/uploadurls", "uploadurls"),
+        ("PUT", r"/s3/(?P<key>.+)", "s3_put"),
+        ("PUT", r"/api/datasets/mpupload", "mpupload_complete"),
+        ("DELETE", r"/api/datasets/mpupload", "mpupload_abort"),
+        ("POST", r"/api/datasets/:persistentId/add", "add"),
+        ("POST", r"/api/datasets/:persistentId/addFiles", "add_files"),
+        ("POST", r"/api/files/(?P<file_id>\d+)/replace", "replace"),
+        ("DELETE", r"/api/files/(?P<file_id>\d+)", "delete_file"),
+        (
+            "GET",
+            r"/api/datasets/:persistentId/versions/(?P<version>[^/]+)/files",
+            "list_files",
+        ),
+        ("GET", r"/api/datasets/:persistentId/locks", "locks"),
+        ("GET", r"/api/search", "search"),
+    ]
+
+    def make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately: avoid delayed ACK stalls on keep-alive
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake.handle(self, "GET")
+
+            def do_PUT(self):
+                fake.handle(self, "PUT")
+
+            def do_POST(self):
+                fake.handle(self, "POST")
+
+            def do_DELETE(self):
+                fake.handle(self, "DELETE")
+
+        return Handler
+
+    def handle(self, request, method):
+        url = urlsplit(request.path)
+        path = re.sub(r"^/api/v1/", "/api/", url.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        for route_method, pattern, name in self.routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                break
+        else:
+            return self.respond(
+                request, 404, {"status": "ERROR", "message": "not found"}
+            )
+        with self.lock:
+            self.requests[name] += 1
+            fail = self.random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if name != "s3_put":
+            length = int(request.headers.get("Content-Length", 0))
+            body = request.rfile.read(length) if length else b""
+        else:
+            body = request.rfile
+        if fail:
+            if name == "s3_put":
+                self.read_body(request, body)
+            return self.respond(
+                request, 503, {"status": "ERROR", "message": "injected"}
+            )
+        try:
+            response = getattr(self, f"on_{name}")(
+                request, query, body, **match.groupdict()
+            )
+        except (KeyError, ValueError) as e:
+            response = 400, {"status": "ERROR", "message": repr(e)}
+        self.respond(request, *response)
+
+    def respond(self, request, status, payload, headers=None):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        request.send_response(status)
+        for k, v in (headers or {}).items():
+            request.send_header(k, v)
+        if not isinstance(payload, bytes):
+            request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def read_body(self, request, rfile):
+        """Consume the body of a PUT, returning its size and SHA-256 (if verifying)."""
+        length = int(request.headers.get("Content-Length", 0))
+        digest = hashlib.sha256() if self.verify else None
+        remaining = length
+        while remaining > 0:
+            chunk = rfile.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            if self.bandwidth:
+                time.sleep(len(chunk) / self.bandwidth)
+            if digest is not None:
+                digest.update(chunk)
+        with self.lock:
+            self.bytes_received += length - remaining
+        return length - remaining, None if digest is None else digest.hexdigest()
+
+    def ok(self, data, status=200):
+        return status, {"status": "OK", "data": data}
+
+    def on_version(self, request, query, body):
+        return self.ok({"version": self.version, "build": "fake"})
+
+    def on_setting(self, request, query, body, setting):
+        if setting not in self.settings:
+            return 404, {"status": "ERROR", "message": f"Setting {setting} not found"}
+        return self.ok({"message": str(self.settings[setting])})
+
+    def on_quota(self, request, query, body, alias):
+        if self.quota is None:
+            return self.ok({"message": "No quota defined for this collection."})
+        return self.ok({"message": f"Storage quota for {alias}: {self.quota} bytes"})
+
+    def on_storage_use(self, request, query, body, alias):
+        with self.lock:
+            used = sum(
+                entry["dataFile"]["filesize"]
+                for dataset in self.datasets.values()
+                for entry in dataset["files"]
+            )
+        return self.ok({"message": f"Total recorded size for {alias}: {used} bytes"})
+
+    def on_metadatablocks(self, request, query, body):
+        return self.ok(
+            [{"id": 1, "name": "citation", "displayName": "Citation Metadata"}]
+        )
+
+    def on_metadatablock(self, request, query, body, name):
+        return self.ok({"id": 1, "name": name, "displayName": name, "fields": {}})
+
+    def on_create_dataset(self, request, query, body, alias):
+        json.loads(body)
+        pid = self.add_dataset()
+        return self.ok({"id": self.datasets[pid]["id"], "persistentId": pid}, 201)
+
+    def on_uploadurls(self, request, query, body):
+        pid = query["persistentId"]
+        size = int(query["size"])
+        if pid not in self.datasets:
+            return 404, {"status": "ERROR", "message": "dataset not found"}
+        if not self.direct_upload:
+            return 400, {
+                "status": "ERROR",
+                "message": "Direct upload not supported for files in this dataset",
+            }
+        max_size = self.settings.get(":MaxFileUploadSizeInBytes")
+        if max_size is not None and size > int(max_size):
+            return 400, {"status": "ERROR", "message": "File is too large"}
+        key = f"{next(self.ids):x}-fake"
+        storage_id = f"s3://bucket:{key}"
+        with self.lock:
+            self.s3[key] = {"size": None, "sha256": None, "parts": {}}
+        if self.part_size is None or size <= self.part_size:
+            return self.ok(
+                {"url": f"{self.url}/s3/{key}", "storageIdentifier": storage_id}
+            )
+        n_parts = -(-size // self.part_size)
+        params = f"globalid={pid}&storageidentifier={storage_id}&uploadid={key}"
+        return self.ok(
+            {
+                "urls": {
+                    str(i): f"{self.url}/s3/{key}?partNumber={i}&uploadId={key}"
+                    for i in range(1, n_parts + 1)
+                },
+                "abort": f"/api/datasets/mpupload?{params}",
+                "complete": f"/api/datasets/mpupload?{params}",
+                "partSize": self.part_size,
+                "storageIdentifier": storage_id,
+            }
+        )
+
+    def on_s3_put(self, request, query, body, key):
+        size, sha256 = self.read_body(request, body)
+        if key not in self.s3:
+            return 403, b"<Error><Code>AccessDenied</Code></Error>"
+        if "x-amz-copy-source" in request.headers:
+            return self.on_s3_copy(request, query, key)
+        etag = f'"{hashlib.md5(f"{key}{size}".encode()).hexdigest()}"'
+        with self.lock:
+            if "partNumber" in query:
+                self.s3[key]["parts"][query["partNumber"]] = (etag, size)
+            else:
+                self.s3[key].update(size=size, sha256=sha256)
+        return 200, b"", {"ETag": etag}
+
+    def on_s3_copy(self, request, query, key):
+        """CopyObject, or UploadPartCopy with a part number."""
+        source = unquote(request.headers["x-amz-copy-source"]).lstrip("/")
+        if not self.server_copy or source not in self.s3_objects:
+            return 403, b"<Error><Code>AccessDenied</Code></Error>"
+        size = self.s3_objects[source]
+        copy_range = request.headers.get("x-amz-copy-source-range")
+        if copy_range:
+            first, last = map(int, copy_range.split("=")[1].split("-"))
+            size = last - first + 1
+        etag = f'"{hashlib.md5(f"{key}{size}".encode()).hexdigest()}"'
+        with self.lock:
+            self.bytes_copied += size
+            if "partNumber" in query:
+                self.s3[key]["parts"][query["partNumber"]] = (etag, size)
+                result = "CopyPartResult"
+            else:
+                self.s3[key].update(size=size, sha256=None)
+                result = "CopyObjectResult"
+        return 200, f"<{result}><ETag>{etag}</ETag></{result}>".encode()
+
+    def on_mpupload_complete(self, request, query, body):
+        key = query["uploadid"]
+        etags = json.loads(body)
+        parts = self.s3[key]["parts"]
+        if any(parts.get(n, (None,))[0] != etag for n, etag in etags.items()):
+            return 400, {"status": "ERROR", "message": "ETag mismatch"}
+        with self.lock:
+            self.s3[key]["size"] = sum(size for _, size in parts.values())
+        return self.ok({})
+
+    def on_mpupload_abort(self, request, query, body):
+        with self.lock:
+            self.s3.pop(query["uploadid"], None)
+        return 204, b""
+
+    def register(self, pid, md, size=None, checksum=None):
+        """Add a file to a dataset from its `jsonData`."""
+        if size is None:
+            key = md["storageIdentifier"].rsplit(":", 1)[1]
+            if self.s3.get(key, {}).get("size") is None:
+                raise ValueError(f"{md['storageIdentifier']} was not uploaded")
+            size = self.s3[key]["size"]
+        if checksum is None:
+            checksum = md.get("checksum", {})
+            checksum = {"type": checksum.get("@type"), "value": checksum.get("@value")}
+        file_id = next(self.ids)
+        entry = {
+            "label": md.get("fileName", md.get("label")),
+            "restricted": False,
+            "dataFile": {
+                "id": file_id,
+                "filename": md.get("fileName"),
+                "contentType": md.get("mimeType", "application/octet-stream"),
+                "filesize": size,
+                "storageIdentifier": md.get("storageIdentifier", f"file://{file_id}"),
+                "checksum": checksum,
+            },
+        }
+        if md.get("directoryLabel"):
+            entry["directoryLabel"] = md["directoryLabel"]
+        with self.lock:
+            self.datasets[pid]["files"].append(entry)
+        if (
+            self.ingest_seconds
+            and md.get("mimeType") in self.TABULAR_MIMETYPES
+            and str(md.get("tabIngest", "true")).lower() != "false"
+        ):
+            self.ingest(pid)
+        return entry
+
+    def ingest(self, pid):
+        """Lock a dataset during the ingest of a tabular file."""
+        lock = {"lockType": "Ingest", "date": time.ctime(), "user": "fake"}
+
+        def unlock():
+            with self.lock:
+                self.datasets[pid]["locks"].remove(lock)
+
+        with self.lock:
+            self.datasets[pid]["locks"].append(lock)
+        timer = threading.Timer(self.ingest_seconds, unlock)
+        timer.daemon = True
+        timer.start()
+
+    def locked(self, pid):
+        with self.lock:
+            return bool(self.datasets[pid]["locks"])
+
+    def on_add(self, request, query, body):
+        pid = query["persistentId"]
+        if self.locked(pid):
+            return 409, {"status": "ERROR", "message": "Dataset is locked"}
+        form = parse_form(request.headers["Content-Type"], body)
+        md = parse_json_data(form["jsonData"].decode())
+        if "file" in form:
+            entry = self.register(
+                pid,
+                md,
+                len(form["file"]),
+                {"type": "MD5", "value": hashlib.md5(form["file"]).hexdigest()},
+            )
+        else:
+            entry = self.register(pid, md)
+        return self.ok({"files": [entry]})
+
+    def on_add_files(self, request, query, body):
+        pid = query["persistentId"]
+        if self.locked(pid):
+            return 409, {"status": "ERROR", "message": "Dataset is locked"}
+        form = parse_form(request.headers["Content-Type"], body)
+        entries = [
+            self.register(pid, md) for md in parse_json_data(form["jsonData"].decode())
+        ]
+        return self.ok(
+            {
+                "Files": entries,
+                "Result": {
+                    "Total number of files": len(entries),
+                    "Number of files successfully added": len(entries),
+                },
+            }
+        )
+
+    def find_file(self, file_id):
+        for pid, dataset in self.datasets.items():
+            for entry in dataset["files"]:
+                if entry["dataFile"]["id"] == int(file_id):
+                    return pid, entry
+        raise KeyError(file_id)
+
+    def on_replace(self, request, query, body, file_id):
+        pid, old = self.find_file(file_id)
+        form = parse_form(request.headers["Content-Type"], body)
+        md = parse_json_data(form["jsonData"].decode())
+        with self.lock:
+            self.datasets[pid]["files"].remove(old)
+        if "file" in form:
+            md.setdefault("fileName", old["label"])
+            entry = self.register(
+                pid,
+                md,
+                len(form["file"]),
+                {"type": "MD5", "value": hashlib.md5(form["file"]).hexdigest()},
+            )
+        else:
+            entry = self.register(pid, md)
+        return self.ok({"files": [entry]})
+
+    def on_delete_file(self, request, query, body, file_id):
+        pid, entry = self.find_file(file_id)
+        with self.lock:
+            self.datasets[pid]["files"].remove(entry)
+        return self.ok({"message": f"File {file_id} deleted"})
+
+    def on_list_files(self, request, query, body, version):
+        return self.ok(list(self.datasets[query["persistentId"]]["files"]))
+
+    def on_locks(self, request, query, body):
+        with self.lock:
+            return self.ok(list(self.datasets[query["persistentId"]]["locks"]))
+
+    def on_search(self, request, query, body):
+        pids = re.findall(r'dsPersistentId:"([^"]+)"', query.get("q", ""))
+        items = [
+            {
+                "global_id": pid,
+                "versionState": (
+                    "RELEASED" if self.datasets[pid]["published"] else "DRAFT"
+                ),
+                "published_at": (
+                    "2024-01-01T00:00:00Z" if self.datasets[pid]["published"] else None
+                ),
+            }
+            for pid in pids
+            if pid in self.datasets
+        ]
+        return self.ok({"total_count": len(items), "items": items})
+
+
+# ---- iRODS ---- #
+
+
+def pattern(path):
+    """Deterministic 4 KiB block that fills the contents of a fake data object."""
+    seed = hashlib.sha256(path.encode()).digest()
+    return (seed * 128)[:4096]
+
+
+class FakeRaw(io.RawIOBase):
+    """Contents of a fake data object, generated on the fly."""
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.position = 0
+        self.block = pattern(obj.path)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.obj.size}
+        self.position = base[whence] + offset
+        return self.position
+
+    def readinto(self, buffer):
+        if self.obj.session.latency:
+            time.sleep(self.obj.session.latency)
+        n = max(0, min(len(buffer), self.obj.size - self.position))
+        start = self.position % len(self.block)
+        view = memoryview(buffer)
+        written = 0
+        while written < n:
+            chunk = self.block[start : start + n - written]
+            view[written : written + len(chunk)] = chunk
+            written += len(chunk)
+            start = 0
+        self.position += n
+        self.obj.session.bytes_read += n
+        return n
+
+
+class FakeMetaCollection:
+    """Metadata of a fake data object or collection, like `iRODSMetaCollection`."""
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.avus = []
+
+    def get_all(self, name):
+        return [x for x in self.avus if x.name == name]
+
+    def get_one(self, name):
+        found = self.get_all(name)
+        if len(found) != 1:
+            raise KeyError(name)
+        return found[0]
+
+    def items(self):
+        return list(self.avus)
+
+    def keys(self):
+        return [x.name for x in self.avus]
+
+    def add(self, name, value, units=None):
+        self.owner.session.op()
+        self._add(name, value, units)
+
+    def _add(self, name, value, units=None):
+        if not any(x.name == name and x.value == value for x in self.avus):
+            avu = iRODSMeta(name, value, units)
+            avu.avu_id = next(self.owner.session.ids)
+            avu.modify_time = self.owner.session.now()
+            self.avus.append(avu)
+
+    def set(self, name, value, units=None):
+        self.owner.session.op()
+        self.avus = [x for x in self.avus if x.name != name]
+        self._add(name, value, units)
+
+    def remove(self, name, value, units=None):
+        self.owner.session.op()
+        self.avus = [x for x in self.avus if not (x.name == name and x.value == value)]
+
+    def apply_atomic_operations(self, *operations):
+        self.owner.session.op()
+        with self.owner.session.lock:
+            for operation in operations:
+                if operation.operation == "add":
+                    self._add(operation.avu.name, operation.avu.value)
+                else:
+                    self.avus = [
+                        x
+                        for x in self.avus
+                        if not (
+                            x.name == operation.avu.name
+                            and x.value == operation.avu.value
+                        )
+                    ]
+
+
+class FakeDataObject:
+    """Data object in the fake catalog, with the attributes used from `iRODSDataObject`."""
+
+    def __init__(self, session, path, size, has_checksum=True, resource="demoResc"):
+        self.session = session
+        self.path = path
+        self.name = path.rsplit("/", 1)[1]
+        self.collection = SimpleNamespace(path=path.rsplit("/", 1)[0])
+        self.id = next(session.ids)
+        self.size = size
+        self.resource_name = resource
+        self.modify_time = session.now()
+        self._checksum = None
+        self.has_checksum = has_checksum
+        self.metadata = FakeMetaCollection(self)
+        self.replicas = [
+            SimpleNamespace(
+                number=0,
+                status="1",
+                resource_name=resource,
+                path=f"/vault{path}",
+                resc_hier=resource,
+            )
+        ]
+
+    def __repr__(self):
+        return f"<FakeDataObject {self.id} {self.name}>"
+
+    def compute_checksum(self):
+        if self._checksum is None:
+            digest = hashlib.sha256()
+            with self.open("r") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            self._checksum = "sha2:" + base64.b64encode(digest.digest()).decode()
+        return self._checksum
+
+    @property
+    def checksum(self):
+        return self.compute_checksum() if self.has_checksum else None
+
+    def chksum(self, **options):
+        self.session.op()
+        self.has_checksum = True
+        return self.compute_checksum()
+
+    def open(self, mode="r", allow_redirect=False, **options):
+        self.session.op()
+        number = options.get(kw.REPL_NUM_KW)
+        replica = next(
+            (x for x in self.replicas if str(x.number) == number), self.replicas[0]
+        )
+        if allow_redirect:
+            # connection to the server of the resource
+            self.session.op()
+            if replica.resource_name in self.session.unreachable:
+                raise ConnectionRefusedError(f"{replica.resource_name} is unreachable")
+            self.session.redirected += 1
+        self.session.opened += 1
+        self.session.read_from[replica.resource_name] += 1
+        return io.BufferedReader(FakeRaw(self))
+
+
+class FakeDataObjectManager:
+    def __init__(self, session):
+        self.session = session
+
+    def get(self, path, local_path=None, **options):
+        self.session.op()
+        obj = self.session.objects[path]
+        if local_path is not None:
+            with obj.open("r", **options) as src, open(local_path, "wb") as trg:
+                for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                    trg.write(chunk)
+        return obj
+
+    def chksum(self, path, **options):
+        return self.session.objects[path].chksum(**options)
+
+    def replicate(self, path, resource=None, **options):
+        """New good replica on the destination resource, after `stage_seconds` (e.g. a tape recall)."""
+        self.session.op()
+        if self.session.stage_seconds:
+            time.sleep(self.session.stage_seconds)
+        obj = self.session.objects[path]
+        target = options.get(kw.DEST_RESC_NAME_KW, resource)
+        with self.session.lock:
+            obj.replicas.append(
+                SimpleNamespace(
+                    number=len(obj.replicas),
+                    status="1",
+                    resource_name=target,
+                    path=f"/cache{path}",
+                    resc_hier=target,
+                )
+            )
+
+    def open(self, path, mode="r", **options):
+        return self.session.objects[path].open(mode, **options)
+
+
+class FakeCollection:
+    def __init__(self, session, path):
+        self.session = session
+        self.path = path
+        self.name = path.rsplit("/", 1)[1]
+        self.id = next(session.ids)
+        self.modify_time = session.now()
+        self.metadata = FakeMetaCollection(self)
+
+
+class FakeCollectionManager:
+    def __init__(self, session):
+        self.session = session
+
+    def get(self, path):
+        self.session.op()
+        if path not in self.session.collections_by_path:
+            raise KeyError(path)
+        return self.session.collections_by_path[path]
+
+
+class FakeMetadataManager:
+    def __init__(self, session):
+        self.session = session
+
+    def apply_atomic_operations(self, model_cls, path, *operations):
+        owner = (
+            self.session.collections_by_path[path]
+            if model_cls is Collection
+            else self.session.objects[path]
+        )
+        owner.metadata.apply_atomic_operations(*operations)
+
+
+def columns_of(model):
+    return {v for v in vars(model).values() if isinstance(v, Column)}
+
+
+META_COLUMNS = columns_of(DataObjectMeta)
+RESOURCE_COLUMNS = columns_of(Resource)
+
+
+def irods_string(column, value):
+    """Representation of a value as compared by the catalog."""
+    return column.column_type.to_irods(value).strip("'")
+
+
+class FakeQuery:
+    """GenQuery over the fake catalog: one row per object, replica and (if requested) AVU."""
+
+    def __init__(self, session, columns, criteria=()):
+        self.session = session
+        self.columns = columns
+        self.criteria = list(criteria)
+
+    def filter(self, *criteria):
+        return FakeQuery(self.session, self.columns, self.criteria + list(criteria))
+
+    def rows(self):
+        keys = set(self.columns) | {x.query_key for x in self.criteria}
+        with_meta = bool(keys & META_COLUMNS)
+        for obj in list(self.session.objects.values()):
+            # hashing is only done when the checksum is requested
+            checksum = obj.checksum if DataObject.checksum in keys else None
+            for replica in obj.replicas:
+                row = {
+                    Collection.name: obj.collection.path,
+                    DataObject.id: obj.id,
+                    DataObject.name: obj.name,
+                    DataObject.size: obj.size,
+                    DataObject.checksum: checksum,
+                    DataObject.modify_time: obj.modify_time,
+                    DataObject.replica_number: replica.number,
+                    DataObject.replica_status: replica.status,
+                    DataObject.resource_name: replica.resource_name,
+                    DataObject.resc_hier: replica.resc_hier,
+                    DataObject.path: replica.path,
+                }
+                resource = self.session.resources.get(replica.resource_name, {})
+                row.update(
+                    {
+                        Resource.name: replica.resource_name,
+                        Resource.type: resource.get("type", "unixfilesystem"),
+                        Resource.context: resource.get("context", ""),
+                        Resource.location: resource.get("location", "localhost"),
+                    }
+                )
+                if not with_meta:
+                    yield row
+                    continue
+                for avu in obj.metadata.avus:
+                    meta_row = dict(row)
+                    meta_row.update(
+                        {
+                            DataObjectMeta.id: avu.avu_id,
+                            DataObjectMeta.name: avu.name,
+                            DataObjectMeta.value: avu.value,
+                            DataObjectMeta.units: avu.units,
+                            DataObjectMeta.modify_time: avu.modify_time,
+                        }
+                    )
+                    yield meta_row
+
+    def match(self, row, criterion):
+        column = criterion.query_key
+        if row.get(column) is None:
+            return False
+        value = irods_string(column, row[column])
+        if isinstance(criterion, In):
+            return value in [str(x) for x in criterion.value]
+        other = irods_string(column, criterion.value)
+        if criterion.op == "like":
+            return re.fullmatch(re.escape(other).replace("%", ".*"), value) is not None
+        if criterion.op in ("=", "!=", "<>"):
+            return (value == other) == (criterion.op == "=")
+        if value.isdigit() and other.isdigit():
+            value, other = int(value), int(other)
+        return {
+            ">": value > other,
+            ">=": value >= other,
+            "<": value < other,
+            "<=": value <= other,
+        }[criterion.op]
+
+    def __iter__(self):
+        self.session.op()
+        seen = set()
+        for row in self.rows():
+            if not all(self.match(row, x) for x in self.criteria):
+                continue
+            result = {k: row.get(k) for k in self.columns}
+            key = tuple(result.values())
+            if key not in seen:
+                seen.add(key)
+                yield result
+
+    def all(self):
+        return list(self)
+
+    def get_results(self):
+        return iter(self)
+
+
+class FakeSession:
+    """iRODS session with an in-memory catalog.
+
+    Args:
+        latency (float, optional): Seconds added to every catalog operation and read. Defaults to 0.
+        zone (str, optional): Name of the zone. Defaults to "zone".
+    """
+
+    def __init__(self, latency=0.0, zone="zone"):
+        self.latency = latency
+        self.zone = zone
+        self.username = "user"
+        self.host = "localhost"
+        self.lock = threading.RLock()
+        self.ids = iter(range(10000, 10**12))
+        self.objects = {}
+        self.collections_by_path = {}
+        self.resources = {}
+        self.operations = 0
+        self.opened = 0
+        self.redirected = 0
+        # resources whose server refuses redirected connections
+        self.unreachable = set()
+        # number of opened replicas by resource
+        self.read_from = collections.Counter()
+        # duration of a replication, e.g. to stage an object from tape
+        self.stage_seconds = 0.0
+        self.bytes_read = 0
+        self.clock = 1700000000
+        self.data_objects = FakeDataObjectManager(self)
+        self.collections = FakeCollectionManager(self)
+        self.metadata = FakeMetadataManager(self)
+
+    def now(self):
+        """Monotonic modification times, one second apart."""
+        with self.lock:
+            self.clock += 1
+            return datetime.datetime.fromtimestamp(self.clock, datetime.timezone.utc)
+
+    def op(self):
+        with self.lock:
+            self.operations += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def add_collection(self, path):
+        if path not in self.collections_by_path:
+            self.collections_by_path[path] = FakeCollection(self, path)
+        return self.collections_by_path[path]
+
+    def add_object(
+        self, path, size=1024, avus=(), has_checksum=True, resource="demoResc"
+    ):
+        """Add a data object to the catalog.
+
+        Args:
+            path (str): Logical path.
+            size (int, optional): Size in bytes. Defaults to 1024.
+            avus (iterable, optional): (attribute, value) pairs. Defaults to ().
+            has_checksum (bool, optional): Whether the catalog has its checksum. Defaults to True.
+            resource (str, optional): Name of the resource of its replica. Defaults to "demoResc".
+        """
+        self.add_collection(path.rsplit("/", 1)[0])
+        obj = FakeDataObject(self, path, size, has_checksum, resource)
+        for name, value in avus:
+            obj.metadata._add(name, value)
+        self.objects[path] = obj
+        return obj
+
+    def query(self, *columns):
+        return FakeQuery(self, columns)
+
+    def cleanup(self):
+        pass
@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+from unittest import mock
+from pyDataverse.api import NativeApi
+from irods2dataverse import async_upload, deposit, direct_upload, from_irods
+from irods2dataverse.customClass import DemoDataset
+from tests.benchmark import run_scenario
+from tests.stand_ins import FakeDataverse, FakeSession
+from tests.test_ingest import object_info
+
+
+class TestAsyncUpload(unittest.TestCase):
+    def test_engine(self):
+        result = run_scenario(50, 10000, verify=True, engine="async")
+        self.assertEqual(result["failures"], 0)
+        self.assertEqual(result["stored"], 50)
+        self.assertEqual(result["requests"]["add"], 50)
+        for obj in result["session"].objects.values():
+            self.assertEqual(obj.metadata.get_one("dv.publication").value, "deposited")
+
+    def test_errors_are_collected(self):
+        result = run_scenario(20, 100, error_rate=0.2, engine="async")
+        self.assertGreater(result["failures"], 0)
+        self.assertEqual(result["stored"], 20 - result["failures"])
+
+    def test_create_dataset_and_put(self):
+        session = FakeSession()
+        obj = session.add_object("/zone/home/user/a.bin", 3 * 1024**2 + 5)
+        header_key, header_ct = direct_upload.create_headers("token")
+
+        async def deposit(url):
+            async with async_upload.create_client() as client:
+                ds = DemoDataset()
+                ds.set({"title": "Test"})
+                status, pid, _ = await async_upload.create_dataset(
+                    client, url, ds, header_key
+                )
+                file_url, storage_id = await async_upload.get_du_url(
+                    client, url, pid, obj.size, header_key
+                )
+                response = await async_upload.put_in_s3(
+                    client, obj, file_url, header_ct
+                )
+                return status, response.status_code, storage_id
+
+        with FakeDataverse(verify=True) as dv:
+            status, code, storage_id = asyncio.run(deposit(dv.url))
+            stored = dv.s3[storage_id.rsplit(":", 1)[1]]
+        self.assertEqual((status, code), ("OK", 200))
+        self.assertEqual(stored["size"], obj.size)
+
+    def test_multipart(self):
+        session = FakeSession()
+        items = [
+            session.add_object(f"/zone/home/user/f{i}.bin", 2500 + i) for i in range(3)
+        ]
+        with FakeDataverse(part_size=1000, verify=True) as dv:
+            pid = dv.add_dataset()
+            results = async_upload.run_uploads(items, dv.url, pid, {}, {})
+            self.assertEqual(len(dv.files(pid)), 3)
+        self.assertFalse([x for x in results.values() if isinstance(x, Exception)])
+
+    def test_ingest(self):
+        session = FakeSession()
+        names = ["a.csv"] + [f"f{i}.bin" for i in range(5)]
+        items = [session.add_object(f"/zone/home/user/{x}", 1000) for x in names]
+        with mock.patch.object(
+            from_irods, "get_object_info", object_info
+        ), FakeDataverse(ingest_seconds=1) as dv:
+            pid = dv.add_dataset()
+            deposited = deposit.upload_objects(
+                items, "direct", NativeApi(dv.url), pid, {}, {}, engine="async"
+            )
+            labels = [x["label"] for x in dv.files(pid)]
+        self.assertEqual(len(deposited), 6)
+        # the tabular file is registered last, once the others are in the dataset
+        self.assertEqual(labels[-1], "a.csv")
+
+    def test_selectable(self):
+        session = FakeSession()
+        items = [
+            session.add_object(f"/zone/home/user/f{i}.bin", 1000) for i in range(4)
+        ]
+        with FakeDataverse(error_rate=0.3, seed=1) as dv:
+            pid = dv.add_dataset()
+            deposited = deposit.upload_objects(
+                items, "direct", NativeApi(dv.url), pid, {}, {}, engine="async"
+            )
+            self.assertEqual(len(dv.files(pid)), len(deposited))
+        self.assertLess(len(deposited), len(items))
+        for item in items:
+            status = [x.value for x in item.metadata.get_all("dv.publication")]
+            self.assertEqual(status, ["deposited"] if item in deposited else [])
@@ -0,0 +1,126 @@
+import unittest
+from unittest import mock
+from pyDataverse.api import NativeApi
+from irods2dataverse import audit, from_irods
+from tests.stand_ins import FakeDataverse, FakeSession
+
+
+def deposited(session, path, doi, has_checksum=True):
+    return session.add_object(
+        path,
+        avus=[
+            ("dv.publication", "deposited"),
+            ("dv.ds.DOI", doi),
+            ("dv.installation", "Demo"),
+        ],
+        has_checksum=has_checksum,
+    )
+
+
+class TestAudit(unittest.TestCase):
+    def setUp(self):
+        self.session = FakeSession()
+        self.a = deposited(self.session, "/zone/home/user/a.txt", "doi:10.1/X")
+        self.b = deposited(
+            self.session, "/zone/home/user/b.txt", "doi:10.1/X", has_checksum=False
+        )
+        self.session.add_object(
+            "/zone/home/user/c.txt", avus=[("dv.publication", "initiated")]
+        )
+
+    def test_query_checksums(self):
+        dchksum = from_irods.query_checksums(
+            "dv.publication", ["deposited", "published"], self.session
+        )
+        self.assertEqual(dchksum, {self.a.path: self.a.checksum, self.b.path: None})
+
+    def test_compute_missing(self):
+        dchksum = {self.a.path: self.a.checksum, self.b.path: None, "/zone/gone": None}
+        computed = audit.compute_missing(dchksum, self.session)
+        self.assertEqual(set(computed), {self.b.path, "/zone/gone"})
+        self.assertEqual(computed[self.b.path], self.b.checksum)
+        # the failures are recorded and do not stop the others
+        self.assertIsInstance(computed["/zone/gone"], KeyError)
+        self.assertEqual(dchksum[self.b.path], self.b.checksum)
+        self.assertIsNone(dchksum["/zone/gone"])
+
+    def test_match_and_compare(self):
+        checksum = {"type": "SHA-256", "value": self.a.checksum[5:]}
+        ds_files = {
+            "data/a.txt": {
+                "label": "a.txt",
+                "storageIdentifier": "s3://b:1",
+                "checksum": checksum,
+            },
+            "data/x/a.txt": {
+                "label": "a.txt",
+                "storageIdentifier": "s3://b:2",
+                "checksum": {},
+            },
+            "data/b.txt": {
+                "label": "b.txt",
+                "storageIdentifier": "s3://b:3",
+                "checksum": checksum,
+            },
+        }
+        ds_file = audit.match_file(self.a.path, ["s3://b:1"], ds_files)
+        self.assertIs(ds_file, ds_files["data/a.txt"])
+        # two files named a.txt: no match by name
+        self.assertIsNone(audit.match_file(self.a.path, [], ds_files))
+        self.assertIs(
+            audit.match_file(self.b.path, [], ds_files), ds_files["data/b.txt"]
+        )
+        self.assertEqual(audit.compare(self.a.checksum, ds_file), "ok")
+        self.assertEqual(audit.compare(self.b.compute_checksum(), ds_file), "mismatch")
+        md5 = {"type": "MD5", "value": "0" * 32}
+        self.assertEqual(
+            audit.compare(self.a.checksum, {"checksum": md5}), "incomparable"
+        )
+        self.assertEqual(audit.compare(self.a.checksum, None), "missing")
+
+    def test_audit(self):
+        c = deposited(self.session, "/zone/home/user/c.bin", "doi:10.1/X")
+        d = deposited(self.session, "/zone/home/user/d.bin", "doi:10.1/X")
+        chksum = self.session.data_objects.chksum
+
+        def flaky(path, **options):
+            if path == self.b.path:
+                raise RuntimeError("SYS_NOT_ALLOWED")
+            return chksum(path, **options)
+
+        with FakeDataverse() as dv:
+            pid = dv.add_dataset("doi:10.1/X")
+            for obj, checksum in ((self.a, self.a.checksum), (c, d.checksum)):
+                dv.register(
+                    pid,
+                    {"fileName": obj.name, "storageIdentifier": f"s3://b:{obj.id}"},
+                    obj.size,
+                    {"type": "SHA-256", "value": checksum[5:]},
+                )
+            with mock.patch.object(self.session.data_objects, "chksum", flaky):
+                report = audit.audit(self.session, {"Demo": NativeApi(dv.url)})
+        self.assertEqual(
+            report["summary"], {"ok": 1, "mismatch": 1, "missing": 1, "error": 1}
+        )
+        problems = {x["path"]: x for x in report["problems"]}
+        self.assertEqual(problems[self.b.path]["checksum_error"], "SYS_NOT_ALLOWED")
+        self.assertEqual(problems[c.path]["status"], "mismatch")
+        self.assertEqual(problems[d.path]["status"], "missing")
+
+    def test_unlisted(self):
+        e = deposited(self.session, "/zone/home/user/e.bin", "doi:10.1/Y")
+        list_ds_files = audit.to_dataverse.list_ds_files
+
+        def unreachable(api, doi):
+            if doi == "doi:10.1/Y":
+                raise ConnectionError("reset")
+            return list_ds_files(api, doi)
+
+        with FakeDataverse() as dv:
+            dv.add_dataset("doi:10.1/X")
+            with mock.patch.object(audit.to_dataverse, "list_ds_files", unreachable):
+                report = audit.audit(self.session, {"Demo": NativeApi(dv.url)})
+        self.assertEqual(report["summary"]["unlisted"], 1)
+        problems = {x["path"]: x for x in report["problems"]}
+        self.assertEqual(problems[e.path]["listing_error"], "reset")
+        self.assertEqual(problems[self.a.path]["status"], "missing")
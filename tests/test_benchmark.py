@@ -0,0 +1,55 @@
+import unittest
+import base64
+from tests.benchmark import CREATE_ATTEMPTS, run_scenario, compare, parse_size
+
+
+class TestStandIns(unittest.TestCase):
+    def test_pipeline(self):
+        result = run_scenario(5, 10000, verify=True)
+        self.assertEqual(result["failures"], 0)
+        self.assertEqual(result["stored"], 5)
+        self.assertEqual(result["requests"]["uploadurls"], 5)
+        self.assertEqual(result["requests"]["add"], 5)
+        self.assertIn("transfer", result["stages"])
+        for obj in result["session"].objects.values():
+            self.assertEqual(obj.metadata.get_one("dv.publication").value, "deposited")
+
+    def test_uploaded_content(self):
+        from tests.stand_ins import FakeDataverse, FakeSession
+        from irods2dataverse import direct_upload
+
+        session = FakeSession()
+        obj = session.add_object("/zone/home/user/a.bin", 100000)
+        with FakeDataverse(verify=True) as dv:
+            pid = dv.add_dataset()
+            url, storage_id = direct_upload.get_du_url(dv.url, pid, obj.size, {})
+            response = direct_upload.put_in_s3(obj, url, {})
+            self.assertEqual(response.status_code, 200)
+            stored = dv.s3[storage_id.rsplit(":", 1)[1]]
+        self.assertEqual(stored["size"], obj.size)
+        self.assertEqual(
+            base64.b64encode(bytes.fromhex(stored["sha256"])).decode(),
+            obj.checksum[5:],
+        )
+
+    def test_injected_errors(self):
+        result = run_scenario(20, 100, error_rate=0.2)
+        self.assertGreater(result["failures"], 0)
+        self.assertEqual(result["stored"], 20 - result["failures"])
+
+    def test_dataset_not_created(self):
+        result = run_scenario(3, 100, error_rate=1.0)
+        self.assertEqual((result["failures"], result["stored"]), (3, 0))
+        self.assertEqual(result["requests"]["create_dataset"], CREATE_ATTEMPTS)
+
+
+class TestRegressionGate(unittest.TestCase):
+    def test_compare(self):
+        baseline = {"scenarios": [{"name": "a", "objects_per_second": 100}]}
+        report = {"scenarios": [{"name": "a", "objects_per_second": 85}]}
+        self.assertEqual(compare(report, baseline, 0.2), [])
+        self.assertEqual(len(compare(report, baseline, 0.1)), 1)
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size("4MiB"), 4 * 1024**2)
+        self.assertEqual(parse_size("512"), 512)
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+from irods2dataverse import capabilities, deposit, direct_upload
+from tests.stand_ins import FakeDataverse, FakeSession
+
+
+class TestCapabilities(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = os.path.join(self.tmp.name, "capabilities.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_probe_and_cache(self):
+        settings = {":MaxFileUploadSizeInBytes": 10**12}
+        with FakeDataverse(part_size=1024**3, settings=settings, quota=10**9) as dv:
+            pid = dv.add_dataset()
+            caps = capabilities.get_capabilities(
+                dv.url, "demo", {}, pid, cache_path=self.cache
+            )
+            self.assertEqual(dv.requests["mpupload_abort"], 1)
+            requests = sum(dv.requests.values())
+            cached = capabilities.get_capabilities(
+                dv.url, "demo", {}, pid, cache_path=self.cache
+            )
+            self.assertEqual(sum(dv.requests.values()), requests)
+        self.assertEqual(cached, caps)
+        self.assertTrue(caps["direct_upload"])
+        self.assertEqual(caps["part_size"], 1024**3)
+        self.assertEqual(caps["max_file_size"], 10**12)
+        self.assertEqual(caps["quota"], 10**9)
+        self.assertEqual(caps["storage_use"], 0)
+        self.assertEqual(capabilities.choose_strategy(caps), "direct-batch")
+
+    def test_strategies(self):
+        with FakeDataverse(version="5.3") as dv:
+            caps = capabilities.probe(dv.url, "demo", {}, dv.add_dataset())
+        self.assertEqual(capabilities.choose_strategy(caps), "direct")
+        self.assertIsNone(caps["part_size"])
+        with FakeDataverse(direct_upload=False) as dv:
+            caps = capabilities.probe(dv.url, "demo", {}, dv.add_dataset())
+        self.assertEqual(capabilities.choose_strategy(caps), "native")
+        self.assertIsNone(caps["quota"])
+
+    def test_failed_probe(self):
+        with FakeDataverse() as dv:
+            # e.g. a dataset that is not indexed yet
+            caps = capabilities.get_capabilities(
+                dv.url, "demo", {}, "doi:10.1/UNKNOWN", cache_path=self.cache
+            )
+            self.assertIsNone(caps["direct_upload"])
+            self.assertFalse(os.path.exists(self.cache))
+            caps = capabilities.get_capabilities(
+                dv.url, "demo", {}, dv.add_dataset(), cache_path=self.cache
+            )
+        self.assertTrue(caps["direct_upload"])
+        self.assertEqual(capabilities.read_cache(self.cache)[f"{dv.url}|demo"], caps)
+
+    def test_expired_cache(self):
+        with FakeDataverse() as dv:
+            capabilities.get_capabilities(dv.url, "demo", cache_path=self.cache)
+            capabilities.get_capabilities(dv.url, "demo", ttl=0, cache_path=self.cache)
+            self.assertEqual(dv.requests["version"], 2)
+
+
+class TestBatchUpload(unittest.TestCase):
+    def test_multipart_and_add_files(self):
+        session = FakeSession()
+        objs = [
+            session.add_object(f"/zone/home/user/file{i}.bin", size)
+            for i, size in enumerate([100, 2500, 3000])
+        ]
+        header_key, header_ct = direct_upload.create_headers("token")
+        with FakeDataverse(part_size=1000, verify=True) as dv:
+            pid = dv.add_dataset()
+            storage_ids = deposit.upload_direct_batch(
+                objs, dv.url, pid, header_key, header_ct, batch_size=2
+            )
+            self.assertEqual(dv.requests["add_files"], 2)
+            self.assertEqual(dv.requests["mpupload_complete"], 2)
+            self.assertEqual(dv.requests["s3_put"], 1 + 3 + 3)
+            files = dv.files(pid)
+        self.assertEqual(len(storage_ids), 3)
+        self.assertEqual(
+            sorted(x["dataFile"]["filesize"] for x in files), [100, 2500, 3000]
+        )
@@ -0,0 +1,123 @@
+import unittest
+import base64
+import hashlib
+from types import SimpleNamespace
+from pyDataverse.api import NativeApi
+from irods2dataverse import deposit, to_dataverse
+from irods2dataverse.deposit import compare_files, common_root
+from irods2dataverse.from_irods import same_checksum
+from tests.stand_ins import FakeDataverse, FakeSession
+
+
+def make_object(path, content):
+    digest = hashlib.sha256(content).digest()
+    return SimpleNamespace(
+        path=path,
+        name=path.rsplit("/", 1)[1],
+        checksum="sha2:" + base64.b64encode(digest).decode(),
+    )
+
+
+def make_file(file_id, label, content):
+    return {
+        "id": file_id,
+        "label": label,
+        "checksum": {"type": "SHA-256", "value": hashlib.sha256(content).hexdigest()},
+        "storageIdentifier": f"s3://bucket:{file_id}",
+        "filesize": len(content),
+    }
+
+
+class TestChecksum(unittest.TestCase):
+    def test_sha256_hex_and_base64(self):
+        obj = make_object("/zone/home/a.txt", b"abc")
+        hex_value = hashlib.sha256(b"abc").hexdigest()
+        self.assertTrue(
+            same_checksum(obj.checksum, {"type": "SHA-256", "value": hex_value})
+        )
+        self.assertTrue(
+            same_checksum(obj.checksum, {"type": "SHA-256", "value": obj.checksum[5:]})
+        )
+        self.assertFalse(same_checksum(obj.checksum, {"type": "SHA-256", "value": "0"}))
+
+    def test_different_algorithms(self):
+        obj = make_object("/zone/home/a.txt", b"abc")
+        md5 = hashlib.md5(b"abc").hexdigest()
+        self.assertFalse(same_checksum(obj.checksum, {"type": "MD5", "value": md5}))
+        self.assertTrue(same_checksum(md5, {"type": "MD5", "value": md5}))
+
+
+class TestCompareFiles(unittest.TestCase):
+    def setUp(self):
+        self.objects = [
+            make_object("/zone/home/ds/a.txt", b"same"),
+            make_object("/zone/home/ds/sub/b.txt", b"changed"),
+            make_object("/zone/home/ds/sub/c.txt", b"new"),
+        ]
+        self.ds_files = {
+            "a.txt": make_file(1, "a.txt", b"same"),
+            "sub/b.txt": make_file(2, "b.txt", b"original"),
+            "gone.txt": make_file(3, "gone.txt", b"gone"),
+        }
+
+    def test_common_root(self):
+        self.assertEqual(common_root(self.objects), "/zone/home/ds")
+
+    def test_compare(self):
+        changes = compare_files(self.objects, self.ds_files)
+        self.assertEqual([x[1] for x in changes["unchanged"]], ["a.txt"])
+        self.assertEqual([x[1] for x in changes["modified"]], ["sub/b.txt"])
+        self.assertEqual(changes["modified"][0][2]["id"], 2)
+        self.assertEqual([x[1] for x in changes["new"]], ["sub/c.txt"])
+        self.assertEqual([x["id"] for x in changes["removed"]], [3])
+
+    def test_match_by_unique_name(self):
+        ds_files = {"data/subdir1/a.txt": make_file(1, "a.txt", b"same")}
+        changes = compare_files(self.objects[:1], ds_files, root="/zone/home/ds")
+        self.assertEqual(changes["unchanged"], [])
+        # it stays in its folder
+        self.assertEqual([x[1] for x in changes["moved"]], ["data/subdir1/a.txt"])
+        self.assertEqual(changes["removed"], [])
+        ds_files = {"data/subdir1/a.txt": make_file(1, "a.txt", b"original")}
+        changes = compare_files(self.objects[:1], ds_files, root="/zone/home/ds")
+        self.assertEqual([x[1] for x in changes["modified"]], ["data/subdir1/a.txt"])
+
+
+class TestSync(unittest.TestCase):
+    def test_sync(self):
+        session = FakeSession()
+        first, second = [
+            session.add_object(f"/zone/home/ds/{x}", 1000) for x in ("a.bin", "b.bin")
+        ]
+        with FakeDataverse() as dv:
+            pid = dv.add_dataset()
+            # deposited before in the default folder
+            deposit.upload_direct(first, dv.url, pid, {}, {})
+            first.metadata.add("dv.ds.DOI", pid)
+            changes = deposit.sync_ds(
+                [first, second], NativeApi(dv.url, "token"), pid, dv.url, {}, {}
+            )
+            self.assertEqual([x[0] for x in changes["moved"]], [first])
+            self.assertEqual([x[0] for x in changes["new"]], [second])
+            self.assertEqual(len(dv.files(pid)), 2)
+        for item in (first, second):
+            self.assertEqual(
+                [x.value for x in item.metadata.get_all("dv.ds.DOI")], [pid]
+            )
+            self.assertEqual(
+                item.metadata.get_one(deposit.atr_publish).value, "deposited"
+            )
+            self.assertTrue(item.metadata.get_all("dv.publication.timestamp"))
+
+    def test_sync_planned(self):
+        session = FakeSession()
+        objs = [session.add_object(f"/zone/home/ds/{x}", 1000) for x in "abc"]
+        with FakeDataverse() as dv:
+            pid = dv.add_dataset()
+            api = NativeApi(dv.url, "token")
+            changes = deposit.compare_files(objs, to_dataverse.list_ds_files(api, pid))
+            # the last object does not fit in the limits of the dataset
+            changes["new"] = changes["new"][:2]
+            deposit.sync_ds(objs, api, pid, dv.url, {}, {}, changes=changes)
+            self.assertEqual([x["label"] for x in dv.files(pid)], ["a", "b"])
+        self.assertEqual(objs[2].metadata.get_all(deposit.atr_publish), [])
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+from irods2dataverse.discovery import Watermark, discover
+from tests.stand_ins import FakeSession
+
+
+class TestDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.session = FakeSession()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "watermark.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def tag(self, name):
+        return self.session.add_object(
+            f"/zone/home/user/{name}", avus=[("dv.publication", "initiated")]
+        )
+
+    def poll(self):
+        return [
+            x.path
+            for x in discover("dv.publication", "initiated", self.session, self.path)
+        ]
+
+    def test_only_new_objects(self):
+        self.tag("a")
+        self.tag("b")
+        self.session.add_object("/zone/home/user/c")
+        self.assertEqual(len(self.poll()), 2)
+        self.assertEqual(self.poll(), [])
+        self.tag("d")
+        self.assertEqual(self.poll(), ["/zone/home/user/d"])
+
+    def test_failed_object_is_yielded_again(self):
+        self.tag("a")
+        self.tag("b")
+        with self.assertRaises(RuntimeError):
+            for obj in discover("dv.publication", "initiated", self.session, self.path):
+                if obj.name == "b":
+                    raise RuntimeError("deposit failed")
+        self.assertEqual(self.poll(), ["/zone/home/user/b"])
+
+    def test_same_second(self):
+        watermark = Watermark(self.path)
+        watermark.advance(100, 1)
+        watermark.save()
+        watermark = Watermark(self.path)
+        self.assertFalse(watermark.is_new(100, 1))
+        self.assertTrue(watermark.is_new(100, 2))
+        self.assertFalse(watermark.is_new(99, 3))
+        self.assertTrue(watermark.is_new(101, 1))
+
+    def test_shared_avu(self):
+        self.tag("a")
+        self.tag("b")
+        # processed objects no longer have the status
+        for obj in discover("dv.publication", "initiated", self.session, self.path):
+            obj.metadata.set("dv.publication", "deposited")
+        # tagged with the AVU of a: the time of the AVU is older than the watermark
+        c = self.tag("c")
+        c.metadata.get_one("dv.publication").modify_time = 1
+        self.assertEqual(self.poll(), [])
+        found = discover(
+            "dv.publication", "initiated", self.session, self.path, full_scan_every=0
+        )
+        self.assertEqual([x.path for x in found], [c.path])
+        self.assertGreater(Watermark(self.path).scanned_at, 0)
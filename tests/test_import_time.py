@@ -0,0 +1,58 @@
+import os
+import sys
+import subprocess
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+# cumulative import time allowed for each entry point, in microseconds (`python -X importtime`):
+# generous, so that only a heavy import made at the top of a module exceeds it on a slow machine
+BUDGET = 500_000
+# packages that must only be imported when they are used
+HEAVY = ("irods", "pyDataverse", "magic", "requests", "httpx", "rich", "maskpass")
+ENTRY_POINTS = (
+    "userScript",
+    "irods2dataverse.avu2json",
+    "irods2dataverse.discovery",
+    "irods2dataverse.prewarm",
+    "irods2dataverse.worker",
+    "irods2dataverse.audit",
+    "irods2dataverse.reconcile",
+    "irods2dataverse.plan",
+    "irods2dataverse.deposit",
+    "irods2dataverse.async_upload",
+)
+
+
+def import_times(module):
+    """Modules imported by `import module` in a new interpreter, with their cumulative time."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=dict(os.environ, PYTHONPATH=SRC),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+    def test_no_heavy_imports(self):
+        for module in ENTRY_POINTS:
+            with self.subTest(module=module):
+                times = import_times(module)
+                self.assertIn(module, times)
+                heavy = sorted(x for x in times if x.split(".")[0] in HEAVY)
+                self.assertEqual(heavy, [])
+
+    def test_budget(self):
+        for module in ENTRY_POINTS:
+            with self.subTest(module=module):
+                # the first import can include writing the bytecode
+                best = min(import_times(module)[module] for _ in range(2))
+                self.assertLess(best, BUDGET)
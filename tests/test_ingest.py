@@ -0,0 +1,124 @@
+import time
+import unittest
+import requests
+from types import SimpleNamespace
+from unittest import mock
+from irods2dataverse import deposit, direct_upload, from_irods
+from tests.stand_ins import FakeDataverse, FakeSession
+
+get_object_info = from_irods.get_object_info
+register_many = deposit.register_many
+
+
+def object_info(obj, head=None):
+    # the fake contents are random bytes: take the type from the extension
+    checksum, mimetype, size = get_object_info(obj, head)
+    return checksum, "text/csv" if obj.name.endswith(".csv") else mimetype, size
+
+
+class TestIngest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(from_irods, "get_object_info", object_info)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = FakeSession()
+        for name in ["a.csv", "b.bin", "c.csv", "d.bin"]:
+            self.session.add_object(f"/zone/home/user/{name}", 1000)
+        self.items = sorted(self.session.objects.values(), key=lambda x: x.path)
+
+    def labels(self, dv, pid):
+        return [x["label"] for x in dv.files(pid)]
+
+    def test_deferred(self):
+        with FakeDataverse(ingest_seconds=0.2) as dv:
+            pid = dv.add_dataset()
+            start = time.perf_counter()
+            storageIDs = deposit.upload_direct_deferred(self.items, dv.url, pid, {}, {})
+            duration = time.perf_counter() - start
+            self.assertEqual(len(storageIDs), 4)
+            self.assertEqual(self.labels(dv, pid), ["b.bin", "d.bin", "a.csv", "c.csv"])
+            # a single wait, for the ingest of the first tabular file
+            self.assertGreaterEqual(dv.requests["locks"], 1)
+            self.assertLess(duration, 2)
+
+    def test_batch(self):
+        with FakeDataverse(ingest_seconds=0.2) as dv:
+            pid = dv.add_dataset()
+            storageIDs = deposit.upload_direct_batch(
+                self.items, dv.url, pid, {}, {}, batch_size=1
+            )
+            self.assertEqual(len(storageIDs), 4)
+            self.assertEqual(self.labels(dv, pid)[2:], ["a.csv", "c.csv"])
+
+    def test_scheduled(self):
+        with FakeDataverse(ingest_seconds=0.2) as dv:
+            pid = dv.add_dataset()
+            storageIDs = deposit.upload_direct_scheduled(
+                self.items, dv.url, pid, {}, {}, policy="fifo", workers=2
+            )
+            self.assertEqual(len(storageIDs), 4)
+            # registered together, after the jobs
+            self.assertEqual(sorted(self.labels(dv, pid)[2:]), ["a.csv", "c.csv"])
+            self.assertEqual(dv.requests["add_files"], 3)
+
+    def test_batch_failure(self):
+        calls = []
+
+        def flaky(md_list, *args, **kwargs):
+            calls.append(md_list)
+            if len(calls) == 2:
+                raise requests.ConnectionError("reset")
+            if len(calls) == 3:
+                return SimpleNamespace(status_code=500, text="error")
+            return register_many(md_list, *args, **kwargs)
+
+        with FakeDataverse() as dv, mock.patch.object(deposit, "register_many", flaky):
+            pid = dv.add_dataset()
+            storageIDs = deposit.upload_direct_batch(
+                self.items, dv.url, pid, {}, {}, batch_size=1
+            )
+            # the batches registered before and after the failed ones are kept
+            self.assertEqual(
+                sorted(storageIDs), [self.items[1].path, self.items[2].path]
+            )
+            self.assertEqual(self.labels(dv, pid), ["b.bin", "c.csv"])
+
+    def test_deferred_failure(self):
+        register_direct = deposit.register_direct
+
+        def flaky(md_dict, *args, **kwargs):
+            if md_dict["fileName"] == "b.bin":
+                raise requests.ConnectionError("reset")
+            return register_direct(md_dict, *args, **kwargs)
+
+        with FakeDataverse() as dv, mock.patch.object(
+            deposit, "register_direct", flaky
+        ):
+            pid = dv.add_dataset()
+            storageIDs = deposit.upload_direct_deferred(self.items, dv.url, pid, {}, {})
+            self.assertEqual(len(storageIDs), 3)
+            self.assertNotIn(self.items[1].path, storageIDs)
+
+    def test_disabled(self):
+        self.items[2].metadata.add(deposit.atr_ingest, "false")
+        with FakeDataverse(ingest_seconds=5) as dv:
+            pid = dv.add_dataset()
+            deposit.upload_direct(self.items[2], dv.url, pid, {}, {})
+            self.assertFalse(dv.locked(pid))
+            deposit.upload_direct(self.items[0], dv.url, pid, {}, {}, ingest=False)
+            self.assertFalse(dv.locked(pid))
+            self.assertEqual(dv.requests["locks"], 0)
+
+    def test_lock_timeout(self):
+        with FakeDataverse(ingest_seconds=5) as dv:
+            pid = dv.add_dataset()
+            dv.ingest(pid)
+            self.assertFalse(direct_upload.wait_for_unlock(dv.url, pid, {}, 0.1))
+            response = deposit.register_direct(
+                {"fileName": "x", "storageIdentifier": "s3://x:1"},
+                dv.url,
+                pid,
+                {},
+                timeout=0.1,
+            )
+            self.assertEqual(response.status_code, 409)
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from pyDataverse.models import Dataset
+from irods2dataverse import to_dataverse
+from irods2dataverse.installations import Registry
+
+
+class TestInstallations(unittest.TestCase):
+    def test_package_config(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                registry = Registry()
+                self.assertEqual(registry.names(), ["Demo", "RDR", "RDR-pilot"])
+            finally:
+                os.chdir(cwd)
+        self.assertIn("RDR", registry)
+        self.assertEqual(registry.base_url("Demo"), "https://demo.dataverse.org")
+
+    def test_configured_path(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "installations.ini")
+            with open(path, "w") as f:
+                f.write("[Test]\nclassName = customClass.DemoDataset\n")
+            with mock.patch.dict("os.environ", {"IRODS2DATAVERSE_CONFIG": path}):
+                self.assertEqual(Registry().names(), ["Test"])
+            with self.assertRaises(FileNotFoundError):
+                Registry(os.path.join(tmp, "missing.ini")).names()
+
+    def test_independent_datasets(self):
+        registry = Registry()
+        required = list(Dataset._Dataset__attr_dict_dv_up_required)
+        with ThreadPoolExecutor(8) as executor:
+            datasets = list(
+                executor.map(registry.new_dataset, ["Demo", "RDR", "RDR-pilot"] * 10)
+            )
+        self.assertEqual(len({id(x) for x in datasets}), 30)
+        self.assertIs(registry.dataset_class("RDR"), type(datasets[1]))
+        # the lists of fields of pyDataverse are not changed by the RDR datasets
+        self.assertEqual(Dataset._Dataset__attr_dict_dv_up_required, required)
+        self.assertIn("subject", datasets[0]._Dataset__attr_dict_dv_up_required)
+        self.assertNotIn("subject", datasets[1]._Dataset__attr_dict_dv_up_required)
+        self.assertTrue(datasets[2].metadata_template.endswith("RDR-pilot.json"))
+
+    def test_authentication_cached(self):
+        registry = Registry()
+        statuses = iter([401, 200, 500])
+        with mock.patch.object(
+            to_dataverse,
+            "authenticate_DV",
+            side_effect=lambda url, token: (next(statuses), object()),
+        ) as authenticate:
+            self.assertEqual(registry.authenticate("Demo", "token")[0], 401)
+            status, api = registry.authenticate("Demo", "token")
+            self.assertEqual(status, 200)
+            self.assertIs(registry.authenticate("Demo", "token")[1], api)
+        self.assertEqual(authenticate.call_count, 2)
+        authenticate.assert_called_with("https://demo.dataverse.org", "token")
@@ -0,0 +1,61 @@
+import unittest
+import os.path
+import json
+import tempfile
+from irods2dataverse import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        metrics.enable()
+
+    def tearDown(self):
+        metrics.disable()
+        metrics.reset()
+
+    def test_disabled(self):
+        metrics.disable()
+        with metrics.stage("transfer"):
+            pass
+        metrics.count("bytes_uploaded", 10)
+        self.assertEqual(metrics.snapshot()["stages"], {})
+        self.assertEqual(metrics.snapshot()["counters"], {})
+
+    def test_stage_and_counter(self):
+        @metrics.timed("checksum")
+        def checksum():
+            return "sha2:..."
+
+        self.assertEqual(checksum(), "sha2:...")
+        with metrics.stage("checksum"):
+            pass
+        metrics.count("bytes_uploaded", 10)
+        metrics.count("bytes_uploaded", 5)
+        data = metrics.snapshot()
+        self.assertEqual(data["stages"]["checksum"]["count"], 2)
+        self.assertEqual(sum(data["stages"]["checksum"]["buckets"]), 2)
+        self.assertEqual(data["counters"], {"bytes_uploaded": 15})
+
+    def test_prometheus(self):
+        metrics.observe("transfer", 0.3)
+        metrics.observe("transfer", 400)
+        text = metrics.to_prometheus()
+        self.assertIn(
+            'irods2dataverse_stage_seconds_bucket{stage="transfer",le="0.25"} 0', text
+        )
+        self.assertIn(
+            'irods2dataverse_stage_seconds_bucket{stage="transfer",le="0.5"} 1', text
+        )
+        self.assertIn(
+            'irods2dataverse_stage_seconds_bucket{stage="transfer",le="+Inf"} 2', text
+        )
+        self.assertIn('irods2dataverse_stage_seconds_count{stage="transfer"} 2', text)
+
+    def test_export_json(self):
+        metrics.observe("transfer", 1)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics.json")
+            metrics.export(path)
+            with open(path) as f:
+                self.assertEqual(json.load(f)["stages"]["transfer"]["count"], 1)
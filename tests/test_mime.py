@@ -0,0 +1,93 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+from irods2dataverse import deposit, mime
+from tests.stand_ins import FakeDataverse, FakeSession
+
+
+class TestMime(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "cache", "mimetypes.json")
+        self.cache = mime.Cache(self.path)
+        patcher = mock.patch.object(mime, "shared_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = FakeSession()
+        self.csv = self.session.add_object("/zone/home/user/table.csv", 1000)
+        self.pdf = self.session.add_object("/zone/home/user/paper.PDF", 1000)
+        # the catalog has the checksums
+        for obj in (self.csv, self.pdf):
+            obj.compute_checksum()
+        self.session.read_from.clear()
+
+    def opened(self):
+        return sum(self.session.read_from.values())
+
+    def test_extension(self):
+        self.assertEqual(mime.from_extension("paper.PDF"), "application/pdf")
+        self.assertIsNone(mime.from_extension("table.csv"))
+        self.assertIsNone(mime.from_extension("README"))
+        self.assertEqual(mime.detect(self.pdf), "application/pdf")
+        self.assertEqual(self.opened(), 0)
+
+    def test_head(self):
+        mimetype = mime.detect(self.csv, "sha2:x", head=b"a,b\n1,2\n")
+        self.assertEqual(mimetype, "text/plain")
+        self.assertEqual(self.opened(), 0)
+        # without the head, the start of the object is read once
+        mime.detect(self.csv, "sha2:y")
+        self.assertEqual(self.opened(), 1)
+
+    def test_cache(self):
+        self.cache.put(self.csv, "sha2:x", "text/csv")
+        self.assertEqual(mime.detect(self.csv, "sha2:x"), "text/csv")
+        self.assertEqual(self.opened(), 0)
+        # the content changed
+        self.assertIsNone(self.cache.get(self.csv, "sha2:y"))
+        self.assertIsNone(self.cache.get(self.csv, None))
+
+    def test_flush(self):
+        other = mime.Cache(self.path, flush_every=2)
+        self.cache.put(self.csv, "sha2:x", "text/csv")
+        other.put(self.pdf, "sha2:z", "application/pdf")
+        self.assertFalse(os.path.exists(self.path))
+        other.put(self.pdf, "sha2:w", "application/pdf")
+        self.assertTrue(os.path.exists(self.path))
+        # the entries of both processes are kept
+        self.cache.flush()
+        with open(self.path) as f:
+            self.assertEqual(len(json.load(f)), 3)
+        self.assertEqual(
+            mime.Cache(self.path).get(self.csv, "sha2:x"),
+            "text/csv",
+        )
+
+    def test_upload_reads_once(self):
+        with FakeDataverse() as dv:
+            pid = dv.add_dataset()
+            deposit.upload_direct(self.csv, dv.url, pid, {}, {})
+            self.assertEqual(self.opened(), 1)
+            [entry] = dv.files(pid)
+            self.assertEqual(entry["label"], "table.csv")
+        self.cache.flush()
+        self.assertEqual(
+            mime.Cache(self.path).get(self.csv, self.csv.checksum),
+            entry["dataFile"]["contentType"],
+        )
+
+    def test_cache_path(self):
+        # the tests use a cache of their own (see tests/__init__.py)
+        self.assertNotEqual(mime.cache_path(), mime.CACHE_PATH)
+        for value in ("off", "", "OFF "):
+            with mock.patch.dict("os.environ", {"IRODS2DATAVERSE_MIME_CACHE": value}):
+                cache = mime.Cache()
+            self.assertIsNone(cache.path)
+            cache.put(self.csv, "sha2:x", "text/csv")
+            cache.flush()
+            self.assertEqual(cache.get(self.csv, "sha2:x"), "text/csv")
+        with mock.patch.dict("os.environ", {"IRODS2DATAVERSE_MIME_CACHE": self.path}):
+            self.assertEqual(mime.Cache().path, self.path)
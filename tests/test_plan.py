@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from irods2dataverse import plan
+
+
+def objects(*sizes):
+    return [
+        SimpleNamespace(path=f"/zone/home/user/file{i}", size=size)
+        for i, size in enumerate(sizes)
+    ]
+
+
+class TestPlan(unittest.TestCase):
+    def test_limits(self):
+        limits = {"max_file_size": 100, "max_files": 2, "quota": 250, "storage_use": 50}
+        result = plan.make_plan(objects(50, 150, 80, 60, 30), limits)
+        self.assertEqual([x.size for x in result["accepted"]], [50, 80, 60])
+        self.assertEqual([x.size for x, _ in result["rejected"]], [150])
+        self.assertEqual([x.size for x, _ in result["deferred"]], [30])
+        self.assertEqual([len(x) for x in result["batches"]], [2, 1])
+        self.assertEqual(result["bytes"], 190)
+        self.assertIn("left out", plan.format_plan(result))
+
+    def test_existing_dataset(self):
+        # a sync: only the new and modified objects are planned, next to the files that stay
+        limits = {"max_files": 5, "quota": 1000, "storage_use": 900}
+        result = plan.make_plan(objects(40, 30, 20, 10), limits, files_in_dataset=2)
+        self.assertEqual([x.size for x in result["accepted"]], [40, 30, 20])
+        self.assertEqual(
+            result["deferred"][0][1],
+            "exceeds the maximum number of files of the dataset",
+        )
+        self.assertEqual(len(result["batches"]), 1)
+        full = plan.make_plan(objects(10), limits, files_in_dataset=5)
+        self.assertEqual((full["files"], len(full["deferred"])), (0, 1))
+
+    def test_no_limits(self):
+        result = plan.make_plan(objects(10, 20), {})
+        self.assertEqual(len(result["batches"]), 1)
+        self.assertIsNone(result["estimated_seconds"])
+
+    def test_estimate(self):
+        # 0.5 s per file and 1 s per 1000 bytes
+        records = [
+            {"files": f, "bytes": b, "seconds": 0.5 * f + b / 1000}
+            for f, b in [(10, 1000), (1, 5000), (100, 2000)]
+        ]
+        self.assertAlmostEqual(plan.estimate_seconds(4, 3000, records), 5.0)
+        self.assertAlmostEqual(
+            # a single deposit: average throughput (1000 bytes in 6 s)
+            plan.estimate_seconds(2, 100, records[:1]),
+            0.6,
+        )
+
+    def test_history(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "throughput.json")
+            plan.record_throughput("direct", 10, 10000, 20.0, path)
+            history = plan.read_history(path)
+        result = plan.make_plan(objects(1000, 1000), {}, "direct", history)
+        self.assertAlmostEqual(result["estimated_seconds"], 4.0)
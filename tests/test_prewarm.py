@@ -0,0 +1,73 @@
+import time
+import threading
+import unittest
+from unittest import mock
+from irods import keywords as kw
+from irods2dataverse import prewarm
+from tests.stand_ins import FakeSession
+
+
+class TestPrewarm(unittest.TestCase):
+    def setUp(self):
+        self.session = FakeSession()
+        for i in range(12):
+            self.session.add_object(
+                f"/zone/home/user/file{i}",
+                1000,
+                [("dv.publication", "initiated")],
+                has_checksum=i % 4 != 0,
+                resource=f"disk{i % 2}",
+            )
+        # checksums of the objects on a compound resource
+        for i in range(12, 14):
+            obj = self.session.add_object(
+                f"/zone/home/user/file{i}",
+                1000,
+                [("dv.publication", "initiated")],
+                has_checksum=False,
+            )
+            obj.replicas[0].resc_hier = "repl;disk2"
+
+    def test_query_missing(self):
+        missing = prewarm.query_missing("dv.publication", "initiated", self.session)
+        self.assertEqual(
+            missing,
+            {
+                "disk0": [
+                    "/zone/home/user/file0",
+                    "/zone/home/user/file4",
+                    "/zone/home/user/file8",
+                ],
+                "disk2": ["/zone/home/user/file12", "/zone/home/user/file13"],
+            },
+        )
+        objects = sorted(self.session.objects.values(), key=lambda x: x.path)
+        self.assertEqual(prewarm.group_by_resource(objects), missing)
+
+    def test_per_resource(self):
+        active, peak = {}, {}
+        lock = threading.Lock()
+        chksum = self.session.data_objects.chksum
+
+        def slow_chksum(path, **options):
+            resource = options[kw.RESC_NAME_KW]
+            with lock:
+                active[resource] = active.get(resource, 0) + 1
+                peak[resource] = max(peak.get(resource, 0), active[resource])
+            time.sleep(0.05)
+            with lock:
+                active[resource] -= 1
+            return chksum(path, **options)
+
+        missing = {"disk0": [f"/zone/home/user/file{i}" for i in range(0, 12, 2)]}
+        missing["disk1"] = [f"/zone/home/user/file{i}" for i in range(1, 12, 2)]
+        with mock.patch.object(self.session.data_objects, "chksum", slow_chksum):
+            checksums = prewarm.prewarm(missing, self.session, per_resource=2)
+        self.assertEqual(len(checksums), 12)
+        self.assertTrue(all(x.startswith("sha2:") for x in checksums.values()))
+        self.assertEqual(peak, {"disk0": 2, "disk1": 2})
+
+    def test_start(self):
+        objects = list(self.session.objects.values())
+        prewarm.start(objects, self.session).join()
+        self.assertTrue(all(x.has_checksum for x in objects))
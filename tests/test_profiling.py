@@ -0,0 +1,72 @@
+import os
+import json
+import pstats
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from irods2dataverse import metrics, profiling
+
+
+def busy_transfer(seconds=0.2):
+    with metrics.stage("transfer"):
+        blocks = []
+        event = threading.Event()
+        while not event.wait(0.001) and len(blocks) < seconds * 1000:
+            blocks.append(bytearray(10000))
+    return blocks
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def read(self, profiler, name):
+        with open(os.path.join(profiler.path, name)) as f:
+            return f.read()
+
+    def test_sampling(self):
+        with profiling.Profiler(self.directory, interval=0.005) as profiler:
+            # the transfers run in other threads
+            thread = threading.Thread(target=busy_transfer, name="transfer-1")
+            thread.start()
+            thread.join()
+        self.assertFalse(metrics.is_enabled())
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(profiler.path)])
+        folded = self.read(profiler, "cpu.folded")
+        self.assertIn("transfer-1;", folded)
+        self.assertIn("busy_transfer (test_profiling.py", folded)
+        self.assertIn("busy_transfer", self.read(profiler, "cpu.txt"))
+        stages = json.loads(self.read(profiler, "stages.json"))["stages"]
+        self.assertEqual(stages["transfer"]["count"], 1)
+        self.assertGreater(stages["transfer"]["seconds"], 0)
+        self.assertEqual(stages["registration"], {"count": 0, "seconds": 0.0})
+        self.assertIn("transfer", self.read(profiler, "stages.txt"))
+        self.assertIn("test_profiling.py", self.read(profiler, "memory.txt"))
+        self.assertTrue(
+            os.path.exists(os.path.join(profiler.path, "memory.tracemalloc"))
+        )
+
+    def test_cprofile(self):
+        with profiling.Profiler(self.directory, "cprofile", memory=False) as profiler:
+            busy_transfer(0.05)
+        stats = pstats.Stats(os.path.join(profiler.path, "cpu.pstats"))
+        self.assertIn("busy_transfer", {x[2] for x in stats.stats})
+        self.assertFalse(os.path.exists(os.path.join(profiler.path, "memory.txt")))
+        with self.assertRaises(ValueError):
+            profiling.Profiler(self.directory, "perf")
+
+    def test_switch(self):
+        self.assertIsNone(profiling.profile_run().__enter__())
+        with mock.patch.dict(
+            "os.environ",
+            {
+                "IRODS2DATAVERSE_PROFILE": self.directory,
+                "IRODS2DATAVERSE_PROFILE_MEMORY": "0",
+            },
+        ):
+            profiler = profiling.profile_run(cpu="off")
+        self.assertEqual(os.path.dirname(profiler.path), self.directory)
+        self.assertEqual((profiler.cpu, profiler.memory), ("off", False))
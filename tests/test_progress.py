@@ -0,0 +1,111 @@
+import io
+import asyncio
+import unittest
+from unittest import mock
+from irods2dataverse import async_upload, deposit, progress, streams
+from tests.stand_ins import FakeDataverse, FakeSession
+
+
+class TestProgress(unittest.TestCase):
+    def setUp(self):
+        self.tracker = progress.Tracker(interval=0)
+        self.events = []
+        self.tracker.subscribe(self.events.append)
+        patcher = mock.patch.object(progress, "tracker", self.tracker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def kinds(self):
+        return [x["kind"] for x in self.events]
+
+    def test_events(self):
+        self.tracker.expect(2, 300)
+        with self.tracker.track("/zone/a", 100) as transfer:
+            transfer.add(40)
+            transfer.add(60)
+        with self.assertRaises(ValueError):
+            with self.tracker.track("/zone/b", 200) as transfer:
+                transfer.add(50)
+                raise ValueError()
+        self.tracker.close()
+        self.assertEqual(
+            self.kinds(),
+            ["start", "progress", "progress", "done"]
+            + ["start", "progress", "failed", "end"],
+        )
+        self.assertEqual(self.events[2]["done"], 100)
+        self.assertEqual(self.events[2]["eta"], 0)
+        # the rest of the failed transfer is no longer expected
+        last = self.events[-1]
+        self.assertEqual((last["files_done"], last["files"]), (2, 2))
+        self.assertEqual((last["total_done"], last["total"]), (150, 150))
+        self.assertEqual(last["total_eta"], 0)
+
+    def test_reset(self):
+        self.tracker.expect(1, 100)
+        with self.tracker.track("/zone/a", 100) as transfer:
+            transfer.add(100)
+        self.tracker.reset()
+        self.tracker.expect(1, 50)
+        run = self.tracker.snapshot()
+        self.assertEqual((run["files_done"], run["files"]), (0, 1))
+        self.assertEqual((run["total_done"], run["total"]), (0, 50))
+        self.assertIsNone(run["total_rate"])
+        # the subscribers follow the next run
+        with self.tracker.track("/zone/b", 50) as transfer:
+            transfer.add(50)
+        self.assertEqual(self.events[-1]["total_done"], 50)
+
+    def test_estimates(self):
+        self.assertIsNone(progress.estimate(100, None))
+        self.assertEqual(progress.estimate(100, 50), 2)
+        self.assertEqual(progress.format_eta(3725.2), "1:02:05")
+        self.assertEqual(progress.format_rate(12_300_000), "12.30 MB/s")
+        tracker = progress.Tracker(window=10)
+        self.assertIsNone(tracker.rate())
+        transfer = tracker.start("/zone/a", 1000)
+        transfer.add(100)
+        self.assertGreater(tracker.rate(), 0)
+        # outside the window, only the recent bytes count
+        self.assertEqual(tracker.rate(transfer.started + 100), 0)
+
+    def test_reader(self):
+        data = b"x" * 1000
+        transfer = self.tracker.start("/zone/a", len(data))
+        with streams.ReadAheadReader(io.BytesIO(data), 1000, 300, transfer.add) as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(transfer.done, 1000)
+        self.assertEqual(self.kinds(), ["start"] + ["progress"] * 4)
+
+    def test_iterator(self):
+        async def consume():
+            received = []
+            async for event in self.tracker.events():
+                received.append(event["kind"])
+            return received
+
+        async def run():
+            task = asyncio.ensure_future(consume())
+            await asyncio.sleep(0)
+            loop = asyncio.get_running_loop()
+            # published from another thread, like the transfers
+            await loop.run_in_executor(None, self.upload)
+            return await task
+
+        self.assertEqual(asyncio.run(run()), ["start", "progress", "done", "end"])
+
+    def upload(self):
+        with self.tracker.track("/zone/a", 10) as transfer:
+            transfer.add(10)
+        self.tracker.close()
+
+    def test_uploads(self):
+        session = FakeSession()
+        items = [session.add_object(f"/zone/home/user/file{i}", 1000) for i in range(2)]
+        with FakeDataverse() as dv:
+            pid = dv.add_dataset()
+            deposit.upload_direct(items[0], dv.url, pid, {}, {})
+            async_upload.run_uploads(items[1:], dv.url, pid, {}, {})
+        done = {x["name"]: x["done"] for x in self.events if x["kind"] == "done"}
+        self.assertEqual(done, {x.path: 1000 for x in items})
+        self.assertEqual(self.events[-1]["total_done"], 2000)
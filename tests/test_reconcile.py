@@ -0,0 +1,125 @@
+import unittest
+from irods2dataverse import from_irods, reconcile, to_dataverse
+from irods2dataverse.session_pool import SessionPool
+from tests.stand_ins import FakeDataverse, FakeSession
+
+
+def deposited(session, path, doi, installation="Demo"):
+    return session.add_object(
+        path,
+        avus=[
+            ("dv.publication", "deposited"),
+            ("dv.ds.DOI", doi),
+            ("dv.installation", installation),
+            ("dv.publication.timestamp", "2024-01-01 00:00:00"),
+        ],
+    )
+
+
+class TestReconcile(unittest.TestCase):
+    def test_normalize_doi(self):
+        for doi in (
+            "doi:10.5072/FK2/ABC",
+            "https://doi.org/10.5072/fk2/abc",
+            " DOI:10.5072/Fk2/Abc ",
+        ):
+            self.assertEqual(reconcile.normalize_doi(doi), "doi:10.5072/FK2/ABC")
+        self.assertEqual(reconcile.normalize_doi("hdl:1902.1/111"), "hdl:1902.1/111")
+
+    def test_group_by_doi(self):
+        dmd = {
+            "/zone/a": {"dv.installation": ["Demo"], "dv.ds.DOI": ["doi:10.1/X"]},
+            "/zone/b": {
+                "dv.installation": ["Demo"],
+                "dv.ds.DOI": ["https://doi.org/10.1/x"],
+            },
+            "/zone/c": {
+                "dv.installation": ["Demo", "RDR"],
+                "dv.ds.DOI": ["doi:10.1/X"],
+            },
+            "/zone/d": {"dv.installation": ["RDR"]},
+        }
+        self.assertEqual(
+            reconcile.group_by_doi(dmd),
+            {"Demo": {"doi:10.1/X": ["/zone/a", "/zone/b"]}},
+        )
+
+    def test_query_md(self):
+        session = FakeSession()
+        deposited(session, "/zone/home/user/a.txt", "doi:10.1/X")
+        session.add_object(
+            "/zone/home/user/b.txt", avus=[("dv.publication", "initiated")]
+        )
+        dmd = from_irods.query_md(
+            "dv.publication", "deposited", ["dv.ds.DOI", "dv.installation"], session
+        )
+        self.assertEqual(
+            dmd,
+            {
+                "/zone/home/user/a.txt": {
+                    "dv.publication": ["deposited"],
+                    "dv.ds.DOI": ["doi:10.1/X"],
+                    "dv.installation": ["Demo"],
+                }
+            },
+        )
+
+    def test_save_md_batch(self):
+        session = FakeSession()
+        obj = deposited(session, "/zone/home/user/a.txt", "doi:10.1/X")
+        self.assertTrue(
+            from_irods.save_md_batch(
+                obj.path,
+                [("dv.publication", "deposited")],
+                [("dv.publication", "published")],
+                session,
+            )
+        )
+        self.assertEqual(obj.metadata.get_one("dv.publication").value, "published")
+        self.assertFalse(
+            from_irods.save_md_batch(
+                "/zone/home/user/missing.txt", [], [("a", "b")], session
+            )
+        )
+
+    def test_get_published(self):
+        with FakeDataverse() as dv:
+            draft = dv.add_dataset()
+            released = dv.add_dataset()
+            dv.datasets[released]["published"] = True
+            published = to_dataverse.get_published(
+                dv.url, [draft, released, "doi:10.1/UNKNOWN"], per_request=2
+            )
+            self.assertEqual(dv.requests["search"], 2)
+        self.assertEqual(list(published), [released])
+
+    def test_reconcile(self):
+        session = FakeSession()
+        with FakeDataverse() as dv:
+            released = dv.add_dataset()
+            draft = dv.add_dataset()
+            dv.datasets[released]["published"] = True
+            # the DOI as written by a user
+            url = "https://doi.org/" + released[len("doi:") :].lower()
+            a = deposited(session, "/zone/home/user/a.txt", url)
+            b = deposited(session, "/zone/home/user/b.txt", draft)
+            c = deposited(session, "/zone/home/user/c.txt", "doi:10.1/OTHER", "RDR")
+            pool = SessionPool(size=2, factory=lambda: session, check=lambda x: None)
+            published = reconcile.reconcile(pool, {"Demo": dv.url})
+        self.assertEqual(published, {released: [a.path]})
+        self.assertEqual(a.metadata.get_one("dv.publication").value, "published")
+        for obj in (b, c):
+            self.assertEqual(obj.metadata.get_one("dv.publication").value, "deposited")
+
+    def test_unreachable_installation(self):
+        session = FakeSession()
+        with FakeDataverse() as dv:
+            released = dv.add_dataset()
+            dv.datasets[released]["published"] = True
+            a = deposited(session, "/zone/home/user/a.txt", released)
+            b = deposited(session, "/zone/home/user/b.txt", "doi:10.1/OTHER", "RDR")
+            # nothing listens on this port
+            base_urls = {"Demo": dv.url, "RDR": "http://127.0.0.1:9"}
+            published = reconcile.reconcile(session, base_urls)
+        self.assertEqual(published, {released: [a.path]})
+        self.assertEqual(b.metadata.get_one("dv.publication").value, "deposited")
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from contextlib import ExitStack
+from irods2dataverse.redirect import Redirector
+from tests.stand_ins import FakeSession
+
+
+class TestRedirect(unittest.TestCase):
+    def setUp(self):
+        self.session = FakeSession()
+        self.objects = [
+            self.session.add_object(f"/zone/home/user/file{i}", 1000, resource=resc)
+            for i, resc in enumerate(["disk0", "disk0", "disk0", "disk1"])
+        ]
+
+    def test_limit_per_resource(self):
+        redirector = Redirector(max_per_resource=2, min_size=0)
+        with ExitStack() as stack:
+            for obj in self.objects:
+                f = stack.enter_context(redirector.open(obj))
+                self.assertEqual(len(f.read()), 1000)
+        # the third object of disk0 is read via the provider
+        self.assertEqual(self.session.redirected, 3)
+        self.assertEqual(redirector.stats()["proxied"], 1)
+        # the connections are given back
+        with redirector.open(self.objects[2]):
+            pass
+        self.assertEqual(self.session.redirected, 4)
+
+    def test_small_reads(self):
+        redirector = Redirector(min_size=2000)
+        with redirector.open(self.objects[0]) as f:
+            f.read()
+        self.assertEqual(self.session.redirected, 0)
+
+    def test_refused(self):
+        self.session.unreachable.add("disk0")
+        redirector = Redirector(min_size=0)
+        for obj in self.objects:
+            with redirector.open(obj) as f:
+                self.assertEqual(len(f.read()), 1000)
+        stats = redirector.stats()
+        # disk0 is only tried once
+        self.assertEqual((stats["refused"], stats["proxied"]), (1, 3))
+        self.assertEqual(stats["refused_resources"], ["disk0"])
+        self.assertEqual(stats["redirected"], 1)
+
+    def test_download(self):
+        redirector = Redirector(min_size=0)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "file0")
+            redirector.download(self.session, self.objects[0], path)
+            self.assertEqual(os.path.getsize(path), 1000)
+        self.assertEqual(self.session.redirected, 1)
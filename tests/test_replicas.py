@@ -0,0 +1,53 @@
+import unittest
+from types import SimpleNamespace
+from irods2dataverse.redirect import Redirector
+from irods2dataverse.replicas import Ranker
+from tests.stand_ins import FakeSession
+
+
+def replica(number, resource, status="1"):
+    return SimpleNamespace(
+        number=number,
+        status=status,
+        resource_name=resource,
+        path=f"/vault/{resource}/file",
+        resc_hier=f"root;{resource}",
+    )
+
+
+class TestReplicas(unittest.TestCase):
+    def test_preference(self):
+        ranker = Ranker(["disk", "archive"])
+        replicas = [replica(0, "archive"), replica(1, "remote"), replica(2, "disk")]
+        ranked = [x.resource_name for x in ranker.rank(replicas)]
+        self.assertEqual(ranked, ["disk", "archive", "remote"])
+
+    def test_stale(self):
+        ranker = Ranker(["disk"])
+        replicas = [replica(0, "archive"), replica(1, "disk", status="0")]
+        self.assertEqual(ranker.choose(replicas).resource_name, "archive")
+        self.assertIsNone(ranker.choose([replica(0, "disk", status="2")]))
+
+    def test_throughput(self):
+        ranker = Ranker([])
+        replicas = [replica(0, "slow"), replica(1, "fast"), replica(2, "new")]
+        ranker.record("slow", 100, 10.0)
+        ranker.record("fast", 1000, 1.0)
+        ranked = [x.resource_name for x in ranker.rank(replicas)]
+        # resources without measurement are tried before the slower ones
+        self.assertEqual(ranked, ["fast", "new", "slow"])
+        ranker.record("fast", 10, 1.0)
+        self.assertAlmostEqual(ranker.throughput("fast"), 0.3 * 10 + 0.7 * 1000)
+
+    def test_open_chosen_replica(self):
+        session = FakeSession()
+        obj = session.add_object("/zone/home/user/file", 1000, resource="archive")
+        obj.replicas.append(replica(1, "disk"))
+        redirector = Redirector(min_size=0, ranker=Ranker(["disk"]))
+        with redirector.open(obj) as f:
+            self.assertEqual(len(f.read()), 1000)
+        obj.replicas[1].status = "0"
+        with redirector.open(obj) as f:
+            f.read()
+        self.assertEqual(session.read_from, {"disk": 1, "archive": 1})
+        self.assertIsNotNone(redirector.ranker.throughput("disk"))
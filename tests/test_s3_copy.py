@@ -0,0 +1,73 @@
+import unittest
+import requests
+from unittest import mock
+from urllib.parse import urlsplit
+from irods2dataverse import deposit, s3_copy
+from tests.stand_ins import FakeDataverse, FakeSession
+
+
+class TestS3Copy(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(s3_copy, "refused", set())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_session(self, endpoint):
+        session = FakeSession()
+        session.resources["s3Resc"] = {
+            "type": "s3",
+            "context": f"S3_DEFAULT_HOSTNAME={endpoint};S3_PROTO=HTTP",
+        }
+        for i, resource in enumerate(["s3Resc", "demoResc"]):
+            obj = session.add_object(
+                f"/zone/home/user/file{i}", 3000, resource=resource
+            )
+            obj.replicas[0].path = f"/irods-bucket/vault/file{i}"
+        return session
+
+    def test_find_sources(self):
+        session = self.make_session("s3.example.org,s3b.example.org")
+        sources = s3_copy.find_sources(session.objects.values(), session)
+        self.assertEqual(list(sources), ["/zone/home/user/file0"])
+        source = sources["/zone/home/user/file0"]
+        self.assertEqual(
+            (source["bucket"], source["key"]), ("irods-bucket", "vault/file0")
+        )
+        self.assertTrue(
+            s3_copy.same_endpoint(source, "https://s3b.example.org/b/k?x=1")
+        )
+        self.assertTrue(s3_copy.same_endpoint(source, "https://b.s3.example.org/k"))
+        self.assertFalse(s3_copy.same_endpoint(source, "https://other.org/b/k"))
+
+    def transfer(self, part_size=None, server_copy=True, times=1):
+        with FakeDataverse(part_size=part_size, server_copy=server_copy) as dv:
+            session = self.make_session(urlsplit(dv.url).netloc)
+            obj = session.objects["/zone/home/user/file0"]
+            dv.add_s3_object("irods-bucket", "vault/file0", obj.size)
+            sources = s3_copy.find_sources([obj], session)
+            for _ in range(times):
+                pid = dv.add_dataset()
+                storageID, _ = deposit.upload_direct(
+                    obj, dv.url, pid, {}, {}, source=sources[obj.path]
+                )
+                [entry] = dv.files(pid)
+                self.assertEqual(entry["dataFile"]["filesize"], obj.size)
+            return dv.bytes_copied, dv.bytes_received
+
+    def test_copy(self):
+        self.assertEqual(self.transfer(), (3000, 0))
+
+    def test_copy_parts(self):
+        self.assertEqual(self.transfer(part_size=1000), (3000, 0))
+
+    def test_fallback(self):
+        self.assertEqual(self.transfer(part_size=1000, server_copy=False), (0, 3000))
+
+    def test_refusal_is_remembered(self):
+        with mock.patch("requests.put", wraps=requests.put) as put:
+            self.assertEqual(self.transfer(server_copy=False, times=2), (0, 6000))
+        copies = [
+            x for x in put.call_args_list if "x-amz-copy-source" in x.kwargs["headers"]
+        ]
+        self.assertEqual(len(copies), 1)
+        self.assertEqual(len(s3_copy.refused), 1)
@@ -0,0 +1,98 @@
+import time
+import unittest
+from types import SimpleNamespace
+from irods2dataverse import deposit, schedule
+from tests.benchmark import run_scenario
+from tests.stand_ins import FakeDataverse, FakeSession
+
+MiB = 1024 * 1024
+
+
+def objects(*sizes):
+    return [
+        SimpleNamespace(path=f"/zone/home/user/file{i}", size=size, checksum="sha2:x")
+        for i, size in enumerate(sizes)
+    ]
+
+
+class TestSchedule(unittest.TestCase):
+    def test_policies(self):
+        items = objects(MiB, 100 * MiB, 0, 10 * MiB)
+        fifo = schedule.make_jobs(items, "fifo")
+        self.assertEqual([x[0].size for x in fifo], [MiB, 100 * MiB, 0, 10 * MiB])
+        largest = schedule.make_jobs(items, "largest-first")
+        self.assertEqual([x[0].size for x in largest], [100 * MiB, 10 * MiB, MiB, 0])
+        with self.assertRaises(ValueError):
+            schedule.make_jobs(items, "random")
+
+    def test_lpt_batches(self):
+        # 2 large files, then 30 small ones in batches costing about as much as 10 MiB
+        items = objects(*[MiB] * 30, 10 * MiB, 20 * MiB)
+        jobs = schedule.make_jobs(items, "lpt")
+        self.assertEqual([len(x) for x in jobs[:2]], [1, 1])
+        self.assertEqual(jobs[0][0].size, 20 * MiB)
+        self.assertEqual(sum(len(x) for x in jobs), 32)
+        for job in jobs[2:]:
+            self.assertLessEqual(
+                sum(map(schedule.cost, job)), schedule.cost(jobs[1][0])
+            )
+
+    def test_assign(self):
+        jobs = [[x] for x in objects(0, 0, 0, 0)]
+        queues, makespan = schedule.assign(jobs, 2)
+        self.assertEqual([len(x) for x in queues], [2, 2])
+        self.assertEqual(makespan, 2 * schedule.PER_FILE_COST)
+
+    def test_run_jobs(self):
+        def process(job):
+            if any(x.size == 1 for x in job):
+                raise ValueError("failed")
+            return {x.path: "ok" for x in job}
+
+        items = objects(0, 1, 2)
+        results = schedule.run_jobs([items[:2], items[2:]], process, workers=2)
+        self.assertIsInstance(results[items[0].path], ValueError)
+        self.assertIsInstance(results[items[1].path], ValueError)
+        self.assertEqual(results[items[2].path], "ok")
+
+    def test_waves(self):
+        items = objects(1, 2, 3, 100)
+
+        def arrive():
+            yield from items[:3]
+            # e.g. the recall of an archived object
+            time.sleep(0.5)
+            yield items[3]
+
+        waves = schedule.waves(arrive(), "largest-first")
+        self.assertEqual([x[0].size for x in waves], [3, 2, 1, 100])
+        results = schedule.run_jobs(
+            schedule.waves(arrive(), "fifo"),
+            lambda job: {x.path: "ok" for x in job},
+            workers=2,
+        )
+        self.assertEqual(len(results), 4)
+
+    def test_scheduled_engine(self):
+        result = run_scenario(
+            20, 1000, verify=True, engine="scheduled", workers=3, large=100000
+        )
+        self.assertEqual(result["failures"], 0)
+        self.assertEqual(result["stored"], 20)
+        self.assertIn("policy=lpt", result["name"])
+
+    def test_upload_scheduled(self):
+        session = FakeSession()
+        items = [
+            session.add_object(f"/zone/home/user/file{i}", size)
+            for i, size in enumerate([1000] * 5 + [50000])
+        ]
+        with FakeDataverse() as dv:
+            pid = dv.add_dataset()
+            storageIDs = deposit.upload_direct_scheduled(
+                items, dv.url, pid, {}, {}, policy="largest-first", workers=3
+            )
+            self.assertEqual(sorted(storageIDs), sorted(x.path for x in items))
+            self.assertEqual(len(dv.files(pid)), 6)
+            # one addFiles request per job
+            self.assertEqual(dv.requests["add_files"], 6)
@@ -0,0 +1,128 @@
+import copy
+import threading
+import unittest
+from irods.exception import NetworkException
+from pyDataverse.api import NativeApi
+from irods2dataverse import deposit, from_irods
+from irods2dataverse.session_pool import SessionPool
+from tests.stand_ins import FakeDataverse, FakeSession
+
+
+class Connection:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+
+    def cleanup(self):
+        self.closed = True
+
+
+def check(session):
+    if not session.alive:
+        raise NetworkException("connection reset")
+
+
+class TestSessionPool(unittest.TestCase):
+    def test_reuse_and_bound(self):
+        pool = SessionPool(size=2, factory=Connection, check=check)
+        a = pool.checkout()
+        b = pool.checkout()
+        self.assertIsNot(a, b)
+        with self.assertRaises(TimeoutError):
+            pool.checkout(timeout=0.01)
+        pool.checkin(a)
+        self.assertIs(pool.checkout(), a)
+        self.assertEqual(pool.stats()["created"], 2)
+
+    def test_health_check_reconnects(self):
+        pool = SessionPool(size=1, check_after=0, factory=Connection, check=check)
+        with pool.session() as session:
+            session.alive = False
+        with pool.session() as new:
+            self.assertIsNot(new, session)
+        self.assertTrue(session.closed)
+        self.assertEqual(pool.stats()["reconnects"], 1)
+
+    def test_idle_eviction(self):
+        pool = SessionPool(size=2, max_idle=0, factory=Connection, check=check)
+        with pool.session() as session:
+            pass
+        with pool.session() as new:
+            self.assertIsNot(new, session)
+        self.assertTrue(session.closed)
+
+    def test_run_retries_broken_connection(self):
+        pool = SessionPool(size=1, factory=Connection, check=check)
+        used = []
+
+        def operation(session):
+            used.append(session)
+            if len(used) == 1:
+                raise NetworkException("agent timed out")
+            return "done"
+
+        self.assertEqual(pool.run(operation), "done")
+        self.assertTrue(used[0].closed)
+        self.assertIsNot(used[0], used[1])
+
+    def test_from_irods_with_pool(self):
+        catalog = FakeSession()
+        for i in range(20):
+            catalog.add_object(
+                f"/zone/home/user/file{i}.txt", avus=[("dv.publication", "deposited")]
+            )
+        pool = SessionPool(size=4, factory=lambda: copy.copy(catalog), check=check)
+        dmd = from_irods.query_md("dv.publication", "deposited", [], pool)
+        self.assertEqual(len(dmd), 20)
+        threads = [
+            threading.Thread(
+                target=from_irods.save_md_batch,
+                args=(path, [], [("dv.ds.DOI", "doi:10/x")], pool),
+            )
+            for path in dmd
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        dmd = from_irods.query_md("dv.publication", "deposited", ["dv.ds.DOI"], pool)
+        self.assertTrue(all(x["dv.ds.DOI"] == ["doi:10/x"] for x in dmd.values()))
+        self.assertLessEqual(pool.stats()["created"], 4)
+
+    def test_objects_with_pool(self):
+        catalog = FakeSession()
+        objs = [
+            catalog.add_object(
+                f"/zone/home/user/file{i}.txt", avus=[("dv.publication", "initiated")]
+            )
+            for i in range(4)
+        ]
+        pool = SessionPool(size=2, factory=lambda: copy.copy(catalog), check=check)
+        # the objects would be bound to a session given back to the pool
+        with self.assertRaises(TypeError):
+            from_irods.query_data("dv.publication", "initiated", pool)
+        paths = from_irods.query_paths("dv.publication", "initiated", pool)
+        self.assertEqual(paths, [x.path for x in objs])
+        with from_irods.bound(objs[0], pool) as obj:
+            self.assertEqual(obj.path, objs[0].path)
+            # the session is checked out for the block
+            self.assertEqual(pool.stats()["idle"], 0)
+        self.assertEqual(pool.stats()["idle"], 1)
+        with FakeDataverse() as dv:
+            pid = dv.add_dataset()
+            deposited = deposit.upload_objects(
+                objs,
+                "direct-batch",
+                NativeApi(dv.url),
+                pid,
+                {},
+                {},
+                session=pool,
+                policy="lpt",
+                workers=2,
+            )
+            self.assertEqual(len(dv.files(pid)), 4)
+        self.assertEqual(sorted(x.path for x in deposited), paths)
+        for obj in objs:
+            self.assertEqual(obj.metadata.get_one("dv.publication").value, "deposited")
+        self.assertLessEqual(pool.stats()["created"], 2)
@@ -0,0 +1,86 @@
+import time
+import threading
+import unittest
+from unittest import mock
+from irods2dataverse import replicas, staging
+from tests.stand_ins import FakeSession
+
+
+def on_tape(session, path, size=1024):
+    obj = session.add_object(path, size, resource="tape")
+    obj.replicas[0].resc_hier = "comp;tape"
+    return obj
+
+
+class TestStaging(unittest.TestCase):
+    def setUp(self):
+        self.session = FakeSession()
+        self.session.resources["tape"] = {"type": "univmss"}
+        self.online = [
+            self.session.add_object(f"/zone/home/user/disk{i}") for i in range(3)
+        ]
+        self.offline = [
+            on_tape(self.session, f"/zone/home/user/tape{i}") for i in range(6)
+        ]
+        self.objects = self.offline[:3] + self.online + self.offline[3:]
+
+    def tearDown(self):
+        replicas.ranker._slow.clear()
+
+    def test_archive_resources(self):
+        self.assertEqual(
+            staging.archive_resources(self.objects, self.session), {"tape"}
+        )
+        with mock.patch.dict(
+            "os.environ", {"IRODS2DATAVERSE_ARCHIVE_RESOURCES": "demoResc, other"}
+        ):
+            self.assertEqual(
+                staging.archive_resources(self.objects, self.session),
+                {"tape", "demoResc"},
+            )
+
+    def test_online_first(self):
+        self.session.stage_seconds = 0.05
+        staged = list(staging.stage(self.objects, self.session))
+        self.assertEqual(staged[:3], self.online)
+        self.assertCountEqual(staged, self.objects)
+        for obj in self.offline:
+            self.assertTrue(staging.is_online(obj, {"tape"}))
+            self.assertEqual(obj.replicas[-1].resc_hier, "comp")
+        # the staged replica is read, not the one on tape
+        self.assertEqual(
+            replicas.ranker.choose(self.offline[0].replicas).resc_hier, "comp"
+        )
+
+    def test_recalls_per_archive(self):
+        self.session.stage_seconds = 0.05
+        active, peak = [0], [0]
+        lock = threading.Lock()
+        replicate = self.session.data_objects.replicate
+
+        def counted(path, **options):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            try:
+                replicate(path, **options)
+            finally:
+                with lock:
+                    active[0] -= 1
+
+        start = time.perf_counter()
+        with mock.patch.object(self.session.data_objects, "replicate", counted):
+            staged = list(staging.stage(self.objects, self.session, per_archive=3))
+        self.assertEqual(len(staged), len(self.objects))
+        self.assertEqual(peak[0], 3)
+        # 6 recalls, 3 at a time
+        self.assertLess(time.perf_counter() - start, 6 * 0.05)
+
+    def test_cannot_stage(self):
+        obj = self.session.add_object("/zone/home/user/flat", resource="tape")
+        with mock.patch("builtins.print") as printed:
+            staged = list(staging.stage([obj], self.session))
+        self.assertEqual(staged, [obj])
+        self.assertIn("could not be staged", printed.call_args[0][0])
+        staged = list(staging.stage([obj], self.session, stage_to="demoResc"))
+        self.assertTrue(staging.is_online(obj, {"tape"}))
@@ -0,0 +1,72 @@
+import io
+import unittest
+from irods2dataverse import streams
+from irods2dataverse.streams import ReadAheadReader
+
+
+class CountingStream(io.BytesIO):
+    """Source stream that counts the reads, as round trips to iRODS."""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = 0
+
+    def readinto(self, b):
+        self.reads += 1
+        return super().readinto(b)
+
+
+class TestReadAheadReader(unittest.TestCase):
+    def setUp(self):
+        self.data = bytes(range(256)) * 1000
+
+    def test_small_reads(self):
+        source = CountingStream(self.data)
+        with ReadAheadReader(source, len(self.data), block_size=64 * 1024) as reader:
+            self.assertEqual(len(reader), len(self.data))
+            chunks = iter(lambda: reader.read(8192), b"")
+            self.assertEqual(b"".join(chunks), self.data)
+            self.assertEqual(reader.tell(), len(self.data))
+        # 256000 bytes in blocks of 64 KiB, without an extra read at the end
+        self.assertEqual(source.reads, 4)
+
+    def test_unknown_size(self):
+        with ReadAheadReader(io.BytesIO(self.data), block_size=1000) as reader:
+            self.assertEqual(reader.read(), self.data)
+            self.assertEqual(reader.read(10), b"")
+
+    def test_readinto_and_iter(self):
+        with ReadAheadReader(io.BytesIO(self.data), len(self.data), 10000) as reader:
+            b = bytearray(100)
+            self.assertEqual(reader.readinto(b), 100)
+            self.assertEqual(bytes(b), self.data[:100])
+            rest = b"".join(reader)
+        self.assertEqual(rest, self.data[100:])
+
+    def test_error(self):
+        class Failing(io.RawIOBase):
+            def readinto(self, b):
+                raise ConnectionError("lost")
+
+        with ReadAheadReader(Failing(), 10) as reader:
+            with self.assertRaises(ConnectionError):
+                reader.read(5)
+
+    def test_close_early(self):
+        reader = ReadAheadReader(io.BytesIO(self.data), len(self.data), 1000)
+        reader.read(10)
+        reader.close()
+        self.assertTrue(reader.closed)
+
+    def test_pool_bounded(self):
+        # many small objects of different sizes share a few sizes of buffers
+        for size in range(100_000, 102_000):
+            with ReadAheadReader(io.BytesIO(self.data[:size]), size) as reader:
+                self.assertEqual(len(reader.read()), size)
+        self.assertLessEqual(len(streams._pool), 2)
+        self.assertLessEqual(streams._pooled, streams.MAX_POOLED)
+        self.assertEqual(
+            streams._pooled, sum(len(x) for v in streams._pool.values() for x in v)
+        )
+        self.assertEqual(streams.buffer_size(100_000), 128 * 1024)
+        self.assertEqual(streams.buffer_size(1), streams.MIN_BUFFER_SIZE)
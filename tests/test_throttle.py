@@ -0,0 +1,92 @@
+import os
+import time
+import tempfile
+import threading
+import unittest
+from irods2dataverse import throttle
+from irods2dataverse.redirect import Redirector
+from tests.stand_ins import FakeSession
+
+KB = 1024
+
+
+class TestThrottle(unittest.TestCase):
+    def setUp(self):
+        self.session = FakeSession()
+        self.objects = [
+            self.session.add_object(f"/zone/home/user/file{i}", 100 * KB, resource=resc)
+            for i, resc in enumerate(["disk0", "disk0", "disk1"])
+        ]
+
+    def read_all(self, redirector, objects, installation=None):
+        def read(obj):
+            with redirector.open(obj, installation=installation) as f:
+                self.assertEqual(len(f.read()), obj.size)
+
+        threads = [threading.Thread(target=read, args=(x,)) for x in objects]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start
+
+    def test_parse(self):
+        self.assertEqual(throttle.parse_rate("50M"), 50 * 1024**2)
+        self.assertEqual(throttle.parse_rate("500 KiB/s"), 500 * KB)
+        self.assertIsNone(throttle.parse_rate("0"))
+        self.assertEqual(
+            throttle.parse_rates("disk0=1G, disk1="),
+            {"disk0": 1024**3, "disk1": None},
+        )
+        with self.assertRaises(ValueError):
+            throttle.parse_rate("fast")
+
+    def test_resource_budget(self):
+        limiter = throttle.Limiter(resources={"disk0": 1000 * KB})
+        redirector = Redirector(min_size=0, limiter=limiter)
+        # the 200 KB of disk0 share 1000 KB/s, disk1 is not limited
+        elapsed = self.read_all(redirector, self.objects)
+        self.assertGreater(elapsed, 0.18)
+        self.assertLess(elapsed, 0.5)
+        report = limiter.report()
+        self.assertEqual(report[("resource", "disk0")]["allowed"], 1000 * KB)
+        self.assertLess(report[("resource", "disk0")]["achieved"], 1100 * KB)
+        self.assertIn(("resource", "disk1"), report)
+        # the time spent waiting is not held against the resource
+        self.assertGreater(redirector.ranker.throughput("disk0"), 1000 * KB)
+
+    def test_total_and_installation(self):
+        limiter = throttle.Limiter(
+            total=2000 * KB, installations={"https://demo.dataverse.org": 1000 * KB}
+        )
+        redirector = Redirector(min_size=0, limiter=limiter)
+        # 200 KB at 1000 KB/s
+        elapsed = self.read_all(
+            redirector, self.objects[:2], "https://demo.dataverse.org/"
+        )
+        self.assertGreater(elapsed, 0.18)
+        self.assertIn(("installation", "demo.dataverse.org"), limiter.report())
+        # 300 KB at 2000 KB/s
+        redirector.limiter = throttle.Limiter(total=2000 * KB)
+        elapsed = self.read_all(redirector, self.objects, "https://other.org")
+        self.assertGreater(elapsed, 0.13)
+
+    def test_change_at_runtime(self):
+        limiter = throttle.Limiter(total=100 * KB)
+        redirector = Redirector(min_size=0, limiter=limiter)
+        limiter.set_rate("total", rate=None)
+        self.assertLess(self.read_all(redirector, self.objects), 0.1)
+        self.assertIsNone(limiter.report()[("total", None)]["allowed"])
+        with self.assertRaises(ValueError):
+            limiter.set_rate("zone", rate=1)
+
+    def test_download(self):
+        limiter = throttle.Limiter(resources={"disk0": 1000 * KB})
+        redirector = Redirector(min_size=0, limiter=limiter)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "file0")
+            start = time.perf_counter()
+            redirector.download(self.session, self.objects[0], path)
+            self.assertGreater(time.perf_counter() - start, 0.09)
+            self.assertEqual(os.path.getsize(path), 100 * KB)
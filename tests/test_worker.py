@@ -0,0 +1,306 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from pyDataverse.api import NativeApi
+from irods2dataverse import avu2json, capabilities, deposit, worker
+from irods2dataverse.customClass import DemoDataset
+from irods2dataverse.session_pool import SessionPool
+from irods2dataverse.worker import Lease
+from tests.benchmark import metadata, resources
+from tests.stand_ins import FakeDataverse, FakeSession
+
+
+class TestLease(unittest.TestCase):
+    def setUp(self):
+        self.session = FakeSession()
+        self.obj = self.session.add_object("/zone/home/user/a.txt")
+
+    def test_exclusive(self):
+        a = Lease(self.obj, "a")
+        b = Lease(self.obj, "b")
+        self.assertTrue(a.acquire())
+        self.assertFalse(b.acquire())
+        a.release()
+        self.assertTrue(b.acquire())
+
+    def test_simultaneous_claims(self):
+        # both leases are added before either worker checks: the first one added wins
+        b = Lease(self.obj, "b")
+        a = Lease(self.obj, "a")
+        b._replace([], 2e9)
+        a._replace([], 2e9)
+        self.assertEqual(b.holder(), b.value)
+        self.assertEqual(a.holder(), b.value)
+
+    def test_lost_lease(self):
+        a = Lease(self.obj, "a", ttl=0.06)
+        self.assertTrue(a.acquire())
+        a.keep()
+        # a worker that took a over
+        self.obj.metadata.set(worker.atr_lease, "b@2000000000")
+        self.assertTrue(a.lost.wait(1))
+        a.release()
+        self.assertEqual(
+            [x.value for x in self.obj.metadata.get_all(worker.atr_lease)],
+            ["b@2000000000"],
+        )
+
+    def test_expired_lease_is_reclaimed(self):
+        dead = Lease(self.obj, "dead", ttl=-1)
+        dead._replace([], 0)
+        b = Lease(self.obj, "b")
+        self.assertTrue(b.acquire())
+        self.assertEqual(len(self.obj.metadata.get_all(worker.atr_lease)), 1)
+        self.assertTrue(b.renew())
+
+
+class TestWork(unittest.TestCase):
+    def test_each_group_processed_once(self):
+        session = FakeSession()
+        for i in range(12):
+            for j in range(3):
+                session.add_object(
+                    f"/zone/home/user/ds{i}/file{j}.txt",
+                    avus=[("dv.publication", "initiated")],
+                )
+        processed = []
+        lock = threading.Lock()
+
+        def process(path, objs, lease):
+            with lock:
+                processed.append(path)
+            for obj in objs:
+                obj.metadata.set("dv.publication", "deposited")
+
+        threads = [
+            threading.Thread(target=worker.work, args=(session, process, f"w{i}"))
+            for i in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(processed), sorted(set(processed)))
+        self.assertEqual(len(processed), 12)
+        for obj in session.objects.values():
+            self.assertEqual(obj.metadata.get_all(worker.atr_lease), [])
+
+    def test_interrupted_deposits(self):
+        session = FakeSession()
+        for i, status in enumerate(["processed", "processed", "deposited"]):
+            session.add_object(
+                f"/zone/home/user/ds{i}/file.txt", avus=[("dv.publication", status)]
+            )
+        # a worker still holds ds1
+        other = Lease(session.collections.get("/zone/home/user/ds1"), "other")
+        self.assertTrue(other.acquire())
+        process = mock.Mock()
+        self.assertEqual(worker.work(session, process, "w"), ["/zone/home/user/ds0"])
+        self.assertEqual(process.call_args.args[0], "/zone/home/user/ds0")
+
+    def test_pool(self):
+        session = FakeSession()
+        for i in range(6):
+            session.add_object(
+                f"/zone/home/user/ds/file{i}.txt",
+                1000,
+                avus=[("dv.publication", "initiated")],
+            )
+        with self.assertRaises(ValueError):
+            worker.work(SessionPool(size=1, factory=lambda: session, check=print), None)
+        pool = SessionPool(size=2, factory=lambda: session, check=print)
+        with FakeDataverse() as dv:
+            pid = dv.add_dataset()
+
+            def process(path, objs, lease):
+                # the uploads check out the other session of the pool
+                deposit.upload_objects(
+                    objs,
+                    "direct-batch",
+                    NativeApi(dv.url),
+                    pid,
+                    {},
+                    {},
+                    session=pool,
+                    policy="fifo",
+                )
+
+            thread = threading.Thread(target=worker.work, args=(pool, process, "w"))
+            thread.start()
+            thread.join(10)
+            self.assertFalse(thread.is_alive())
+            self.assertEqual(len(dv.files(pid)), 6)
+
+    def test_claim(self):
+        session = FakeSession()
+        objs = [session.add_object(f"/zone/home/user/ds{i}/file.txt") for i in range(3)]
+        other = Lease(session.collections.get("/zone/home/user/ds1"), "other")
+        self.assertTrue(other.acquire())
+        claimed, leases = worker.claim(session, objs, "me")
+        self.assertEqual(claimed, [objs[0], objs[2]])
+        # the leases block the workers
+        self.assertEqual(worker.work(session, mock.Mock(), "w"), [])
+        for lease in leases:
+            lease.release()
+        self.assertEqual(
+            session.collections.get("/zone/home/user/ds0").metadata.get_all(
+                worker.atr_lease
+            ),
+            [],
+        )
+
+
+class TestDeposit(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(
+            capabilities, "CACHE_PATH", os.path.join(tmp.name, "capabilities.json")
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_deposit_group(self):
+        session = FakeSession()
+        objs = [
+            session.add_object(
+                f"/zone/home/user/ds/file{i}.txt",
+                1000,
+                avus=[("dv.publication", "initiated")],
+            )
+            for i in range(3)
+        ]
+        md = avu2json.get_template(
+            os.path.join(resources, "template_Demo.json"), metadata
+        )
+        with FakeDataverse() as dv:
+            deposited = worker.deposit_group(
+                objs, NativeApi(dv.url, "token"), DemoDataset(), "token", md, session
+            )
+            [pid] = dv.datasets
+            self.assertEqual(len(dv.files(pid)), 3)
+        self.assertEqual(deposited, objs)
+        for obj in objs:
+            self.assertEqual(obj.metadata.get_one("dv.publication").value, "deposited")
+            self.assertEqual(obj.metadata.get_one("dv.ds.DOI").value, pid)
+
+    def test_plan(self):
+        session = FakeSession()
+        objs = [
+            session.add_object(
+                f"/zone/home/user/ds/file{i}.txt",
+                size,
+                avus=[("dv.publication", "initiated")],
+            )
+            for i, size in enumerate([1000, 5000, 1000])
+        ]
+        md = avu2json.get_template(
+            os.path.join(resources, "template_Demo.json"), metadata
+        )
+        settings = {":MaxFileUploadSizeInBytes": 2000}
+        with FakeDataverse(settings=settings) as dv:
+            deposited = worker.deposit_group(
+                objs, NativeApi(dv.url, "token"), DemoDataset(), "token", md, session
+            )
+            [pid] = dv.datasets
+            self.assertEqual(len(dv.files(pid)), 2)
+        self.assertEqual(deposited, [objs[0], objs[2]])
+        self.assertEqual(objs[1].metadata.get_one("dv.publication").value, "initiated")
+        self.assertEqual(objs[1].metadata.get_all("dv.ds.DOI"), [])
+
+    def test_resume(self):
+        session = FakeSession()
+        objs = [
+            session.add_object(
+                f"/zone/home/user/ds/file{i}.txt",
+                1000,
+                avus=[("dv.publication", "processed")],
+            )
+            for i in range(3)
+        ]
+        with FakeDataverse() as dv:
+            old = dv.add_dataset()
+            pid = dv.add_dataset()
+            for obj in objs:
+                obj.metadata.add("dv.ds.DOI", old)
+                obj.metadata.add("dv.ds.DOI", pid)
+            # registered before the worker stopped
+            dv.register(
+                pid,
+                {"fileName": objs[0].name, "storageIdentifier": "s3://b:1"},
+                objs[0].size,
+                {"type": "SHA-256", "value": objs[0].checksum[5:]},
+            )
+            self.assertEqual([worker.interrupted_dataset(x) for x in objs], [pid] * 3)
+            deposited = worker.deposit_group(
+                objs,
+                NativeApi(dv.url, "token"),
+                DemoDataset(),
+                "token",
+                None,
+                session,
+                dsPID=pid,
+            )
+            self.assertEqual(len(dv.datasets), 2)
+            self.assertEqual(len(dv.files(pid)), 3)
+        self.assertEqual(deposited, objs)
+        for obj in objs:
+            self.assertEqual(obj.metadata.get_one("dv.publication").value, "deposited")
+            self.assertIsNone(worker.interrupted_dataset(obj))
+
+    def test_stop_when_lease_is_lost(self):
+        session = FakeSession()
+        objs = [
+            session.add_object(
+                f"/zone/home/user/ds/file{i}.txt",
+                1000,
+                avus=[("dv.publication", "initiated")],
+            )
+            for i in range(3)
+        ]
+        lease = Lease(session.collections.get("/zone/home/user/ds"), "w")
+        self.assertTrue(lease.acquire())
+        md = avu2json.get_template(
+            os.path.join(resources, "template_Demo.json"), metadata
+        )
+        transfer_direct = deposit.transfer_direct
+
+        def transfer(*args, **kwargs):
+            # the lease is lost during the transfer of the first object
+            lease.lost.set()
+            return transfer_direct(*args, **kwargs)
+
+        with FakeDataverse() as dv, mock.patch.object(
+            deposit, "transfer_direct", transfer
+        ):
+            deposited = worker.deposit_group(
+                objs,
+                NativeApi(dv.url, "token"),
+                DemoDataset(),
+                "token",
+                md,
+                session,
+                lease=lease,
+            )
+            [pid] = dv.datasets
+            self.assertEqual(len(dv.files(pid)), 1)
+        self.assertEqual(deposited, objs[:1])
+        for obj in objs[1:]:
+            self.assertEqual(obj.metadata.get_one("dv.publication").value, "processed")
+        # nothing is done once the lease is lost
+        self.assertEqual(
+            worker.deposit_group(objs[1:], None, None, "token", md, lease=lease), []
+        )
+
+    def test_process_skips_unknown_installation(self):
+        session = FakeSession()
+        obj = session.add_object(
+            "/zone/home/user/ds/file.txt", avus=[("dv.publication", "initiated")]
+        )
+        process = worker.make_process(session, {"Demo": "token"})
+        with mock.patch.object(worker, "deposit_group") as deposit_group:
+            process("/zone/home/user/ds", [obj])
+        deposit_group.assert_not_called()
+        self.assertEqual(obj.metadata.get_one("dv.publication").value, "initiated")